@@ -9,7 +9,11 @@ from alembic import context
 import os, sys
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from app.db.base import Base
-from app.models.core import *  # importa tus modelos
+import app.models  # importa tus modelos
+# Modelos que no se re-exportan en app.models
+from app.models import (  # noqa: F401
+    chat, background_job, user_topic_objective_stats, resource_why_text, question_error_analysis
+)
 
 
 # this is the Alembic Config object, which provides
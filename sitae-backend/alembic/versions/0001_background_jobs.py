@@ -0,0 +1,71 @@
+"""background_job y estado de ingesta de course_document
+
+El esquema base (cursos, quizzes, conversation, course_document, ...) ya
+existe en la BD; las revisiones solo agregan lo nuevo.
+
+Revision ID: 0001_background_jobs
+Revises:
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0001_background_jobs"
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "background_job",
+        sa.Column("id", postgresql.UUID(as_uuid=False), primary_key=True,
+                  server_default=sa.text("gen_random_uuid()")),
+        sa.Column("kind", sa.Text(), nullable=False),
+        sa.Column("payload", postgresql.JSONB(), nullable=False),
+        sa.Column("status", sa.Text(), nullable=False, server_default="queued"),
+        sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("max_attempts", sa.Integer(), nullable=False, server_default="3"),
+        sa.Column("run_after", sa.TIMESTAMP(timezone=True), server_default=sa.func.now()),
+        sa.Column("locked_by", sa.Text()),
+        sa.Column("locked_at", sa.TIMESTAMP(timezone=True)),
+        sa.Column("last_error", sa.Text()),
+        sa.Column("created_at", sa.TIMESTAMP(timezone=True), server_default=sa.func.now()),
+        sa.Column("finished_at", sa.TIMESTAMP(timezone=True)),
+        schema="public",
+    )
+    op.create_index("ix_background_job_claim", "background_job", ["status", "run_after"], schema="public")
+
+    op.add_column("course_document", sa.Column("status", sa.Text(), server_default="queued"), schema="public")
+    op.add_column("course_document", sa.Column("progress", sa.Integer(), server_default="0"), schema="public")
+    op.add_column("course_document", sa.Column("error", sa.Text()), schema="public")
+
+    # Documentos anteriores a la cola: ya procesados, links registrados, o
+    # interrumpidos (la BackgroundTask murió con el proceso y nadie los reencola)
+    op.execute("""
+        UPDATE public.course_document
+        SET status = 'completed', progress = 100
+        WHERE processed_at IS NOT NULL OR file_path IS NULL
+    """)
+    op.execute("""
+        UPDATE public.course_document
+        SET status = 'failed',
+            error = 'Procesamiento interrumpido antes de la cola de trabajos; vuelve a subir el documento'
+        WHERE processed_at IS NULL AND file_path IS NOT NULL
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("course_document", "error", schema="public")
+    op.drop_column("course_document", "progress", schema="public")
+    op.drop_column("course_document", "status", schema="public")
+    op.drop_index("ix_background_job_claim", table_name="background_job", schema="public")
+    op.drop_table("background_job", schema="public")
@@ -0,0 +1,42 @@
+"""user_topic_objective_stats: proyección de áreas débiles del chat
+
+Se llena al calificar intentos; para el historial existente correr
+`python -m app.workers.backfill_weak_areas` después de migrar.
+
+Revision ID: 0002_weak_area_stats
+Revises: 0001_background_jobs
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002_weak_area_stats"
+down_revision: Union[str, Sequence[str], None] = "0001_background_jobs"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "user_topic_objective_stats",
+        sa.Column("user_id", postgresql.UUID(as_uuid=False), sa.ForeignKey("public.user.id"), primary_key=True),
+        sa.Column("course_id", postgresql.UUID(as_uuid=False), sa.ForeignKey("public.course.id"), primary_key=True),
+        sa.Column("topic_objective_id", postgresql.UUID(as_uuid=False),
+                  sa.ForeignKey("public.topic_objective.id"), primary_key=True),
+        sa.Column("fail_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("window_attempts", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("updated_at", sa.TIMESTAMP(timezone=True), server_default=sa.func.now()),
+        schema="public",
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("user_topic_objective_stats", schema="public")
@@ -0,0 +1,33 @@
+"""índice del historial de chat paginado por cursor
+
+Revision ID: 0003_conversation_history_idx
+Revises: 0002_weak_area_stats
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003_conversation_history_idx"
+down_revision: Union[str, Sequence[str], None] = "0002_weak_area_stats"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # WHERE user_id, course_id ORDER BY created_at DESC, id DESC
+    op.create_index(
+        "ix_conversation_user_course_created",
+        "conversation",
+        ["user_id", "course_id", "created_at", "id"],
+        schema="public",
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_conversation_user_course_created", table_name="conversation", schema="public")
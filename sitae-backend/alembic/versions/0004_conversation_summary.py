@@ -0,0 +1,39 @@
+"""conversation_summary: memoria resumida del chat por usuario y curso
+
+Revision ID: 0004_conversation_summary
+Revises: 0003_conversation_history_idx
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004_conversation_summary"
+down_revision: Union[str, Sequence[str], None] = "0003_conversation_history_idx"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "conversation_summary",
+        sa.Column("user_id", postgresql.UUID(as_uuid=False), sa.ForeignKey("public.user.id"), primary_key=True),
+        sa.Column("course_id", postgresql.UUID(as_uuid=False), sa.ForeignKey("public.course.id"), primary_key=True),
+        sa.Column("summary", sa.Text(), nullable=False, server_default=""),
+        sa.Column("turns_covered", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("covered_until_at", sa.TIMESTAMP(timezone=True)),
+        sa.Column("covered_until_id", postgresql.UUID(as_uuid=False)),
+        sa.Column("updated_at", sa.TIMESTAMP(timezone=True), server_default=sa.func.now()),
+        schema="public",
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("conversation_summary", schema="public")
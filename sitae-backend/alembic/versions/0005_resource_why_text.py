@@ -0,0 +1,39 @@
+"""resource_why_text: caché persistente de why_text por bucket de perfil
+
+Revision ID: 0005_resource_why_text
+Revises: 0004_conversation_summary
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0005_resource_why_text"
+down_revision: Union[str, Sequence[str], None] = "0004_conversation_summary"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "resource_why_text",
+        sa.Column("resource_id", postgresql.UUID(as_uuid=False),
+                  sa.ForeignKey("public.resource.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("resource_version", sa.Text(), primary_key=True),
+        sa.Column("profile_bucket", sa.Text(), primary_key=True),
+        sa.Column("model", sa.Text(), primary_key=True),
+        sa.Column("why_text", sa.Text(), nullable=False),
+        sa.Column("created_at", sa.TIMESTAMP(timezone=True), server_default=sa.func.now(), nullable=False),
+        schema="public",
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("resource_why_text", schema="public")
@@ -0,0 +1,40 @@
+"""question_error_analysis: caché persistente de análisis de error
+
+Revision ID: 0006_question_error_analysis
+Revises: 0005_resource_why_text
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0006_question_error_analysis"
+down_revision: Union[str, Sequence[str], None] = "0005_resource_why_text"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "question_error_analysis",
+        sa.Column("question_id", postgresql.UUID(as_uuid=False),
+                  sa.ForeignKey("public.question.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("selected_option_id", sa.Text(), primary_key=True),  # '' = sin responder
+        sa.Column("prereq_level", sa.Text(), primary_key=True),
+        sa.Column("item_version", sa.Text(), primary_key=True),
+        sa.Column("model", sa.Text(), primary_key=True),
+        sa.Column("analysis", sa.Text(), nullable=False),
+        sa.Column("created_at", sa.TIMESTAMP(timezone=True), server_default=sa.func.now(), nullable=False),
+        schema="public",
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("question_error_analysis", schema="public")
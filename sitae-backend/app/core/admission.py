@@ -0,0 +1,341 @@
+# app/core/admission.py
+"""
+Control de admisión para endpoints que llaman al LLM (chat y
+finish-personalized). Antes de empezar el trabajo, cada request:
+
+1. Toma una ficha del token bucket del usuario (ADMISSION_USER_RATE_PER_MINUTE,
+   ráfaga ADMISSION_USER_BURST). Sin fichas -> 429 inmediato.
+2. Toma uno de los ADMISSION_MAX_CONCURRENT slots globales. Si no hay, espera
+   en una cola acotada (ADMISSION_MAX_QUEUE) hasta ADMISSION_QUEUE_TIMEOUT_SECONDS.
+   Cola llena o espera vencida -> 429.
+
+Los 429 llevan Retry-After: lo que falta para la próxima ficha, o una
+estimación según la duración media de los requests admitidos.
+
+Backends:
+- En memoria: límites por proceso (despliegues de un solo worker).
+- Redis (ADMISSION_REDIS_URL): límites compartidos entre workers de uvicorn.
+  Los slots son "leases" con vencimiento, así un worker caído no los retiene
+  para siempre. Si Redis falla se usa el backend en memoria de ese proceso.
+"""
+import asyncio
+import logging
+import math
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, Optional
+
+from fastapi import Depends, HTTPException, status
+
+from app.core.config import settings
+from app.core.security import get_current_user
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL_SECONDS = 0.05
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@dataclass(frozen=True)
+class Lease:
+    id: str
+    backend: "MemoryAdmissionBackend | RedisAdmissionBackend"
+    started_at: float
+
+
+class MemoryAdmissionBackend:
+    name = "memory"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, tuple] = {}  # user -> (fichas, último cálculo)
+        self._slots: set = set()
+        self._waiting = 0
+
+    async def take_token(self, key: str, rate: float, burst: int) -> float:
+        """0 si hay ficha; si no, segundos hasta la próxima"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > 10_000:
+                # Buckets llenos equivalen a no tener entrada
+                self._buckets = {
+                    k: v for k, v in self._buckets.items()
+                    if v[0] + (now - v[1]) * rate < burst
+                }
+            return wait
+
+    async def try_acquire(self, lease_id: str, limit: int, lease_seconds: float) -> bool:
+        with self._lock:
+            if len(self._slots) >= limit:
+                return False
+            self._slots.add(lease_id)
+            return True
+
+    async def release(self, lease_id: str) -> None:
+        with self._lock:
+            self._slots.discard(lease_id)
+
+    async def join_queue(self, waiter_id: str, max_queue: int, timeout: float) -> bool:
+        with self._lock:
+            if self._waiting >= max_queue:
+                return False
+            self._waiting += 1
+            return True
+
+    async def leave_queue(self, waiter_id: str) -> None:
+        with self._lock:
+            self._waiting -= 1
+
+    async def depth(self) -> Dict[str, int]:
+        with self._lock:
+            return {"in_flight": len(self._slots), "queued": self._waiting}
+
+
+_TOKEN_BUCKET_LUA = """
+local data = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local tokens = tonumber(data[1]) or burst
+local ts = tonumber(data[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+# Conjunto ordenado por vencimiento: sirve para slots y para la cola
+_BOUNDED_ZADD_LUA = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[2]) then return 0 end
+redis.call('ZADD', KEYS[1], ARGV[3], ARGV[4])
+return 1
+"""
+
+
+class RedisAdmissionBackend:
+    name = "redis"
+
+    def __init__(self, url: str):
+        import redis.asyncio as aioredis  # dependencia opcional: solo si hay ADMISSION_REDIS_URL
+
+        self.client = aioredis.Redis.from_url(url, socket_timeout=0.2, socket_connect_timeout=0.2)
+        self._bucket = self.client.register_script(_TOKEN_BUCKET_LUA)
+        self._bounded_zadd = self.client.register_script(_BOUNDED_ZADD_LUA)
+        self._slots_key = "sitae:admission:slots"
+        self._queue_key = "sitae:admission:queue"
+
+    async def take_token(self, key: str, rate: float, burst: int) -> float:
+        wait = await self._bucket(keys=[f"sitae:admission:user:{key}"], args=[rate, burst, time.time()])
+        return float(wait)
+
+    async def try_acquire(self, lease_id: str, limit: int, lease_seconds: float) -> bool:
+        now = time.time()
+        return bool(await self._bounded_zadd(
+            keys=[self._slots_key], args=[now, limit, now + lease_seconds, lease_id]
+        ))
+
+    async def release(self, lease_id: str) -> None:
+        await self.client.zrem(self._slots_key, lease_id)
+
+    async def join_queue(self, waiter_id: str, max_queue: int, timeout: float) -> bool:
+        now = time.time()
+        return bool(await self._bounded_zadd(
+            keys=[self._queue_key], args=[now, max_queue, now + timeout + 1, waiter_id]
+        ))
+
+    async def leave_queue(self, waiter_id: str) -> None:
+        await self.client.zrem(self._queue_key, waiter_id)
+
+    async def depth(self) -> Dict[str, int]:
+        now = time.time()
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.zcount(self._slots_key, now, "+inf")
+            pipe.zcount(self._queue_key, now, "+inf")
+            in_flight, queued = await pipe.execute()
+        return {"in_flight": int(in_flight), "queued": int(queued)}
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_concurrent: int = 16,
+        max_queue: int = 64,
+        queue_timeout: float = 10.0,
+        user_rate_per_minute: float = 6.0,
+        user_burst: int = 3,
+        lease_seconds: float = 180.0,
+        shared: Optional[RedisAdmissionBackend] = None,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.user_rate = user_rate_per_minute / 60.0
+        self.user_burst = user_burst
+        self.lease_seconds = lease_seconds
+        self.local = MemoryAdmissionBackend()
+        self.shared = shared
+        # Métricas del proceso
+        self.admitted = self.queued_total = 0
+        self.rejected = {"rate_limited": 0, "queue_full": 0, "queue_timeout": 0}
+        self.shared_errors = 0
+        self.avg_wait = 0.0
+        self.avg_duration = 1.0
+
+    async def _call(self, method: str, *args):
+        """Usa el backend compartido; si falla, el local (límites por proceso)"""
+        if self.shared is not None:
+            try:
+                return self.shared, await getattr(self.shared, method)(*args)
+            except Exception as e:
+                self.shared_errors += 1
+                if self.shared_errors == 1 or self.shared_errors % 100 == 0:
+                    logger.warning(f"⚠️ Admisión compartida no disponible, se usa la local: {e}")
+        return self.local, await getattr(self.local, method)(*args)
+
+    def _retry_after(self, queued: int = 0) -> int:
+        """Estimación: tiempo en vaciar la cola actual a la duración media de un request"""
+        return max(1, math.ceil(self.avg_duration * (queued + 1) / self.max_concurrent))
+
+    def _reject(self, reason: str, retry_after: int) -> AdmissionRejected:
+        self.rejected[reason] += 1
+        return AdmissionRejected(reason, retry_after)
+
+    async def acquire(self, user_id: str) -> Lease:
+        _, wait = await self._call("take_token", user_id, self.user_rate, self.user_burst)
+        if wait > 0:
+            raise self._reject("rate_limited", max(1, math.ceil(wait)))
+
+        lease_id = uuid.uuid4().hex
+        started = time.monotonic()
+        backend, ok = await self._call("try_acquire", lease_id, self.max_concurrent, self.lease_seconds)
+        if not ok:
+            queue_backend, joined = await self._call("join_queue", lease_id, self.max_queue, self.queue_timeout)
+            if not joined:
+                raise self._reject("queue_full", self._retry_after(self.max_queue))
+            self.queued_total += 1
+            try:
+                deadline = started + self.queue_timeout
+                while not ok:
+                    if time.monotonic() >= deadline:
+                        depth = await self.depth()
+                        raise self._reject("queue_timeout", self._retry_after(depth["queued"]))
+                    await asyncio.sleep(POLL_INTERVAL_SECONDS)
+                    backend, ok = await self._call(
+                        "try_acquire", lease_id, self.max_concurrent, self.lease_seconds
+                    )
+            finally:
+                try:
+                    await queue_backend.leave_queue(lease_id)
+                except Exception:
+                    pass  # en Redis la entrada vence sola
+
+        now = time.monotonic()
+        self.admitted += 1
+        self.avg_wait = 0.9 * self.avg_wait + 0.1 * (now - started)
+        return Lease(id=lease_id, backend=backend, started_at=now)
+
+    async def release(self, lease: Lease) -> None:
+        self.avg_duration = 0.9 * self.avg_duration + 0.1 * (time.monotonic() - lease.started_at)
+        try:
+            await lease.backend.release(lease.id)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo liberar el slot {lease.id} (vence solo): {e}")
+
+    async def depth(self) -> Dict[str, int]:
+        _, depth = await self._call("depth")
+        return depth
+
+    async def stats(self) -> Dict:
+        depth = await self.depth()
+        return {
+            "backend": self.shared.name if self.shared is not None else self.local.name,
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            **depth,
+            "admitted": self.admitted,
+            "queued_total": self.queued_total,
+            "rejected": dict(self.rejected),
+            "avg_wait_ms": round(self.avg_wait * 1000, 1),
+            "avg_duration_ms": round(self.avg_duration * 1000, 1),
+            "shared_errors": self.shared_errors,
+        }
+
+
+_controller: Optional[AdmissionController] = None
+_controller_lock = threading.Lock()
+
+
+def get_admission_controller() -> Optional[AdmissionController]:
+    """Controlador del proceso, o None si ADMISSION_ENABLED=false"""
+    global _controller
+    if not settings.ADMISSION_ENABLED:
+        return None
+    with _controller_lock:
+        if _controller is None:
+            shared = None
+            if settings.ADMISSION_REDIS_URL:
+                try:
+                    shared = RedisAdmissionBackend(settings.ADMISSION_REDIS_URL)
+                except Exception as e:
+                    logger.error(f"❌ Error inicializando Redis para admisión: {e}")
+            _controller = AdmissionController(
+                max_concurrent=settings.ADMISSION_MAX_CONCURRENT,
+                max_queue=settings.ADMISSION_MAX_QUEUE,
+                queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT_SECONDS,
+                user_rate_per_minute=settings.ADMISSION_USER_RATE_PER_MINUTE,
+                user_burst=settings.ADMISSION_USER_BURST,
+                lease_seconds=settings.ADMISSION_LEASE_SECONDS,
+                shared=shared,
+            )
+        return _controller
+
+
+async def close_admission_controller() -> None:
+    if _controller is not None and _controller.shared is not None:
+        await _controller.shared.aclose()
+
+
+async def llm_admission(current_user: dict = Depends(get_current_user)) -> AsyncIterator[None]:
+    """
+    Dependencia para endpoints que llaman al LLM. El slot se libera al
+    terminar la respuesta (en streaming, al cerrar el stream).
+    """
+    controller = get_admission_controller()
+    if controller is None:
+        yield
+        return
+    try:
+        lease = await controller.acquire(current_user["id"])
+    except AdmissionRejected as e:
+        logger.warning(f"🚦 Request rechazado ({e.reason}) para {current_user['id']}; Retry-After={e.retry_after}s")
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Demasiadas solicitudes al asistente, intenta de nuevo en unos segundos",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    try:
+        yield
+    finally:
+        await controller.release(lease)
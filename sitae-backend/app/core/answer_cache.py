@@ -0,0 +1,157 @@
+# app/core/answer_cache.py
+"""
+Caché semántica de respuestas del chat, por curso.
+
+Clave: (course_id, bucket de perfil) + embedding normalizado de la pregunta.
+Una pregunta nueva reutiliza la respuesta de otra si la similitud coseno
+supera el umbral (ANSWER_CACHE_SIMILARITY). El bucket (p.ej. prereq_level)
+evita servir una respuesta pensada para otro nivel.
+
+Invalidación:
+- Cada entrada guarda la "versión" del material del curso (documentos
+  completados + último processed_at). Si cambia (subida, reemplazo o borrado
+  de documentos, incluso hecho por el job worker en otro proceso), las
+  entradas del curso se descartan en la siguiente consulta.
+- TTL por entrada y máximo de entradas por curso (se expulsa la más antigua).
+
+Vive en memoria de cada proceso de la API.
+"""
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.cache import register_cache
+from app.core.config import settings
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    response: str
+    sources: List[Dict[str, Any]]
+    created_at: float = field(default_factory=time.monotonic)
+    hits: int = 0
+
+
+class _CourseEntries:
+    def __init__(self, version: str):
+        self.version = version
+        self.answers: List[CachedAnswer] = []
+        self.buckets: List[str] = []
+        self.vectors = np.empty((0, 0), dtype=np.float32)
+
+    def drop(self, keep: np.ndarray) -> None:
+        self.answers = [a for a, k in zip(self.answers, keep) if k]
+        self.buckets = [b for b, k in zip(self.buckets, keep) if k]
+        self.vectors = self.vectors[keep]
+
+
+def _normalize(embedding) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticAnswerCache:
+    def __init__(self, threshold: float = 0.95, ttl: float = 6 * 3600, max_per_course: int = 500):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_per_course = max_per_course
+        self._courses: Dict[str, _CourseEntries] = {}
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def _entries(self, course_id: str, version: str) -> _CourseEntries:
+        entries = self._courses.get(course_id)
+        if entries is not None and entries.version != version:
+            self.invalidations += 1
+            entries = None
+        if entries is None:
+            entries = self._courses[course_id] = _CourseEntries(version)
+        return entries
+
+    def _expire(self, entries: _CourseEntries) -> None:
+        now = time.monotonic()
+        keep = np.array([now - a.created_at < self.ttl for a in entries.answers], dtype=bool)
+        if len(keep) and not keep.all():
+            self.evictions += int((~keep).sum())
+            entries.drop(keep)
+
+    def lookup(
+        self, course_id: str, bucket: str, embedding, version: str
+    ) -> Optional[Tuple[CachedAnswer, float]]:
+        """Devuelve (respuesta, similitud) si hay una pregunta equivalente en el mismo bucket"""
+        query = _normalize(embedding)
+        with self._lock:
+            entries = self._entries(course_id, version)
+            self._expire(entries)
+            if not entries.answers or entries.vectors.shape[1] != query.shape[0]:
+                self.misses += 1
+                return None
+            scores = entries.vectors @ query
+            scores[[b != bucket for b in entries.buckets]] = -1.0
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            answer = entries.answers[best]
+            answer.hits += 1
+            self.hits += 1
+            return answer, float(scores[best])
+
+    def store(
+        self, course_id: str, bucket: str, embedding, version: str, answer: CachedAnswer
+    ) -> None:
+        vector = _normalize(embedding)[None, :]
+        with self._lock:
+            entries = self._entries(course_id, version)
+            if entries.vectors.size and entries.vectors.shape[1] != vector.shape[1]:
+                entries = self._courses[course_id] = _CourseEntries(version)  # cambió el modelo
+            if len(entries.answers) >= self.max_per_course:
+                keep = np.ones(len(entries.answers), dtype=bool)
+                keep[0] = False  # la más antigua
+                entries.drop(keep)
+                self.evictions += 1
+            entries.answers.append(answer)
+            entries.buckets.append(bucket)
+            entries.vectors = np.vstack([entries.vectors, vector]) if entries.vectors.size else vector
+
+    def invalidate_course(self, course_id: str) -> None:
+        with self._lock:
+            if self._courses.pop(course_id, None) is not None:
+                self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "courses": len(self._courses),
+                "entries": sum(len(e.answers) for e in self._courses.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+_answer_cache: Optional[SemanticAnswerCache] = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> Optional[SemanticAnswerCache]:
+    """Caché del proceso, o None si ANSWER_CACHE_ENABLED=false"""
+    global _answer_cache
+    if not settings.ANSWER_CACHE_ENABLED:
+        return None
+    with _answer_cache_lock:
+        if _answer_cache is None:
+            _answer_cache = register_cache("semantic_answers", SemanticAnswerCache(
+                threshold=settings.ANSWER_CACHE_SIMILARITY,
+                ttl=settings.ANSWER_CACHE_TTL,
+                max_per_course=settings.ANSWER_CACHE_MAX_PER_COURSE,
+            ))
+        return _answer_cache
@@ -0,0 +1,182 @@
+# app/core/cache.py
+"""
+Caché en memoria LRU + TTL, thread-safe y con métricas.
+
+Opcionalmente usa un backend compartido (Redis, settings.CACHE_REDIS_URL) como
+segundo nivel: así todos los workers de uvicorn aprovechan lo que otro ya
+calculó. Si Redis falla, la caché sigue funcionando solo en memoria.
+
+Las cachés se registran por nombre para exponer sus métricas
+(GET /api/metrics/caches).
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class RedisBackend:
+    """Segundo nivel compartido. Los valores se serializan con `dumps`/`loads` (bytes)"""
+
+    def __init__(
+        self,
+        url: str,
+        namespace: str,
+        dumps: Callable[[Any], bytes],
+        loads: Callable[[bytes], Any],
+    ):
+        import redis  # dependencia opcional: solo si hay CACHE_REDIS_URL
+
+        self.client = redis.Redis.from_url(url, socket_timeout=0.2, socket_connect_timeout=0.2)
+        self.namespace = namespace
+        self.dumps = dumps
+        self.loads = loads
+        self.errors = 0
+
+    def _key(self, key: Hashable) -> str:
+        return f"sitae:{self.namespace}:{key}"
+
+    def get(self, key: Hashable) -> Any:
+        try:
+            raw = self.client.get(self._key(key))
+        except Exception as e:
+            self._on_error(e)
+            return _MISSING
+        return _MISSING if raw is None else self.loads(raw)
+
+    def set(self, key: Hashable, value: Any, ttl: float) -> None:
+        try:
+            self.client.set(self._key(key), self.dumps(value), ex=max(1, int(ttl)))
+        except Exception as e:
+            self._on_error(e)
+
+    def delete(self, key: Hashable) -> None:
+        try:
+            self.client.delete(self._key(key))
+        except Exception as e:
+            self._on_error(e)
+
+    def _on_error(self, error: Exception) -> None:
+        self.errors += 1
+        if self.errors == 1 or self.errors % 100 == 0:
+            logger.warning(f"⚠️ Caché compartida no disponible ({self.namespace}): {error}")
+
+
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float, shared: Optional[RedisBackend] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.shared = shared
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                expires_at, value = item
+                if expires_at > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+
+        if self.shared is not None:
+            value = self.shared.get(key)
+            if value is not _MISSING:
+                self._store(key, value)
+                with self._lock:
+                    self.shared_hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return default
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._store(key, value)
+        if self.shared is not None:
+            self.shared.set(key, value, self.ttl)
+
+    def _store(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        """Invalida la clave en memoria y en el backend compartido"""
+        with self._lock:
+            self._data.pop(key, None)
+        if self.shared is not None:
+            self.shared.delete(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.shared_hits) / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "shared_backend": "redis" if self.shared is not None else None,
+            }
+
+
+# =========================
+#  Registro de cachés
+# =========================
+
+_registry: Dict[str, Any] = {}
+
+
+def register_cache(name: str, cache: Any) -> Any:
+    """Registra una caché (cualquier objeto con .stats()) para exponer sus métricas"""
+    _registry[name] = cache
+    return cache
+
+
+def cache_stats() -> Dict[str, Dict]:
+    return {name: cache.stats() for name, cache in _registry.items()}
+
+
+def make_cache(
+    name: str,
+    maxsize: int,
+    ttl: float,
+    dumps: Optional[Callable[[Any], bytes]] = None,
+    loads: Optional[Callable[[bytes], Any]] = None,
+) -> TTLCache:
+    """
+    Crea y registra una TTLCache. Si hay CACHE_REDIS_URL y se pasan
+    `dumps`/`loads`, usa Redis como segundo nivel compartido.
+    """
+    shared = None
+    if settings.CACHE_REDIS_URL and dumps and loads:
+        try:
+            shared = RedisBackend(settings.CACHE_REDIS_URL, name, dumps, loads)
+        except Exception as e:
+            logger.error(f"❌ Error inicializando Redis para caché {name}: {e}")
+    return register_cache(name, TTLCache(maxsize=maxsize, ttl=ttl, shared=shared))
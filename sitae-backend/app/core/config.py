@@ -7,6 +7,7 @@ class Settings(BaseSettings):
     OPENAI_API_KEY: str | None = None
     EMBEDDING_MODEL: str | None = "text-embedding-3-small"
     CHAT_MODEL: str | None = "gpt-4o-mini"
+    OPENAI_BASE_URL: str | None = None  # p.ej. un endpoint compatible o un fake local
 
     # Google OAuth
     GOOGLE_CLIENT_ID: str
@@ -27,6 +28,100 @@ class Settings(BaseSettings):
     CHROMA_PATH: str = str((Path(__file__).resolve().parents[2] / "chroma_data"))
     DOCUMENTS_PATH: str = str((Path(__file__).resolve().parents[2] / "documents_data"))
 
+    # Vector store: "chroma" (embebido en CHROMA_PATH) o "pgvector" (la misma BD de la app)
+    VECTOR_STORE_BACKEND: str = "chroma"
+    PGVECTOR_DIMENSIONS: int = 1536  # dimensión de EMBEDDING_MODEL
+    PGVECTOR_INDEX: str = "hnsw"     # "hnsw" o "ivfflat"
+    PGVECTOR_EF_SEARCH: int = 100
+    PGVECTOR_IVFFLAT_PROBES: int = 10
+    # El índice es uno solo para todas las colecciones: con pgvector >= 0.8 el escaneo
+    # iterativo sigue buscando hasta juntar k vecinos del curso (o este tope de tuplas)
+    PGVECTOR_ITERATIVE_SCAN: bool = True
+    PGVECTOR_MAX_SCAN_TUPLES: int = 100000
+
+    # Ingesta de documentos
+    EMBEDDING_BATCH_SIZE: int = 64  # chunks por lote de embeddings / escritura en ChromaDB
+
+    # Proveedor de embeddings: "openai" (EMBEDDING_MODEL) o "local" (hashing NumPy, sin red)
+    # Con pgvector, PGVECTOR_DIMENSIONS debe coincidir con la dimensión del proveedor
+    EMBEDDING_PROVIDER: str = "openai"
+    LOCAL_EMBEDDING_DIMENSIONS: int = 384
+
+    # Llamadas de embeddings (proveedor openai)
+    EMBEDDING_MAX_BATCH_INPUTS: int = 16       # textos por request
+    EMBEDDING_MAX_BATCH_TOKENS: int = 100_000  # tokens por request (límite del proveedor: 300k)
+    EMBEDDING_MAX_CONCURRENCY: int = 4
+    EMBEDDING_RPM: int = 3_000                 # requests por minuto
+    EMBEDDING_TPM: int = 1_000_000             # tokens por minuto
+    EMBEDDING_MAX_RETRIES: int = 5
+
+    # Caché de embeddings (SQLite, clave = modelo + hash del chunk)
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_PATH: str = str((Path(__file__).resolve().parents[2] / "embedding_cache" / "embeddings.sqlite3"))
+    EMBEDDING_CACHE_MAX_MB: float = 512
+
+    # Cola de trabajos (python -m app.workers.job_worker)
+    # Con ChromaDB local (SQLite) conviene 1 proceso por disco; escalar con un vector store servidor
+    JOB_WORKER_PROCESSES: int = 1
+    JOB_POLL_INTERVAL_SECONDS: float = 2.0
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_RETRY_BACKOFF_SECONDS: float = 30.0
+    JOB_RETRY_BACKOFF_MAX_SECONDS: float = 3600.0
+    JOB_STALE_AFTER_SECONDS: int = 1800  # 'running' sin terminar -> se asume worker caído
+    JOB_HEARTBEAT_SECONDS: float = 60.0  # renovación de locked_at de los trabajos en curso
+
+    # Gateway LLM (chat / recomendaciones / reranking)
+    LLM_TIMEOUT_SECONDS: float = 30.0        # deadline por llamada, reintentos incluidos
+    LLM_MAX_RETRIES: int = 2
+    LLM_MAX_CONCURRENCY: int = 16            # llamadas simultáneas por proceso
+    LLM_BREAKER_FAILURES: int = 5            # fallos seguidos para abrir el circuito
+    LLM_BREAKER_RESET_SECONDS: float = 30.0  # tiempo abierto antes de probar de nuevo
+    PERSONALIZATION_MAX_CONCURRENCY: int = 8  # llamadas LLM paralelas por finish-personalized
+    PERSONALIZATION_BATCH_MODE: bool = True   # análisis + why_text de todo el intento en un request JSON
+    PERSONALIZATION_BATCH_SIZE: int = 10      # preguntas por request en modo batch
+    WHY_TEXT_CACHE_ENABLED: bool = True      # why_text por (recurso, versión, bucket de perfil, modelo)
+    WHY_TEXT_PREWARM_ENABLED: bool = False   # encolar precálculo al crear/editar un recurso
+    WHY_TEXT_PREWARM_MAX_BUCKETS: int = 50
+    ERROR_ANALYSIS_CACHE_ENABLED: bool = True  # análisis por (pregunta, opción marcada, nivel, versión, modelo)
+
+    # Admisión de requests que usan el LLM (chat, finish-personalized)
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_REDIS_URL: str | None = None          # compartido entre workers; None -> por proceso
+    ADMISSION_MAX_CONCURRENT: int = 16              # requests LLM en curso (global)
+    ADMISSION_MAX_QUEUE: int = 64                   # en espera de slot; más -> 429
+    ADMISSION_QUEUE_TIMEOUT_SECONDS: float = 10.0
+    ADMISSION_USER_RATE_PER_MINUTE: float = 6.0     # token bucket por usuario
+    ADMISSION_USER_BURST: int = 3
+    ADMISSION_LEASE_SECONDS: float = 180.0          # Redis: un slot de un worker caído vence solo
+
+    # Chat: timeouts por etapa al armar el contexto (la etapa que se pasa se omite)
+    CHAT_SEARCH_TIMEOUT_SECONDS: float = 8.0    # embedding de la consulta + búsqueda vectorial
+    CHAT_DB_STAGE_TIMEOUT_SECONDS: float = 5.0  # perfil, áreas débiles, historial
+    # Presupuesto de tokens por sección del prompt (se recorta lo menos relevante)
+    CHAT_BUDGET_PROFILE_TOKENS: int = 300
+    CHAT_BUDGET_WEAK_AREAS_TOKENS: int = 300
+    CHAT_BUDGET_CONTEXT_TOKENS: int = 1500   # chunks RAG
+    CHAT_BUDGET_HISTORY_TOKENS: int = 800
+    CHAT_BUDGET_SUMMARY_TOKENS: int = 300
+
+    # Memoria de conversación: resumen acumulado + último turno en el prompt
+    CONVERSATION_SUMMARY_ENABLED: bool = True
+    CONVERSATION_SUMMARY_MODE: str = "llm"  # "llm" | "extractive" (local, sin llamadas)
+    CONVERSATION_SUMMARY_MAX_TOKENS: int = 250
+
+    # Caché semántica de respuestas del chat (por curso y prereq_level)
+    ANSWER_CACHE_ENABLED: bool = False
+    ANSWER_CACHE_SIMILARITY: float = 0.95       # similitud coseno mínima para reutilizar
+    ANSWER_CACHE_TTL: int = 6 * 3600            # segundos
+    ANSWER_CACHE_MAX_PER_COURSE: int = 500
+
+    # Cachés en memoria (Redis opcional como segundo nivel compartido entre workers)
+    CACHE_REDIS_URL: str | None = None
+    QUERY_EMBEDDING_CACHE_SIZE: int = 4096
+    QUERY_EMBEDDING_CACHE_TTL: int = 7 * 24 * 3600  # segundos
+    PROFILE_SNAPSHOT_CACHE_SIZE: int = 10_000
+    PROFILE_SNAPSHOT_CACHE_TTL: int = 15 * 60    # segundos (se invalida al guardar el perfil)
+
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
@@ -0,0 +1,313 @@
+# app/core/embedding_cache.py
+"""
+Caché persistente de embeddings direccionada por contenido.
+
+Clave = (modelo de embeddings, sha256 del texto normalizado). Un PDF corregido
+o el mismo sílabo subido a varias secciones solo paga los chunks nuevos.
+
+Los vectores se guardan como float32 en SQLite (WAL). Desalojo LRU por tamaño
+total (settings.EMBEDDING_CACHE_MAX_MB).
+
+CLI (desde sitae-backend/):
+    python -m app.core.embedding_cache stats
+    python -m app.core.embedding_cache prune [--max-mb 200] [--older-than-days 90] [--model M]
+    python -m app.core.embedding_cache warm [--course-id ID]   # desde ChromaDB, sin costo de API
+"""
+import argparse
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.core.cache import register_cache
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_TRAILING_SPACES_RE = re.compile(r"[ \t]+$", re.MULTILINE)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    model      TEXT    NOT NULL,
+    text_hash  TEXT    NOT NULL,
+    vector     BLOB    NOT NULL,
+    size       INTEGER NOT NULL,
+    last_used  REAL    NOT NULL,
+    PRIMARY KEY (model, text_hash)
+);
+CREATE INDEX IF NOT EXISTS ix_embeddings_last_used ON embeddings (last_used);
+"""
+
+
+def normalize_text(text: str) -> str:
+    """Normalización conservadora: NFC, saltos de línea y espacios al final de línea"""
+    text = unicodedata.normalize("NFC", text).replace("\r\n", "\n").replace("\r", "\n")
+    return _TRAILING_SPACES_RE.sub("", text).strip()
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def pack_vector(vector: Sequence[float]) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def unpack_vector(blob: bytes) -> List[float]:
+    values = array("f")
+    values.frombytes(blob)
+    return values.tolist()
+
+
+class EmbeddingCache:
+    def __init__(self, path: str, max_bytes: int):
+        self.path = Path(path).expanduser().resolve()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # Una conexión compartida protegida por lock (lo usan los hilos de FastAPI)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._total_bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM embeddings"
+        ).fetchone()[0]
+
+    # ---------- lectura / escritura ----------
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """Vector cacheado para cada texto (None si no está)"""
+        hashes = [text_hash(t) for t in texts]
+        found: Dict[str, bytes] = {}
+        unique = list(dict.fromkeys(hashes))
+        with self._lock:
+            # SQLite limita los parámetros por sentencia
+            for i in range(0, len(unique), 500):
+                part = unique[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings "
+                    f"WHERE model = ? AND text_hash IN ({','.join('?' * len(part))})",
+                    [model, *part],
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, h) for h in found],
+                )
+            hits = sum(1 for h in hashes if h in found)
+            self.hits += hits
+            self.misses += len(hashes) - hits
+        return [unpack_vector(found[h]) if h in found else None for h in hashes]
+
+    def put_many(self, model: str, items: Iterable[Tuple[str, Sequence[float]]]) -> None:
+        now = time.time()
+        rows = {}
+        for text, vector in items:
+            blob = pack_vector(vector)
+            h = text_hash(text)
+            rows[h] = (model, h, blob, len(blob), now)
+        if not rows:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for row in rows.values():
+                    previous = self._conn.execute(
+                        "SELECT size FROM embeddings WHERE model = ? AND text_hash = ?", row[:2]
+                    ).fetchone()
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, size, last_used) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        row,
+                    )
+                    self._total_bytes += row[3] - (previous[0] if previous else 0)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            if self._total_bytes > self.max_bytes:
+                self._evict_locked(int(self.max_bytes * 0.9))
+
+    # ---------- desalojo ----------
+
+    def _evict_locked(self, target_bytes: int) -> int:
+        """Borra las entradas menos usadas hasta quedar bajo `target_bytes`"""
+        removed = 0
+        while self._total_bytes > target_bytes:
+            rows = self._conn.execute(
+                "SELECT model, text_hash, size FROM embeddings ORDER BY last_used LIMIT 500"
+            ).fetchall()
+            if not rows:
+                break
+            batch = []
+            for model, h, size in rows:
+                batch.append((model, h))
+                self._total_bytes -= size
+                if self._total_bytes <= target_bytes:
+                    break
+            self._conn.executemany(
+                "DELETE FROM embeddings WHERE model = ? AND text_hash = ?", batch
+            )
+            removed += len(batch)
+        self.evictions += removed
+        return removed
+
+    def prune(
+        self,
+        max_bytes: Optional[int] = None,
+        older_than_days: Optional[float] = None,
+        model: Optional[str] = None,
+    ) -> int:
+        """Poda por antigüedad, por modelo y/o por tamaño; devuelve entradas borradas"""
+        removed = 0
+        with self._lock:
+            conditions, params = [], []
+            if older_than_days is not None:
+                conditions.append("last_used < ?")
+                params.append(time.time() - older_than_days * 86400)
+            if model is not None:
+                conditions.append("model = ?")
+                params.append(model)
+            if conditions:
+                removed += self._conn.execute(
+                    f"DELETE FROM embeddings WHERE {' AND '.join(conditions)}", params
+                ).rowcount
+                self._total_bytes = self._conn.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM embeddings"
+                ).fetchone()[0]
+            if max_bytes is not None:
+                removed += self._evict_locked(max_bytes)
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return removed
+
+    def stats(self) -> Dict:
+        with self._lock:
+            per_model = self._conn.execute(
+                "SELECT model, COUNT(*), COALESCE(SUM(size), 0) FROM embeddings GROUP BY model"
+            ).fetchall()
+        lookups = self.hits + self.misses
+        return {
+            "path": str(self.path),
+            "entries": sum(n for _, n, _ in per_model),
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "models": {m: {"entries": n, "bytes": b} for m, n, b in per_model},
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+@lru_cache()
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Singleton de la caché; None si está deshabilitada en settings"""
+    if not settings.EMBEDDING_CACHE_ENABLED:
+        return None
+    try:
+        cache = EmbeddingCache(
+            settings.EMBEDDING_CACHE_PATH,
+            max_bytes=int(settings.EMBEDDING_CACHE_MAX_MB * 1024 * 1024),
+        )
+        logger.info(f"✅ Caché de embeddings en: {cache.path}")
+        return register_cache("chunk_embeddings", cache)
+    except Exception as e:
+        # La caché es una optimización: sin ella se sigue llamando al proveedor
+        logger.error(f"❌ Error inicializando caché de embeddings: {e}")
+        return None
+
+
+# =========================
+#  CLI
+# =========================
+
+def _warm_from_vector_store(cache: EmbeddingCache, model: str, course_id: Optional[str]) -> int:
+    """Carga en la caché los chunks ya embebidos en ChromaDB"""
+    from app.core.vector_store import get_course_collection_name, get_vector_store
+
+    client = get_vector_store()
+    if course_id:
+        names = [get_course_collection_name(course_id)]
+    else:
+        names = [getattr(c, "name", c) for c in client.list_collections()]
+
+    loaded = 0
+    for name in names:
+        collection = client.get_collection(name=name)
+        total = collection.count()
+        for offset in range(0, total, 1000):
+            page = collection.get(
+                include=["documents", "embeddings"], limit=1000, offset=offset
+            )
+            items = [
+                (doc, emb)
+                for doc, emb in zip(page["documents"], page["embeddings"])
+                if doc
+            ]
+            cache.put_many(model, items)
+            loaded += len(items)
+        logger.info(f"📦 {name}: {total} chunks")
+    return loaded
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m app.core.embedding_cache",
+        description="Administra la caché persistente de embeddings",
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="muestra tamaño y entradas por modelo")
+
+    prune = sub.add_parser("prune", help="desaloja entradas")
+    prune.add_argument("--max-mb", type=float, help="deja la caché bajo este tamaño (LRU)")
+    prune.add_argument("--older-than-days", type=float, help="borra lo no usado en N días")
+    prune.add_argument("--model", help="borra las entradas de este modelo")
+
+    warm = sub.add_parser("warm", help="precarga desde los chunks ya guardados en ChromaDB")
+    warm.add_argument("--course-id", help="solo la colección de este curso")
+    warm.add_argument("--model", default=settings.EMBEDDING_MODEL,
+                      help="modelo con el que se generaron esos vectores")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    cache = EmbeddingCache(
+        settings.EMBEDDING_CACHE_PATH,
+        max_bytes=int(settings.EMBEDDING_CACHE_MAX_MB * 1024 * 1024),
+    )
+    if args.command == "prune":
+        max_bytes = int(args.max_mb * 1024 * 1024) if args.max_mb is not None else None
+        removed = cache.prune(max_bytes=max_bytes, older_than_days=args.older_than_days, model=args.model)
+        print(f"Entradas eliminadas: {removed}")
+    elif args.command == "warm":
+        loaded = _warm_from_vector_store(cache, args.model, args.course_id)
+        print(f"Chunks cargados: {loaded}")
+
+    stats = cache.stats()
+    print(f"Caché: {stats['path']}")
+    print(f"Entradas: {stats['entries']}  Tamaño: {stats['bytes'] / 1024 / 1024:.1f} MB "
+          f"/ {stats['max_bytes'] / 1024 / 1024:.0f} MB")
+    for model, info in stats["models"].items():
+        print(f"  {model}: {info['entries']} entradas, {info['bytes'] / 1024 / 1024:.1f} MB")
+    cache.close()
+
+
+if __name__ == "__main__":
+    main()
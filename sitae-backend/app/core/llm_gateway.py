@@ -0,0 +1,271 @@
+# app/core/llm_gateway.py
+"""
+Gateway único hacia el proveedor LLM (OpenAI) para toda la aplicación.
+
+- Clientes compartidos (pool HTTP con keep-alive) en vez de uno por request.
+- Deadline por llamada: el total de intentos no supera `deadline` segundos.
+- Reintentos con backoff exponencial + jitter ante 429 / 5xx / red / timeout.
+- Circuit breaker: tras N fallos seguidos del proveedor se abre y las llamadas
+  fallan al instante con LLMUnavailableError, así cada servicio cae a su
+  fallback heurístico sin esperar timeouts. Tras `reset` segundos deja pasar
+  una llamada de prueba (half-open).
+- Límite de llamadas concurrentes (async y sync por separado).
+
+Se crea en `main.lifespan` (init_llm_gateway / close_llm_gateway); fuera de
+la API (workers, CLI, tests) get_llm_gateway() lo crea a demanda.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+import weakref
+from typing import Any, AsyncIterator, Optional
+
+import openai
+from openai import AsyncOpenAI, OpenAI
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.InternalServerError,
+    openai.APIConnectionError,  # incluye APITimeoutError
+    asyncio.TimeoutError,
+)
+
+
+class LLMUnavailableError(RuntimeError):
+    """El circuito está abierto o se agotó el deadline: usar el fallback"""
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def before_call(self) -> bool:
+        """Devuelve True si esta llamada es la de prueba (half-open): hay que cerrarla con end_trial"""
+        with self._lock:
+            state = self.state
+            if state == "open" or (state == "half_open" and self._trial_in_flight):
+                raise LLMUnavailableError("Circuito LLM abierto: se usa el fallback")
+            if state == "half_open":
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def end_trial(self) -> None:
+        """
+        La llamada de prueba terminó sin record_success/record_failure (error no
+        reintentable, cancelación): el circuito sigue half-open y la próxima
+        llamada vuelve a probar.
+        """
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info("✅ Circuito LLM cerrado")
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.error(f"⚠️ Circuito LLM abierto tras {self.failures} fallos seguidos")
+                self.opened_at = time.monotonic()
+
+
+class _LoopState:
+    """Cliente async y semáforo ligados a un event loop"""
+
+    def __init__(self, gateway: "LLMGateway"):
+        self.client = gateway._new_async_client()
+        self.semaphore = asyncio.Semaphore(gateway.max_concurrency)
+
+
+class LLMGateway:
+    def __init__(
+        self,
+        api_key: Optional[str],
+        base_url: Optional[str] = None,
+        timeout: float = 30.0,
+        max_retries: int = 2,
+        max_concurrency: int = 16,
+        failure_threshold: int = 5,
+        reset_seconds: float = 30.0,
+        backoff_base: float = 0.5,
+    ):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+        self.backoff_base = backoff_base
+        self.breaker = CircuitBreaker(failure_threshold, reset_seconds)
+        # Los reintentos los maneja el gateway (max_retries=0 en los clientes)
+        self.sync_client = OpenAI(api_key=api_key, base_url=base_url, timeout=timeout, max_retries=0)
+        self._sync_slots = threading.BoundedSemaphore(max_concurrency)
+        self._loops: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopState]" = weakref.WeakKeyDictionary()
+
+    def _new_async_client(self) -> AsyncOpenAI:
+        return AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, timeout=self.timeout, max_retries=0)
+
+    def _loop_state(self) -> _LoopState:
+        # Un pool httpx async no puede compartirse entre event loops
+        loop = asyncio.get_running_loop()
+        state = self._loops.get(loop)
+        if state is None:
+            state = self._loops[loop] = _LoopState(self)
+        return state
+
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        return self._loop_state().client
+
+    def _delay(self, attempt: int) -> float:
+        delay = self.backoff_base * 2 ** attempt
+        return delay + random.uniform(0, delay)
+
+    # ---------- llamadas ----------
+
+    async def _create(self, client: AsyncOpenAI, deadline: Optional[float], kwargs: dict) -> Any:
+        """chat.completions.create con deadline, reintentos y breaker (sin tomar cupo)"""
+        deadline_at = time.monotonic() + (deadline or self.timeout)
+        for attempt in range(self.max_retries + 1):
+            trial = self.breaker.before_call()
+            try:
+                remaining = deadline_at - time.monotonic()
+                if remaining <= 0:
+                    self.breaker.record_failure()
+                    raise LLMUnavailableError("Deadline de la llamada LLM agotado")
+                try:
+                    result = await asyncio.wait_for(client.chat.completions.create(**kwargs), timeout=remaining)
+                    self.breaker.record_success()
+                    return result
+                except _RETRYABLE_ERRORS as e:
+                    self.breaker.record_failure()
+                    delay = self._delay(attempt)
+                    if attempt == self.max_retries or time.monotonic() + delay >= deadline_at:
+                        raise
+                    logger.warning(f"LLM: {type(e).__name__}, reintento {attempt + 1} en {delay:.1f}s")
+            finally:
+                if trial:
+                    self.breaker.end_trial()
+            await asyncio.sleep(delay)
+
+    async def chat(self, *, deadline: Optional[float] = None, **kwargs) -> Any:
+        """chat.completions.create con deadline, reintentos, breaker y límite de concurrencia"""
+        state = self._loop_state()
+        async with state.semaphore:
+            return await self._create(state.client, deadline, kwargs)
+
+    async def chat_stream(self, *, deadline: Optional[float] = None, **kwargs) -> AsyncIterator[Any]:
+        """
+        Igual que chat() pero con stream=True: produce los chunks a medida que
+        llegan. El deadline y los reintentos cubren solo la apertura del stream;
+        el cupo de concurrencia se ocupa hasta que el stream termina o se cierra.
+        """
+        state = self._loop_state()
+        async with state.semaphore:
+            stream = await self._create(state.client, deadline, {**kwargs, "stream": True})
+            try:
+                async for chunk in stream:
+                    yield chunk
+            finally:
+                # Cliente desconectado / error: cerrar la conexión con el proveedor
+                await stream.close()
+
+    def chat_sync(self, *, deadline: Optional[float] = None, **kwargs) -> Any:
+        """Versión síncrona (para código que corre en threads / rutas sync)"""
+        deadline_at = time.monotonic() + (deadline or self.timeout)
+        with self._sync_slots:
+            for attempt in range(self.max_retries + 1):
+                trial = self.breaker.before_call()
+                try:
+                    remaining = deadline_at - time.monotonic()
+                    if remaining <= 0:
+                        self.breaker.record_failure()
+                        raise LLMUnavailableError("Deadline de la llamada LLM agotado")
+                    try:
+                        result = self.sync_client.with_options(timeout=remaining).chat.completions.create(**kwargs)
+                        self.breaker.record_success()
+                        return result
+                    except _RETRYABLE_ERRORS as e:
+                        self.breaker.record_failure()
+                        delay = self._delay(attempt)
+                        if attempt == self.max_retries or time.monotonic() + delay >= deadline_at:
+                            raise
+                        logger.warning(f"LLM: {type(e).__name__}, reintento {attempt + 1} en {delay:.1f}s")
+                finally:
+                    if trial:
+                        self.breaker.end_trial()
+                time.sleep(delay)
+
+    def stats(self) -> dict:
+        return {
+            "breaker_state": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "max_concurrency": self.max_concurrency,
+        }
+
+    async def aclose(self) -> None:
+        state = self._loops.pop(asyncio.get_running_loop(), None)
+        if state is not None:
+            await state.client.close()
+        self.sync_client.close()
+
+
+_gateway: Optional[LLMGateway] = None
+_gateway_lock = threading.Lock()
+
+
+def init_llm_gateway() -> LLMGateway:
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = LLMGateway(
+                api_key=settings.OPENAI_API_KEY,
+                base_url=settings.OPENAI_BASE_URL,
+                timeout=settings.LLM_TIMEOUT_SECONDS,
+                max_retries=settings.LLM_MAX_RETRIES,
+                max_concurrency=settings.LLM_MAX_CONCURRENCY,
+                failure_threshold=settings.LLM_BREAKER_FAILURES,
+                reset_seconds=settings.LLM_BREAKER_RESET_SECONDS,
+            )
+            from app.core.cache import register_cache
+            register_cache("llm_gateway", _gateway)
+        return _gateway
+
+
+def get_llm_gateway() -> LLMGateway:
+    """Gateway del proceso (creado en lifespan o a demanda)"""
+    return _gateway or init_llm_gateway()
+
+
+async def close_llm_gateway() -> None:
+    global _gateway
+    with _gateway_lock:
+        gateway, _gateway = _gateway, None
+    if gateway is not None:
+        await gateway.aclose()
@@ -0,0 +1,366 @@
+# app/core/pgvector_store.py
+"""
+Vector store sobre Postgres + pgvector (settings.VECTOR_STORE_BACKEND = "pgvector").
+
+Expone el mismo subconjunto de la API de ChromaDB que usa la app
+(get_or_create_collection / get_collection / list_collections /
+delete_collection y, por colección: count, get, upsert, update, delete, query),
+así EmbeddingService funciona igual con cualquiera de los dos backends.
+
+Ventajas frente al PersistentClient embebido:
+- Un solo motor que respaldar (la misma BD de la app).
+- document_id es FK a course_document con ON DELETE CASCADE: borrar el
+  documento borra sus chunks en la misma transacción (no hay huérfanos).
+- La búsqueda hace JOIN con course_document en el mismo round trip y
+  descarta documentos borrados o con ingesta fallida.
+
+Las distancias son L2 al cuadrado, igual que la métrica por defecto de
+ChromaDB, para que el score de relevancia del chat no cambie.
+
+A diferencia de Chroma (un índice por colección), todas las colecciones
+comparten un índice HNSW/IVFFlat y el filtro por colección se aplica después
+del escaneo: con ef_search=100, un curso chico en una tabla grande recibiría
+menos de k vecinos. Con pgvector >= 0.8 se usa el escaneo iterativo
+(relaxed_order) para seguir buscando hasta completar k.
+"""
+import json
+import logging
+from typing import Any, Dict, List, Optional, Sequence
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Metadatos con columna propia (el resto vive en el JSONB `metadata`)
+_COLUMNS = {"document_id": "document_id::text", "chunk_index": "chunk_index"}
+
+# Documentos cuyos chunks no deben aparecer en búsquedas
+_HIDDEN_DOCUMENT_STATUSES = ("failed",)
+
+
+def _vector_literal(vector: Sequence[float]) -> str:
+    return "[" + ",".join(repr(float(x)) for x in vector) + "]"
+
+
+def where_to_sql(where: Optional[Dict], params: Dict[str, Any], alias: str = "c") -> str:
+    """
+    Traduce un filtro estilo ChromaDB a SQL. Soporta igualdad, $eq, $ne, $in,
+    $nin, $and y $or (lo que usa la app).
+    """
+    if not where:
+        return "TRUE"
+
+    def column(key: str) -> str:
+        if key in _COLUMNS:
+            return f"{alias}.{_COLUMNS[key]}"
+        name = f"k{len(params)}"
+        params[name] = key
+        return f"({alias}.metadata ->> :{name})"
+
+    def value(v: Any) -> str:
+        name = f"p{len(params)}"
+        params[name] = str(v) if not isinstance(v, bool) else str(v).lower()
+        return f":{name}"
+
+    clauses = []
+    for key, cond in where.items():
+        if key in ("$and", "$or"):
+            parts = [where_to_sql(sub, params, alias) for sub in cond]
+            joiner = " AND " if key == "$and" else " OR "
+            clauses.append("(" + joiner.join(parts) + ")")
+            continue
+        col = column(key)
+        if not isinstance(cond, dict):
+            cond = {"$eq": cond}
+        for op, v in cond.items():
+            if op == "$eq":
+                clauses.append(f"{col}::text = {value(v)}")
+            elif op == "$ne":
+                clauses.append(f"{col}::text IS DISTINCT FROM {value(v)}")
+            elif op in ("$in", "$nin"):
+                if not v:
+                    clauses.append("FALSE" if op == "$in" else "TRUE")
+                    continue
+                items = ", ".join(value(x) for x in v)
+                negate = "NOT " if op == "$nin" else ""
+                clauses.append(f"{col}::text {negate}IN ({items})")
+            else:
+                raise ValueError(f"Operador de filtro no soportado en pgvector: {op}")
+    return " AND ".join(clauses) if clauses else "TRUE"
+
+
+class PgVectorCollection:
+    def __init__(self, store: "PgVectorStore", name: str):
+        self.store = store
+        self.name = name
+
+    # ---------- lectura ----------
+
+    def count(self) -> int:
+        with self.store.engine.connect() as conn:
+            return conn.execute(
+                text("SELECT COUNT(*) FROM public.document_chunk WHERE collection = :col"),
+                {"col": self.name}
+            ).scalar()
+
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict] = None,
+        include: Sequence[str] = ("metadatas", "documents"),
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+    ) -> Dict[str, List]:
+        params: Dict[str, Any] = {"col": self.name}
+        conditions = ["c.collection = :col", where_to_sql(where, params)]
+        if ids is not None:
+            if not ids:
+                return {"ids": [], "metadatas": [], "documents": [], "embeddings": []}
+            params["ids"] = list(ids)
+            conditions.append("c.id = ANY(:ids)")
+
+        sql = f"""
+            SELECT c.id, c.metadata, c.content,
+                   {"c.embedding::text" if "embeddings" in include else "NULL"} AS embedding
+            FROM public.document_chunk c
+            WHERE {" AND ".join(conditions)}
+            ORDER BY c.id
+        """
+        if limit is not None:
+            sql += " LIMIT :limit"
+            params["limit"] = limit
+        if offset:
+            sql += " OFFSET :offset"
+            params["offset"] = offset
+
+        with self.store.engine.connect() as conn:
+            rows = conn.execute(text(sql), params).fetchall()
+        return {
+            "ids": [r.id for r in rows],
+            "metadatas": [r.metadata for r in rows] if "metadatas" in include else None,
+            "documents": [r.content for r in rows] if "documents" in include else None,
+            "embeddings": [json.loads(r.embedding) for r in rows] if "embeddings" in include else None,
+        }
+
+    def query(
+        self,
+        query_embeddings: List[List[float]],
+        n_results: int = 10,
+        include: Sequence[str] = ("metadatas", "documents", "distances"),
+        where: Optional[Dict] = None,
+    ) -> Dict[str, List]:
+        """
+        Búsqueda k-NN (índice HNSW/IVFFlat) filtrando por colección y estado del
+        documento en la misma consulta. El escaneo iterativo puede devolver los
+        candidatos levemente desordenados: se reordenan por distancia al final.
+        """
+        out = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        with self.store.engine.begin() as conn:
+            self.store.tune_search(conn)
+            for embedding in query_embeddings:
+                params: Dict[str, Any] = {
+                    "col": self.name,
+                    "q": _vector_literal(embedding),
+                    "k": n_results,
+                    "hidden": list(_HIDDEN_DOCUMENT_STATUSES),
+                }
+                filters = where_to_sql(where, params)
+                rows = conn.execute(
+                    text(f"""
+                        WITH knn AS MATERIALIZED (
+                            SELECT c.id, c.content, c.metadata,
+                                   c.embedding <-> CAST(:q AS vector) AS distance
+                            FROM public.document_chunk c
+                            JOIN public.course_document d ON d.id = c.document_id
+                            WHERE c.collection = :col
+                              AND d.status <> ALL(:hidden)
+                              AND {filters}
+                            ORDER BY c.embedding <-> CAST(:q AS vector)
+                            LIMIT :k
+                        )
+                        SELECT * FROM knn ORDER BY distance
+                    """),
+                    params
+                ).fetchall()
+                out["ids"].append([r.id for r in rows])
+                out["documents"].append([r.content for r in rows])
+                out["metadatas"].append([r.metadata for r in rows])
+                # L2 al cuadrado: misma escala que la métrica por defecto de ChromaDB
+                out["distances"].append([float(r.distance) ** 2 for r in rows])
+        return out
+
+    # ---------- escritura ----------
+
+    def upsert(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: List[str],
+        metadatas: List[Dict],
+    ) -> None:
+        rows = [
+            {
+                "id": i,
+                "col": self.name,
+                "doc": (m or {}).get("document_id"),
+                "idx": (m or {}).get("chunk_index"),
+                "content": d,
+                "meta": json.dumps(m or {}),
+                "emb": _vector_literal(e),
+            }
+            for i, e, d, m in zip(ids, embeddings, documents, metadatas)
+        ]
+        if not rows:
+            return
+        with self.store.engine.begin() as conn:
+            conn.execute(
+                text("""
+                    INSERT INTO public.document_chunk
+                      (id, collection, document_id, chunk_index, content, metadata, embedding)
+                    VALUES
+                      (:id, :col, :doc, :idx, :content, CAST(:meta AS JSONB), CAST(:emb AS vector))
+                    ON CONFLICT (id) DO UPDATE SET
+                      collection = EXCLUDED.collection,
+                      document_id = EXCLUDED.document_id,
+                      chunk_index = EXCLUDED.chunk_index,
+                      content = EXCLUDED.content,
+                      metadata = EXCLUDED.metadata,
+                      embedding = EXCLUDED.embedding
+                """),
+                rows
+            )
+
+    def update(self, ids: List[str], metadatas: List[Dict]) -> None:
+        rows = [
+            {"id": i, "col": self.name, "idx": (m or {}).get("chunk_index"), "meta": json.dumps(m or {})}
+            for i, m in zip(ids, metadatas)
+        ]
+        if not rows:
+            return
+        with self.store.engine.begin() as conn:
+            conn.execute(
+                text("""
+                    UPDATE public.document_chunk
+                    SET metadata = CAST(:meta AS JSONB), chunk_index = :idx
+                    WHERE id = :id AND collection = :col
+                """),
+                rows
+            )
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None) -> None:
+        params: Dict[str, Any] = {"col": self.name}
+        conditions = ["c.collection = :col", where_to_sql(where, params)]
+        if ids is not None:
+            params["ids"] = list(ids)
+            conditions.append("c.id = ANY(:ids)")
+        with self.store.engine.begin() as conn:
+            conn.execute(
+                text(f"DELETE FROM public.document_chunk c WHERE {' AND '.join(conditions)}"),
+                params
+            )
+
+
+class PgVectorStore:
+    def __init__(self, engine: Engine, dimensions: int, index: str = "hnsw"):
+        if index not in ("hnsw", "ivfflat"):
+            raise ValueError(f"Índice pgvector desconocido: {index}")
+        self.engine = engine
+        self.dimensions = dimensions
+        self.index = index
+        self._iterative_scan: Optional[bool] = None  # pgvector >= 0.8 (se detecta una vez)
+
+    def ensure_schema(self) -> None:
+        """Crea extensión, tablas e índice si no existen (idempotente)"""
+        index_sql = {
+            "hnsw": "USING hnsw (embedding vector_l2_ops) WITH (m = 16, ef_construction = 64)",
+            "ivfflat": "USING ivfflat (embedding vector_l2_ops) WITH (lists = 100)",
+        }[self.index]
+        with self.engine.begin() as conn:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS public.vector_collection (
+                    name        TEXT PRIMARY KEY,
+                    created_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+                )
+            """))
+            conn.execute(text(f"""
+                CREATE TABLE IF NOT EXISTS public.document_chunk (
+                    id           TEXT PRIMARY KEY,
+                    collection   TEXT NOT NULL
+                                 REFERENCES public.vector_collection(name) ON DELETE CASCADE,
+                    document_id  UUID REFERENCES public.course_document(id) ON DELETE CASCADE,
+                    chunk_index  INTEGER,
+                    content      TEXT NOT NULL,
+                    metadata     JSONB NOT NULL DEFAULT '{{}}'::jsonb,
+                    embedding    vector({int(self.dimensions)}) NOT NULL
+                )
+            """))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_document_chunk_collection_document "
+                "ON public.document_chunk (collection, document_id)"
+            ))
+            conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS ix_document_chunk_embedding_{self.index} "
+                f"ON public.document_chunk {index_sql}"
+            ))
+
+    def supports_iterative_scan(self, conn) -> bool:
+        """pgvector >= 0.8 tiene hnsw/ivfflat.iterative_scan (antes, SET falla)"""
+        if self._iterative_scan is None:
+            version = conn.execute(
+                text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+            ).scalar()
+            try:
+                self._iterative_scan = tuple(int(p) for p in version.split(".")[:2]) >= (0, 8)
+            except (AttributeError, ValueError):
+                self._iterative_scan = False
+            if not self._iterative_scan:
+                logger.warning(
+                    f"⚠️ pgvector {version} sin escaneo iterativo: colecciones chicas pueden "
+                    f"recibir menos de k vecinos (actualizar a >= 0.8)"
+                )
+        return self._iterative_scan
+
+    def tune_search(self, conn) -> None:
+        """Ajusta recall del índice para esta transacción"""
+        iterative = settings.PGVECTOR_ITERATIVE_SCAN and self.supports_iterative_scan(conn)
+        if self.index == "hnsw":
+            conn.execute(text(f"SET LOCAL hnsw.ef_search = {int(settings.PGVECTOR_EF_SEARCH)}"))
+            if iterative:
+                conn.execute(text("SET LOCAL hnsw.iterative_scan = relaxed_order"))
+                conn.execute(text(f"SET LOCAL hnsw.max_scan_tuples = {int(settings.PGVECTOR_MAX_SCAN_TUPLES)}"))
+        else:
+            conn.execute(text(f"SET LOCAL ivfflat.probes = {int(settings.PGVECTOR_IVFFLAT_PROBES)}"))
+            if iterative:
+                conn.execute(text("SET LOCAL ivfflat.iterative_scan = relaxed_order"))
+
+    # ---------- API estilo ChromaDB ----------
+
+    def get_or_create_collection(self, name: str, **_) -> PgVectorCollection:
+        with self.engine.begin() as conn:
+            conn.execute(
+                text("INSERT INTO public.vector_collection (name) VALUES (:n) ON CONFLICT DO NOTHING"),
+                {"n": name}
+            )
+        return PgVectorCollection(self, name)
+
+    def get_collection(self, name: str, **_) -> PgVectorCollection:
+        with self.engine.connect() as conn:
+            exists = conn.execute(
+                text("SELECT 1 FROM public.vector_collection WHERE name = :n"), {"n": name}
+            ).first()
+        if not exists:
+            raise ValueError(f"Collection {name} does not exist.")
+        return PgVectorCollection(self, name)
+
+    def list_collections(self) -> List[PgVectorCollection]:
+        with self.engine.connect() as conn:
+            names = conn.execute(text("SELECT name FROM public.vector_collection ORDER BY name")).scalars()
+            return [PgVectorCollection(self, n) for n in names]
+
+    def delete_collection(self, name: str) -> None:
+        with self.engine.begin() as conn:
+            conn.execute(text("DELETE FROM public.vector_collection WHERE name = :n"), {"n": name})
@@ -9,22 +9,48 @@ logger = logging.getLogger(__name__)
 # Ruta donde se guardarán los embeddings
 #VECTOR_DB_PATH = Path("/var/lib/tutor_vectordb") #se definió ruta en .env
 
+def create_chroma_store(path: str) -> PersistentClient:
+    """Cliente ChromaDB embebido en `path` (crea el directorio si no existe)"""
+    vector_path = Path(path).expanduser().resolve()
+    vector_path.mkdir(parents=True, exist_ok=True)
+    client = PersistentClient(path=str(vector_path))
+    logger.info(f"✅ ChromaDB inicializado en: {vector_path}")
+    return client
+
+
+def create_pgvector_store():
+    """Vector store en Postgres (misma BD que la app); crea el esquema si falta"""
+    from app.core.pgvector_store import PgVectorStore
+    from app.db.session import engine
+
+    store = PgVectorStore(engine, dimensions=settings.PGVECTOR_DIMENSIONS, index=settings.PGVECTOR_INDEX)
+    store.ensure_schema()
+    logger.info(f"✅ pgvector inicializado (índice {settings.PGVECTOR_INDEX})")
+    return store
+
+
+VECTOR_STORE_BACKENDS = {
+    "chroma": lambda: create_chroma_store(settings.CHROMA_PATH),
+    "pgvector": create_pgvector_store,
+}
+
+
 @lru_cache()
-def get_vector_store() -> PersistentClient:
+def get_vector_store():
     """
-    Singleton de ChromaDB para toda la aplicación.
-    Usa la ruta definida en settings.CHROMA_PATH.
-    Crea el directorio si no existe.
+    Singleton del vector store para toda la aplicación.
+    El backend se elige con settings.VECTOR_STORE_BACKEND; ambos exponen la
+    misma API de colecciones (la de ChromaDB).
     """
-    vector_path = Path(settings.CHROMA_PATH).expanduser().resolve()
+    try:
+        factory = VECTOR_STORE_BACKENDS[settings.VECTOR_STORE_BACKEND]
+    except KeyError:
+        raise ValueError(f"VECTOR_STORE_BACKEND desconocido: {settings.VECTOR_STORE_BACKEND}")
 
     try:
-        vector_path.mkdir(parents=True, exist_ok=True)
-        client = PersistentClient(path=str(vector_path))
-        logger.info(f"✅ ChromaDB inicializado en: {vector_path}")
-        return client
+        return factory()
     except Exception as e:
-        logger.error(f"❌ Error inicializando ChromaDB: {e}")
+        logger.error(f"❌ Error inicializando vector store ({settings.VECTOR_STORE_BACKEND}): {e}")
         raise
 
 
@@ -0,0 +1,30 @@
+# app/db/timeouts.py
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+
+@contextmanager
+def statement_timeout(db: Session, seconds: Optional[float]) -> Iterator[None]:
+    """
+    Las consultas del bloque que superen `seconds` las cancela el servidor
+    (statement_timeout local a un SAVEPOINT). Si algo falla se revierte solo
+    el savepoint: la sesión sigue usable para lo que resta del request.
+    Solo PostgreSQL; con otra BD (o sin bind) no hace nada.
+    """
+    bind = getattr(db, "bind", None)
+    if not seconds or bind is None or bind.dialect.name != "postgresql":
+        yield
+        return
+    nested = db.begin_nested()
+    try:
+        db.execute(text("SELECT set_config('statement_timeout', :ms, true)"), {"ms": str(int(seconds * 1000))})
+        yield
+        # Falla si el bloque se tragó una consulta cancelada (transacción abortada)
+        db.execute(text("SET LOCAL statement_timeout TO DEFAULT"))
+        nested.commit()
+    except BaseException:
+        nested.rollback()
+        raise
@@ -12,7 +12,7 @@ from app.routers import (
     question_responses,
     attempt_results
 )
-from app.routers import chat, documents 
+from app.routers import chat, documents, metrics
 import logging
 #logging.basicConfig()
 #logging.getLogger('sqlalchemy.engine').setLevel(logging.INFO)
@@ -22,21 +22,26 @@ import logging
 async def lifespan(app: FastAPI):
     """Inicializa y libera recursos al iniciar/cerrar la app"""
     from app.core.vector_store import get_vector_store
+    from app.core.llm_gateway import init_llm_gateway, close_llm_gateway
+    from app.core.admission import close_admission_controller
     logger = logging.getLogger(__name__)
 
     # --- Al iniciar la app ---
     try:
         vector_store = get_vector_store()
-        logger.info("✅ ChromaDB inicializado correctamente")
+        logger.info(f"✅ Vector store inicializado ({settings.VECTOR_STORE_BACKEND})")
     except Exception as e:
-        logger.error(f"❌ Error inicializando ChromaDB: {e}")
+        logger.error(f"❌ Error inicializando vector store: {e}")
 
+    init_llm_gateway()
     logger.info("🚀 API iniciada")
 
     # yield marca el punto donde FastAPI empieza a atender requests
     yield
 
     # --- Al cerrar la app ---
+    await close_llm_gateway()
+    await close_admission_controller()
     logger.info("🛑 API finalizada")
 
 
@@ -84,6 +89,7 @@ app.include_router(attempt_results.router, prefix="/api")
 app.include_router(profile.router, prefix="/api")
 app.include_router(chat.router, prefix="/api")
 app.include_router(documents.router, prefix="/api")
+app.include_router(metrics.router, prefix="/api")
 
 # CORS
 app.add_middleware(
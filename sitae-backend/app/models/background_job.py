@@ -0,0 +1,42 @@
+# app/models/background_job.py
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.dialects.postgresql import UUID, JSONB
+from sqlalchemy import Text, Integer, TIMESTAMP, Index, text
+from sqlalchemy.sql import func
+from app.db.base import Base
+from datetime import datetime
+import uuid
+
+
+class BackgroundJob(Base):
+    """
+    Cola durable de trabajos (ingesta de documentos, etc.).
+    La consume `python -m app.workers.job_worker`.
+    """
+    __tablename__ = "background_job"
+    __table_args__ = (
+        # Lo que usa el worker para reclamar trabajos
+        Index("ix_background_job_claim", "status", "run_after"),
+    )
+
+    id: Mapped[str] = mapped_column(
+        UUID(as_uuid=False),
+        primary_key=True,
+        default=lambda: str(uuid.uuid4()),
+        server_default=text("gen_random_uuid()")  # enqueue inserta con SQL sin id
+    )
+    kind: Mapped[str] = mapped_column(Text, nullable=False)  # 'ingest_document', ...
+    payload: Mapped[dict] = mapped_column(JSONB, nullable=False, default=dict)
+    # 'queued', 'running', 'completed', 'failed', 'cancelled' (versión reemplazada)
+    status: Mapped[str] = mapped_column(Text, nullable=False, default="queued", server_default="queued")
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    max_attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=3, server_default="3")
+    run_after: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), server_default=func.now())
+    locked_by: Mapped[str | None] = mapped_column(Text)
+    locked_at: Mapped[datetime | None] = mapped_column(TIMESTAMP(timezone=True))
+    last_error: Mapped[str | None] = mapped_column(Text)
+    created_at: Mapped[datetime] = mapped_column(
+        TIMESTAMP(timezone=True),
+        server_default=func.now()
+    )
+    finished_at: Mapped[datetime | None] = mapped_column(TIMESTAMP(timezone=True))
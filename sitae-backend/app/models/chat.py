@@ -1,7 +1,7 @@
 # app/models/chat.py
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.dialects.postgresql import UUID, JSONB
-from sqlalchemy import Text, Integer, ForeignKey, TIMESTAMP
+from sqlalchemy import Text, Integer, ForeignKey, TIMESTAMP, Index
 from sqlalchemy.sql import func
 from app.db.base import Base
 from datetime import datetime
@@ -10,6 +10,10 @@ import uuid
 class Conversation(Base):
     """Historial de conversaciones del asistente"""
     __tablename__ = "conversation"
+    __table_args__ = (
+        # Historial paginado por cursor: WHERE user_id, course_id ORDER BY created_at, id DESC
+        Index("ix_conversation_user_course_created", "user_id", "course_id", "created_at", "id"),
+    )
     
     id: Mapped[str] = mapped_column(
         UUID(as_uuid=False), 
@@ -39,6 +43,28 @@ class Conversation(Base):
     course = relationship("Course")
 
 
+
+class ConversationSummary(Base):
+    """
+    Resumen acumulado del chat por (usuario, curso). Lo actualiza el job
+    'summarize_conversation' después de cada turno; cubre todos los turnos
+    salvo el más reciente, que va completo en el prompt.
+    """
+    __tablename__ = "conversation_summary"
+
+    user_id: Mapped[str] = mapped_column(UUID(as_uuid=False), ForeignKey("user.id"), primary_key=True)
+    course_id: Mapped[str] = mapped_column(UUID(as_uuid=False), ForeignKey("course.id"), primary_key=True)
+    summary: Mapped[str] = mapped_column(Text, nullable=False, default="", server_default="")
+    turns_covered: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    # Último turno incluido en el resumen (cursor created_at, id)
+    covered_until_at: Mapped[datetime | None] = mapped_column(TIMESTAMP(timezone=True))
+    covered_until_id: Mapped[str | None] = mapped_column(UUID(as_uuid=False))
+    updated_at: Mapped[datetime] = mapped_column(
+        TIMESTAMP(timezone=True),
+        server_default=func.now(),
+        onupdate=func.now()
+    )
+
 class CourseDocument(Base):
     """Metadatos de documentos del curso (para tracking)"""
     __tablename__ = "course_document"
@@ -58,6 +84,10 @@ class CourseDocument(Base):
     document_type: Mapped[str] = mapped_column(Text)  # 'pdf', 'code', 'video', 'syllabus'
     file_path: Mapped[str | None] = mapped_column(Text)  # Ruta local si se descarga
     chunk_count: Mapped[int] = mapped_column(Integer, default=0)  # Cuántos chunks generó
+    # Estado de ingesta: 'queued', 'running', 'completed', 'failed' (links: 'completed')
+    status: Mapped[str] = mapped_column(Text, default="queued", server_default="queued")
+    progress: Mapped[int] = mapped_column(Integer, default=0, server_default="0")  # 0-100
+    error: Mapped[str | None] = mapped_column(Text)  # Último error de ingesta
     processed_at: Mapped[datetime | None] = mapped_column(TIMESTAMP(timezone=True))
     created_at: Mapped[datetime] = mapped_column(
         TIMESTAMP(timezone=True), 
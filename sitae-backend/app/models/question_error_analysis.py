@@ -0,0 +1,31 @@
+# app/models/question_error_analysis.py
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Text, ForeignKey, TIMESTAMP
+from sqlalchemy.sql import func
+from app.db.base import Base
+from datetime import datetime
+
+
+class QuestionErrorAnalysis(Base):
+    """
+    Caché persistente del análisis de error (LLM) de una pregunta. El prompt
+    solo depende de la pregunta, la opción marcada y el nivel del estudiante;
+    item_version = hash de los textos del prompt.
+    selected_option_id = '' cuando la pregunta quedó sin responder.
+    """
+    __tablename__ = "question_error_analysis"
+
+    question_id: Mapped[str] = mapped_column(
+        UUID(as_uuid=False), ForeignKey("question.id", ondelete="CASCADE"), primary_key=True
+    )
+    selected_option_id: Mapped[str] = mapped_column(Text, primary_key=True)
+    prereq_level: Mapped[str] = mapped_column(Text, primary_key=True)
+    item_version: Mapped[str] = mapped_column(Text, primary_key=True)
+    model: Mapped[str] = mapped_column(Text, primary_key=True)
+    analysis: Mapped[str] = mapped_column(Text, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        TIMESTAMP(timezone=True),
+        server_default=func.now(),
+        nullable=False
+    )
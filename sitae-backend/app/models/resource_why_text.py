@@ -0,0 +1,29 @@
+# app/models/resource_why_text.py
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Text, ForeignKey, TIMESTAMP
+from sqlalchemy.sql import func
+from app.db.base import Base
+from datetime import datetime
+
+
+class ResourceWhyText(Base):
+    """
+    Caché persistente del why_text de un recurso recomendado. El texto solo
+    depende del recurso (versión = hash de los campos del prompt) y de un
+    bucket de perfil (nivel, tiempo semanal, modalidades), no del estudiante.
+    """
+    __tablename__ = "resource_why_text"
+
+    resource_id: Mapped[str] = mapped_column(
+        UUID(as_uuid=False), ForeignKey("resource.id", ondelete="CASCADE"), primary_key=True
+    )
+    resource_version: Mapped[str] = mapped_column(Text, primary_key=True)
+    profile_bucket: Mapped[str] = mapped_column(Text, primary_key=True)
+    model: Mapped[str] = mapped_column(Text, primary_key=True)
+    why_text: Mapped[str] = mapped_column(Text, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        TIMESTAMP(timezone=True),
+        server_default=func.now(),
+        nullable=False
+    )
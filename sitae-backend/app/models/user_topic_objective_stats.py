@@ -0,0 +1,31 @@
+# app/models/user_topic_objective_stats.py
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Integer, ForeignKey, TIMESTAMP
+from sqlalchemy.sql import func
+from app.db.base import Base
+from datetime import datetime
+
+
+class UserTopicObjectiveStats(Base):
+    """
+    Proyección de fallos por objetivo temático en los últimos N intentos
+    calificados del estudiante en el curso (áreas débiles del chat).
+    Se recalcula al calificar un intento; reconstruir con
+    `python -m app.workers.backfill_weak_areas`.
+    """
+    __tablename__ = "user_topic_objective_stats"
+
+    # La PK (user_id, course_id, ...) es el índice de la lectura del chat
+    user_id: Mapped[str] = mapped_column(UUID(as_uuid=False), ForeignKey("user.id"), primary_key=True)
+    course_id: Mapped[str] = mapped_column(UUID(as_uuid=False), ForeignKey("course.id"), primary_key=True)
+    topic_objective_id: Mapped[str] = mapped_column(
+        UUID(as_uuid=False), ForeignKey("topic_objective.id"), primary_key=True
+    )
+    fail_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    window_attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)  # intentos considerados
+    updated_at: Mapped[datetime] = mapped_column(
+        TIMESTAMP(timezone=True),
+        server_default=func.now(),
+        onupdate=func.now()
+    )
@@ -16,6 +16,10 @@ from .course_content_repository import CourseContentRepository
 from .statistics_repository import StatisticsRepository
 from .user_course_profile_repository import UserCourseProfileRepository
 from .user_learning_profile_repository import UserLearningProfileRepository
+from .background_job_repository import BackgroundJobRepository
+from .weak_area_repository import WeakAreaRepository
+from .resource_why_text_repository import ResourceWhyTextRepository
+from .question_error_analysis_repository import QuestionErrorAnalysisRepository
 
 __all__ = [
     "UserRepository",
@@ -34,5 +38,9 @@ __all__ = [
     "CourseContentRepository",
     "StatisticsRepository",
     "UserLearningProfileRepository",
-    "UserCourseProfileRepository"
+    "UserCourseProfileRepository",
+    "BackgroundJobRepository",
+    "WeakAreaRepository",
+    "ResourceWhyTextRepository",
+    "QuestionErrorAnalysisRepository"
 ]
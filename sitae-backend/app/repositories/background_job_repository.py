@@ -0,0 +1,145 @@
+# app/repositories/background_job_repository.py
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+from typing import List
+import json
+
+
+class BackgroundJobRepository:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def enqueue(self, kind: str, payload: dict, max_attempts: int = 3) -> str:
+        row = self.db.execute(
+            text("""
+                INSERT INTO public.background_job (kind, payload, max_attempts)
+                VALUES (:kind, CAST(:payload AS JSONB), :max_attempts)
+                RETURNING id
+            """),
+            {"kind": kind, "payload": json.dumps(payload), "max_attempts": max_attempts}
+        ).first()
+        return str(row.id)
+
+    def claim(self, worker_id: str, limit: int, stale_after_seconds: int) -> List:
+        """
+        Reclama hasta `limit` trabajos listos. SKIP LOCKED permite varios workers
+        sin bloquearse entre sí; los 'running' abandonados (worker caído) se retoman
+        solo si les quedan intentos (ver fail_stale_exhausted).
+        """
+        return self.db.execute(
+            text("""
+                UPDATE public.background_job j
+                SET status = 'running',
+                    attempts = j.attempts + 1,
+                    locked_by = :worker,
+                    locked_at = now()
+                WHERE j.id IN (
+                    SELECT id FROM public.background_job
+                    WHERE (status = 'queued' AND run_after <= now())
+                       OR (status = 'running'
+                           AND attempts < max_attempts
+                           AND locked_at < now() - make_interval(secs => :stale))
+                    ORDER BY run_after
+                    LIMIT :limit
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING j.id, j.kind, j.payload, j.attempts, j.max_attempts
+            """),
+            {"worker": worker_id, "limit": limit, "stale": stale_after_seconds}
+        ).fetchall()
+
+    def fail_stale_exhausted(self, stale_after_seconds: int, error: str) -> List:
+        """
+        'running' abandonados que ya usaron su último intento (el proceso murió
+        ejecutándolos, p.ej. OOM): se marcan 'failed' en vez de reintentarse.
+        """
+        return self.db.execute(
+            text("""
+                UPDATE public.background_job j
+                SET status = 'failed', finished_at = now(), last_error = :err,
+                    locked_by = NULL, locked_at = NULL
+                WHERE j.id IN (
+                    SELECT id FROM public.background_job
+                    WHERE status = 'running'
+                      AND attempts >= max_attempts
+                      AND locked_at < now() - make_interval(secs => :stale)
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING j.id, j.kind, j.payload, j.attempts, j.max_attempts
+            """),
+            {"stale": stale_after_seconds, "err": error}
+        ).fetchall()
+
+    def cancel_queued(self, kind: str, payload_key: str, value: str, reason: str) -> int:
+        """
+        Cancela los trabajos aún en cola de `kind` con payload[payload_key] = value
+        (p.ej. la ingesta de una versión que ya fue reemplazada). Los que están
+        corriendo no se tocan: el handler detecta que quedaron obsoletos.
+        """
+        return self.db.execute(
+            text("""
+                UPDATE public.background_job
+                SET status = 'cancelled', finished_at = now(), last_error = :reason
+                WHERE kind = :kind
+                  AND status = 'queued'
+                  AND payload ->> :key = :value
+            """),
+            {"kind": kind, "key": payload_key, "value": value, "reason": reason}
+        ).rowcount
+
+    def heartbeat(self, job_ids: List[str], worker_id: str) -> int:
+        """
+        Renueva locked_at de trabajos en curso de este worker, para que claim()
+        no los tome como abandonados. Devuelve cuántos siguen siendo suyos.
+        """
+        if not job_ids:
+            return 0
+        return self.db.execute(
+            text("""
+                UPDATE public.background_job
+                SET locked_at = now()
+                WHERE id = ANY(CAST(:ids AS uuid[]))
+                  AND status = 'running'
+                  AND locked_by = :worker
+            """),
+            {"ids": list(job_ids), "worker": worker_id}
+        ).rowcount
+
+    def complete(self, job_id: str, worker_id: str) -> bool:
+        """False si el trabajo ya no es de este worker (otro lo retomó): no se toca"""
+        result = self.db.execute(
+            text("""
+                UPDATE public.background_job
+                SET status = 'completed', finished_at = now(), last_error = NULL
+                WHERE id = :id AND status = 'running' AND locked_by = :worker
+            """),
+            {"id": job_id, "worker": worker_id}
+        )
+        return result.rowcount > 0
+
+    def fail(self, job_id: str, worker_id: str, error: str, retry_in_seconds: float | None) -> bool:
+        """
+        Reencola con backoff, o marca 'failed' si `retry_in_seconds` es None.
+        False si el trabajo ya no es de este worker: no se toca.
+        """
+        if retry_in_seconds is None:
+            result = self.db.execute(
+                text("""
+                    UPDATE public.background_job
+                    SET status = 'failed', finished_at = now(), last_error = :err
+                    WHERE id = :id AND status = 'running' AND locked_by = :worker
+                """),
+                {"id": job_id, "worker": worker_id, "err": error}
+            )
+        else:
+            result = self.db.execute(
+                text("""
+                    UPDATE public.background_job
+                    SET status = 'queued', locked_by = NULL, locked_at = NULL,
+                        last_error = :err,
+                        run_after = now() + make_interval(secs => :delay)
+                    WHERE id = :id AND status = 'running' AND locked_by = :worker
+                """),
+                {"id": job_id, "worker": worker_id, "err": error, "delay": retry_in_seconds}
+            )
+        return result.rowcount > 0
@@ -0,0 +1,72 @@
+# app/repositories/question_error_analysis_repository.py
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+from typing import Dict, List, Tuple
+
+
+class QuestionErrorAnalysisRepository:
+    """Lecturas y escrituras en bloque de public.question_error_analysis (sin commit)"""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def get_many(
+        self, keys: List[Tuple[str, str, str]], prereq_level: str, model: str
+    ) -> Dict[Tuple[str, str], str]:
+        """`keys`: (question_id, selected_option_id, item_version) -> {(question_id, selected_option_id): análisis}"""
+        if not keys:
+            return {}
+        rows = self.db.execute(
+            text("""
+                SELECT a.question_id, a.selected_option_id, a.analysis
+                FROM public.question_error_analysis a
+                JOIN unnest(CAST(:qids AS uuid[]), CAST(:opts AS text[]), CAST(:versions AS text[]))
+                     AS k(qid, opt, version)
+                  ON a.question_id = k.qid AND a.selected_option_id = k.opt AND a.item_version = k.version
+                WHERE a.prereq_level = :level AND a.model = :model
+            """),
+            {
+                "qids": [k[0] for k in keys],
+                "opts": [k[1] for k in keys],
+                "versions": [k[2] for k in keys],
+                "level": prereq_level,
+                "model": model,
+            }
+        ).fetchall()
+        return {(str(r.question_id), r.selected_option_id): r.analysis for r in rows}
+
+    def put_many(self, rows: List[Tuple[str, str, str, str, str]], model: str) -> None:
+        """`rows`: (question_id, selected_option_id, prereq_level, item_version, análisis)"""
+        if not rows:
+            return
+        self.db.execute(
+            text("""
+                INSERT INTO public.question_error_analysis
+                  (question_id, selected_option_id, prereq_level, item_version, model, analysis)
+                SELECT a.qid, a.opt, a.level, a.version, :model, a.analysis
+                FROM unnest(
+                    CAST(:qids AS uuid[]),
+                    CAST(:opts AS text[]),
+                    CAST(:levels AS text[]),
+                    CAST(:versions AS text[]),
+                    CAST(:analyses AS text[])
+                ) AS a(qid, opt, level, version, analysis)
+                ON CONFLICT (question_id, selected_option_id, prereq_level, item_version, model) DO NOTHING
+            """),
+            {
+                "qids": [r[0] for r in rows],
+                "opts": [r[1] for r in rows],
+                "levels": [r[2] for r in rows],
+                "versions": [r[3] for r in rows],
+                "analyses": [r[4] for r in rows],
+                "model": model,
+            }
+        )
+
+    def delete_for_question(self, question_id: str) -> int:
+        """Al editar la pregunta o una de sus opciones, sus análisis ya no aplican"""
+        result = self.db.execute(
+            text("DELETE FROM public.question_error_analysis WHERE question_id = :qid"),
+            {"qid": question_id}
+        )
+        return result.rowcount
@@ -1,6 +1,7 @@
 # app/repositories/question_recommendation_repository.py
 from sqlalchemy.orm import Session
 from sqlalchemy import text
+from typing import Dict, List
 
 class QuestionRecommendationRepository:
     def __init__(self, db: Session):
@@ -33,3 +34,46 @@ class QuestionRecommendationRepository:
                 "src": source
             }
         )
+
+    def upsert_many(
+        self,
+        attempt_quiz_id: str,
+        rows: List[Dict],
+        source: str,
+        update_existing: bool = False
+    ) -> None:
+        """
+        Igual que `upsert` pero en un solo INSERT multi-fila. Cada dict:
+        question_id, resource_id, rank_position y opcionalmente why_text.
+        Con `update_existing` una fila ya existente toma rank, why_text y source nuevos.
+        """
+        if not rows:
+            return
+        on_conflict = (
+            "DO UPDATE SET rank_position = EXCLUDED.rank_position, "
+            "why_text = EXCLUDED.why_text, source = EXCLUDED.source"
+            if update_existing else "DO NOTHING"
+        )
+        self.db.execute(
+            text(f"""
+                INSERT INTO public.question_recommendation
+                  (attempt_quiz_id, question_id, resource_id, rank_position, why_text, source)
+                SELECT :aid, r.qid, r.rid, r.rank, r.why, :src
+                FROM unnest(
+                    CAST(:qids AS uuid[]),
+                    CAST(:rids AS uuid[]),
+                    CAST(:ranks AS integer[]),
+                    CAST(:whys AS text[])
+                ) AS r(qid, rid, rank, why)
+                ON CONFLICT (question_id, attempt_quiz_id, resource_id)
+                {on_conflict}
+            """),
+            {
+                "aid": attempt_quiz_id,
+                "qids": [r["question_id"] for r in rows],
+                "rids": [r["resource_id"] for r in rows],
+                "ranks": [r["rank_position"] for r in rows],
+                "whys": [r.get("why_text") for r in rows],
+                "src": source,
+            }
+        )
@@ -1,7 +1,8 @@
 # app/repositories/question_response_repository.py
 from sqlalchemy.orm import Session
+from sqlalchemy import text
 from app.models.question_response import QuestionResponse
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 class QuestionResponseRepository:
     def __init__(self, db: Session):
@@ -55,4 +56,58 @@ class QuestionResponseRepository:
         
         self.db.commit()
         self.db.refresh(db_response)
-        return db_response
\ No newline at end of file
+        return db_response
+
+    def replace_for_attempt(self, attempt_id: str, responses: List[Dict]) -> None:
+        """
+        Reemplaza las respuestas del intento para esas preguntas: un DELETE y un
+        INSERT desde arrays, en la transacción del llamador. Van como dos
+        sentencias porque un DELETE en un CTE comparte snapshot con el INSERT
+        (no ve sus borrados). Cada dict: question_id, is_correct, score,
+        option_id, time_seconds. No hace commit.
+        """
+        qids = [r["question_id"] for r in responses]
+        self.db.execute(
+            text("""
+                DELETE FROM public.question_response
+                WHERE attempt_quiz_id = :aid
+                  AND question_id = ANY(CAST(:qids AS uuid[]))
+            """),
+            {"aid": attempt_id, "qids": qids}
+        )
+        self.db.execute(
+            text("""
+                INSERT INTO public.question_response
+                  (attempt_quiz_id, question_id, is_correct, score, option_id, time_seconds)
+                SELECT :aid, r.qid, r.ok, r.score, r.oid, r.tsec
+                FROM unnest(
+                    CAST(:qids AS uuid[]),
+                    CAST(:oks AS boolean[]),
+                    CAST(:scores AS float8[]),
+                    CAST(:oids AS uuid[]),
+                    CAST(:tsecs AS integer[])
+                ) AS r(qid, ok, score, oid, tsec)
+            """),
+            {
+                "aid": attempt_id,
+                "qids": qids,
+                "oks": [r["is_correct"] for r in responses],
+                "scores": [r["score"] for r in responses],
+                "oids": [r["option_id"] for r in responses],
+                "tsecs": [r["time_seconds"] for r in responses],
+            }
+        )
+
+    def set_comments(self, attempt_id: str, comments: Dict[str, str]) -> None:
+        """Actualiza `comment` de varias preguntas del intento en una sentencia. No hace commit."""
+        if not comments:
+            return
+        self.db.execute(
+            text("""
+                UPDATE public.question_response qr
+                SET comment = c.comment
+                FROM unnest(CAST(:qids AS uuid[]), CAST(:comments AS text[])) AS c(qid, comment)
+                WHERE qr.attempt_quiz_id = :aid AND qr.question_id = c.qid
+            """),
+            {"aid": attempt_id, "qids": list(comments), "comments": list(comments.values())}
+        )
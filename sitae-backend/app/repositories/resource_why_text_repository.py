@@ -0,0 +1,71 @@
+# app/repositories/resource_why_text_repository.py
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+from typing import Dict, List, Tuple
+
+
+class ResourceWhyTextRepository:
+    """Lecturas y escrituras en bloque de public.resource_why_text (sin commit)"""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def get_many(
+        self, keys: List[Tuple[str, str]], profile_bucket: str, model: str
+    ) -> Dict[Tuple[str, str], str]:
+        """`keys`: (resource_id, resource_version) -> {(resource_id, resource_version): why_text}"""
+        if not keys:
+            return {}
+        rows = self.db.execute(
+            text("""
+                SELECT w.resource_id, w.resource_version, w.why_text
+                FROM public.resource_why_text w
+                JOIN unnest(CAST(:rids AS uuid[]), CAST(:versions AS text[])) AS k(rid, version)
+                  ON w.resource_id = k.rid AND w.resource_version = k.version
+                WHERE w.profile_bucket = :bucket AND w.model = :model
+            """),
+            {
+                "rids": [rid for rid, _ in keys],
+                "versions": [version for _, version in keys],
+                "bucket": profile_bucket,
+                "model": model,
+            }
+        ).fetchall()
+        return {(str(r.resource_id), r.resource_version): r.why_text for r in rows}
+
+    def put_many(self, rows: List[Tuple[str, str, str, str]], model: str) -> None:
+        """`rows`: (resource_id, resource_version, profile_bucket, why_text)"""
+        if not rows:
+            return
+        self.db.execute(
+            text("""
+                INSERT INTO public.resource_why_text
+                  (resource_id, resource_version, profile_bucket, model, why_text)
+                SELECT w.rid, w.version, w.bucket, :model, w.why
+                FROM unnest(
+                    CAST(:rids AS uuid[]),
+                    CAST(:versions AS text[]),
+                    CAST(:buckets AS text[]),
+                    CAST(:whys AS text[])
+                ) AS w(rid, version, bucket, why)
+                ON CONFLICT (resource_id, resource_version, profile_bucket, model) DO NOTHING
+            """),
+            {
+                "rids": [r[0] for r in rows],
+                "versions": [r[1] for r in rows],
+                "buckets": [r[2] for r in rows],
+                "whys": [r[3] for r in rows],
+                "model": model,
+            }
+        )
+
+    def delete_other_versions(self, resource_id: str, resource_version: str) -> int:
+        """Borra textos de versiones anteriores del recurso (ya no se leen)"""
+        result = self.db.execute(
+            text("""
+                DELETE FROM public.resource_why_text
+                WHERE resource_id = :rid AND resource_version <> :version
+            """),
+            {"rid": resource_id, "version": resource_version}
+        )
+        return result.rowcount
@@ -0,0 +1,101 @@
+# app/repositories/weak_area_repository.py
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+from typing import List, Optional
+
+# Intentos calificados (por estudiante y curso) que cuentan para las áreas débiles
+WEAK_AREA_WINDOW = 5
+
+# Intentos calificados por (user_id, course_id), del más reciente al más antiguo
+_RANKED_ATTEMPTS = """
+    SELECT aq.id, aq.user_id, m.course_id,
+           ROW_NUMBER() OVER (PARTITION BY aq.user_id, m.course_id ORDER BY aq.date_start DESC) AS rn
+    FROM public.attempt_quiz aq
+    JOIN public.quiz q ON q.id = aq.quiz_id
+    JOIN public.topic t ON t.id = q.topic_id
+    JOIN public.module m ON m.id = t.module_id
+    WHERE aq.state = 'CALIFICADO'
+"""
+
+
+class WeakAreaRepository:
+    """Mantiene y lee public.user_topic_objective_stats"""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def _rebuild(self, scope_sql: str, params: dict, window: int):
+        """
+        Borra y recalcula las filas de los (user_id, course_id) que cumplen `scope_sql`.
+        El ON CONFLICT cubre un rebuild concurrente del mismo estudiante y curso
+        (su DELETE no ve lo que el otro insertó).
+        """
+        params = {**params, "window": window}
+        self.db.execute(text(f"""
+            DELETE FROM public.user_topic_objective_stats s
+            WHERE {scope_sql.format(alias="s")}
+        """), params)
+        return self.db.execute(text(f"""
+            WITH recent AS (
+                SELECT * FROM ({_RANKED_ATTEMPTS}) ranked
+                WHERE rn <= :window AND {scope_sql.format(alias="ranked")}
+            ),
+            window_size AS (
+                SELECT user_id, course_id, COUNT(*) AS attempts
+                FROM recent GROUP BY user_id, course_id
+            )
+            INSERT INTO public.user_topic_objective_stats
+                (user_id, course_id, topic_objective_id, fail_count, window_attempts, updated_at)
+            SELECT r.user_id, r.course_id, q.topic_objective_id, COUNT(*), MAX(w.attempts), now()
+            FROM recent r
+            JOIN window_size w ON w.user_id = r.user_id AND w.course_id = r.course_id
+            JOIN public.question_response qr ON qr.attempt_quiz_id = r.id
+            JOIN public.question q ON q.id = qr.question_id
+            WHERE qr.is_correct = FALSE
+            GROUP BY r.user_id, r.course_id, q.topic_objective_id
+            ON CONFLICT (user_id, course_id, topic_objective_id) DO UPDATE
+            SET fail_count = EXCLUDED.fail_count,
+                window_attempts = EXCLUDED.window_attempts,
+                updated_at = EXCLUDED.updated_at
+        """), params)
+
+    def refresh_for_attempt(self, attempt_id: str, window: int = WEAK_AREA_WINDOW) -> None:
+        """Recalcula el estudiante y curso del intento (llamar después de calificarlo)"""
+        owner = self.db.execute(text("""
+            SELECT aq.user_id, m.course_id
+            FROM public.attempt_quiz aq
+            JOIN public.quiz q ON q.id = aq.quiz_id
+            JOIN public.topic t ON t.id = q.topic_id
+            JOIN public.module m ON m.id = t.module_id
+            WHERE aq.id = :attempt_id
+        """), {"attempt_id": attempt_id}).fetchone()
+        if owner is None:
+            return
+        params = {"user_id": str(owner.user_id), "course_id": str(owner.course_id)}
+        # Serializa los recálculos del mismo estudiante y curso hasta el commit
+        self.db.execute(
+            text("SELECT pg_advisory_xact_lock(hashtext(:lock_key))"),
+            {"lock_key": f"weak_areas:{params['user_id']}:{params['course_id']}"},
+        )
+        self._rebuild("{alias}.user_id = :user_id AND {alias}.course_id = :course_id", params, window)
+
+    def rebuild(self, course_id: Optional[str] = None, window: int = WEAK_AREA_WINDOW) -> int:
+        """Reconstruye desde el historial (todo, o un curso); devuelve filas insertadas"""
+        if course_id:
+            result = self._rebuild("{alias}.course_id = :course_id", {"course_id": course_id}, window)
+        else:
+            result = self._rebuild("TRUE", {}, window)
+        return result.rowcount or 0
+
+    def get_weak_areas(self, user_id: str, course_id: str) -> List:
+        """Áreas débiles: lectura por la PK + join a topic_objective"""
+        return self.db.execute(text("""
+            SELECT ot.code, ot.description, s.fail_count
+            FROM public.user_topic_objective_stats s
+            JOIN public.topic_objective ot ON ot.id = s.topic_objective_id
+            WHERE s.user_id = :user_id
+              AND s.course_id = :course_id
+              AND s.fail_count >= 2  -- Al menos 2 fallos en ese objetivo
+            ORDER BY s.fail_count DESC
+            LIMIT 5  -- Top 5 áreas débiles
+        """), {"user_id": user_id, "course_id": course_id}).fetchall()
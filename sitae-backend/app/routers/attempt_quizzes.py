@@ -1,6 +1,7 @@
 # app/routers/attempt_quizzes.py
 from fastapi import APIRouter, Depends, Path, Query
 from app.deps import get_current_user, get_db
+from app.core.admission import llm_admission
 from app.services.attempt_quiz_service import AttemptQuizService
 from app.schemas.attempt_quiz import (
     AttemptQuizResponse,
@@ -70,7 +71,8 @@ async def finish_quiz_attempt(
 @router.post(
     "/{quiz_id}/attempts/{attempt_id}/finish-personalized",
     response_model=SubmitQuizOut,
-    summary="Finalizar quiz con recomendaciones personalizadas"
+    summary="Finalizar quiz con recomendaciones personalizadas",
+    dependencies=[Depends(llm_admission)]
 )
 async def finish_quiz_attempt_personalized(
     quiz_id: str = Path(..., description="ID del quiz"),
@@ -1,8 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Path
+from fastapi import APIRouter, Depends, HTTPException, status, Path, Query, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from app.db.session import get_db
 from app.core.security import get_current_user
+from app.core.admission import llm_admission
 from app.services.chat_service import ChatService
+from app.services.conversation_summary_service import ConversationSummaryService
 from app.schemas.chat import (
     ChatMessageRequest,
     ChatMessageResponse,
@@ -11,7 +14,12 @@ from app.schemas.chat import (
     SourceReference
 )
 from app.models.course import CourseUserRole
+import base64
+import json
 import logging
+import uuid
+from datetime import datetime
+from typing import Optional, Tuple
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/chat", tags=["chat"])
@@ -30,7 +38,11 @@ def verify_course_access(course_id: str, user_id: str, db: Session) -> bool:
     return enrollment is not None
 
 
-@router.post("/{course_id}/message", response_model=ChatMessageResponse)
+@router.post(
+    "/{course_id}/message",
+    response_model=ChatMessageResponse,
+    dependencies=[Depends(llm_admission)]
+)
 async def send_chat_message(
     course_id: str = Path(..., description="ID del curso"),
     request: ChatMessageRequest = ...,
@@ -73,15 +85,97 @@ async def send_chat_message(
         )
 
 
+def _sse(event: str, data) -> str:
+    """Formatea un evento server-sent-events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+@router.post("/{course_id}/message/stream", dependencies=[Depends(llm_admission)])
+async def stream_chat_message(
+    raw_request: Request,
+    course_id: str = Path(..., description="ID del curso"),
+    request: ChatMessageRequest = ...,
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Igual que POST /{course_id}/message pero responde con server-sent events
+    a medida que el modelo genera la respuesta:
+
+    - `sources`: referencias usadas como contexto (primer evento)
+    - `token`:   fragmento de texto de la respuesta
+    - `done`:    conversation_id, created_at y tokens_used (ya guardada en BD)
+    - `error`:   el procesamiento falló; no se guardó la conversación
+    """
+    if not verify_course_access(course_id, current_user["id"], db):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="No tienes acceso a este curso"
+        )
+
+    chat_service = ChatService(db)
+
+    async def event_stream():
+        events = chat_service.stream_message(
+            user_id=current_user["id"],
+            course_id=course_id,
+            message=request.message,
+            include_history=request.include_history
+        )
+        try:
+            async for event in events:
+                if await raw_request.is_disconnected():
+                    logger.info(f"Cliente desconectado del chat en curso {course_id}; stream cancelado")
+                    break
+                yield _sse(event["event"], event["data"])
+        except Exception as e:
+            logger.error(f"Error en stream de chat: {e}")
+            yield _sse("error", {"detail": "Error procesando el mensaje. Intenta nuevamente."})
+        finally:
+            # Cierra el stream del proveedor si el cliente se fue a mitad de respuesta
+            await events.aclose()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def _encode_cursor(created_at: datetime, conversation_id: str) -> str:
+    """
+    Cursor opaco y seguro en URLs: base64url (sin '=') de '<created_at ISO>,<id>'.
+    El ISO lleva '+00:00', que sin codificar llega como espacio en la query.
+    """
+    raw = f"{created_at.isoformat()},{conversation_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Cursor de _encode_cursor -> (created_at, id)"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        created_at, conversation_id = raw.rsplit(",", 1)
+        return datetime.fromisoformat(created_at), str(uuid.UUID(conversation_id))
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cursor inválido"
+        )
+
+
 @router.get("/{course_id}/history", response_model=ConversationHistoryResponse)
 async def get_chat_history(
     course_id: str = Path(..., description="ID del curso"),
-    limit: int = 20,
+    limit: int = Query(20, ge=1, le=100),
+    before: Optional[str] = Query(None, description="Cursor opaco (next_cursor de la página anterior)"),
+    include_sources: bool = Query(True, description="false omite las fuentes (vistas de lista)"),
     current_user: dict = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
-    Obtiene el historial de conversaciones del estudiante en el curso.
+    Obtiene el historial de conversaciones del estudiante en el curso,
+    de la más reciente a la más antigua, paginado por cursor.
     """
     # Verificar acceso
     if not verify_course_access(course_id, current_user["id"], db):
@@ -91,17 +185,22 @@ async def get_chat_history(
         )
     
     chat_service = ChatService(db)
+    # Se pide una fila extra para saber si hay página siguiente
     conversations = chat_service.get_conversation_history(
         user_id=current_user["id"],
         course_id=course_id,
-        limit=limit
+        limit=limit + 1,
+        before=_decode_cursor(before) if before else None,
+        include_sources=include_sources
     )
+    has_more = len(conversations) > limit
+    conversations = conversations[:limit]
     
     # Formatear respuesta
     history_items = []
     for conv in conversations:
         sources = []
-        if conv.sources:
+        if include_sources and conv.sources:
             for source_data in conv.sources:
                 sources.append(SourceReference(**source_data))
         
@@ -113,10 +212,12 @@ async def get_chat_history(
             sources=sources
         ))
     
+    last = conversations[-1] if conversations else None
     return ConversationHistoryResponse(
         course_id=course_id,
         conversations=history_items,
-        total=len(history_items)
+        total=len(history_items),
+        next_cursor=_encode_cursor(last.created_at, last.id) if has_more else None
     )
 
 
@@ -147,6 +248,7 @@ async def clear_chat_history(
         )
         .delete()
     )
+    ConversationSummaryService(db).delete(current_user["id"], course_id)
     
     db.commit()
     logger.info(f"Borradas {deleted} conversaciones del usuario {current_user['id']} en curso {course_id}")
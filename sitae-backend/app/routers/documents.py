@@ -1,13 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Path, UploadFile, File, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, status, Path, UploadFile, File
 from sqlalchemy.orm import Session
 from app.db.session import get_db
 from app.core.security import get_current_user
 from app.core.config import settings
+from app.repositories.background_job_repository import BackgroundJobRepository
 from app.services.embedding_service import EmbeddingService
 from app.models.chat import CourseDocument
 from app.models.course import CourseUserRole
 from app.schemas.chat import DocumentUploadRequest, DocumentProcessStatus
-from datetime import datetime
 from pathlib import Path as FilePath
 import logging
 import shutil
@@ -27,6 +27,13 @@ def get_upload_dir() -> FilePath:
     return p
 
 
+# Extensiones permitidas por tipo de documento
+ALLOWED_EXTENSIONS = {
+    "pdf": [".pdf"],
+    "code": [".py", ".ipynb"]
+}
+
+
 def verify_teacher_access(course_id: str, user_id: str, db: Session) -> bool:
     """Verifica que el usuario sea profesor del curso (role_id = 2)"""
     enrollment = (
@@ -41,55 +48,18 @@ def verify_teacher_access(course_id: str, user_id: str, db: Session) -> bool:
     return enrollment is not None
 
 
-def process_document_background(
-    document_id: str,
-    course_id: str, 
-    file_path: str,
-    document_type: str,
-    title: str,
-    db: Session
-):
-    """
-    Tarea en background para procesar documento.
-    En producción, esto debería ser un task de Celery.
-    """
-    try:
-        embedding_service = EmbeddingService()
-        
-        chunk_count = embedding_service.process_document(
-            course_id=course_id,
-            document_id=document_id,
-            file_path=file_path,
-            document_type=document_type,
-            title=title
-        )
-        
-        # Actualizar documento en BD
-        doc = db.query(CourseDocument).filter(CourseDocument.id == document_id).first()
-        if doc:
-            doc.chunk_count = chunk_count
-            doc.processed_at = datetime.utcnow()
-            db.commit()
-            
-        logger.info(f"✅ Documento {title} procesado: {chunk_count} chunks")
-        
-    except Exception as e:
-        logger.error(f"❌ Error procesando documento {title}: {e}")
-        # En producción, actualizar status a 'failed' en BD
-
-
 @router.post("/upload", response_model=DocumentProcessStatus, status_code=status.HTTP_201_CREATED)
 async def upload_document(
     course_id: str = Path(..., description="ID del curso"),
     file: UploadFile = File(...),
     document_type: str = "pdf",
-    background_tasks: BackgroundTasks = None,
     current_user: dict = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
-    Sube un documento al curso y lo procesa para embeddings.
+    Sube un documento al curso y lo encola para embeddings.
     Solo profesores pueden subir documentos.
+    El procesamiento lo hace el worker (python -m app.workers.job_worker).
     
     Tipos soportados: pdf, code (Python files)
     """
@@ -101,13 +71,8 @@ async def upload_document(
         )
     
     # Validar tipo de archivo
-    allowed_types = {
-        "pdf": [".pdf"],
-        "code": [".py", ".ipynb"]
-    }
-    
     file_ext = FilePath(file.filename).suffix.lower()
-    if document_type not in allowed_types or file_ext not in allowed_types[document_type]:
+    if document_type not in ALLOWED_EXTENSIONS or file_ext not in ALLOWED_EXTENSIONS[document_type]:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Tipo de archivo no soportado para {document_type}"
@@ -136,28 +101,24 @@ async def upload_document(
             title=file.filename,
             document_type=document_type,
             file_path=str(file_path),
-            chunk_count=0
+            chunk_count=0,
+            status="queued"
         )
         db.add(doc)
+        db.flush()
+
+        # Documento y trabajo se confirman juntos: no quedan documentos sin encolar
+        BackgroundJobRepository(db).enqueue(
+            "ingest_document",
+            {"document_id": document_id, "file_path": str(file_path)},
+            max_attempts=settings.JOB_MAX_ATTEMPTS
+        )
         db.commit()
-        db.refresh(doc)
-        
-        # Procesar en background
-        if background_tasks:
-            background_tasks.add_task(
-                process_document_background,
-                document_id=document_id,
-                course_id=course_id,
-                file_path=str(file_path),
-                document_type=document_type,
-                title=file.filename,
-                db=db
-            )
         
         return DocumentProcessStatus(
             document_id=document_id,
             title=file.filename,
-            status="processing",
+            status="queued",
             chunk_count=0
         )
         
@@ -170,6 +131,97 @@ async def upload_document(
         )
 
 
+@router.put("/{document_id}", response_model=DocumentProcessStatus)
+async def replace_document(
+    course_id: str = Path(..., description="ID del curso"),
+    document_id: str = Path(..., description="ID del documento"),
+    file: UploadFile = File(...),
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Reemplaza el archivo de un documento por una nueva versión (solo profesores).
+    La re-ingesta es incremental: solo se embeben los chunks nuevos o
+    modificados y se borran los que desaparecieron.
+    """
+    if not verify_teacher_access(course_id, current_user["id"], db):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo profesores pueden reemplazar documentos"
+        )
+
+    doc = (
+        db.query(CourseDocument)
+        .filter(
+            CourseDocument.id == document_id,
+            CourseDocument.course_id == course_id
+        )
+        .first()
+    )
+
+    if not doc:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Documento no encontrado"
+        )
+
+    file_ext = FilePath(file.filename).suffix.lower()
+    if file_ext not in ALLOWED_EXTENSIONS.get(doc.document_type, []):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Tipo de archivo no soportado para {doc.document_type}"
+        )
+
+    try:
+        # Nueva versión en un archivo nuevo: un trabajo en curso sigue leyendo el anterior
+        course_dir = get_upload_dir() / course_id
+        course_dir.mkdir(parents=True, exist_ok=True)
+        file_path = course_dir / f"{document_id}_{uuid.uuid4().hex[:8]}{file_ext}"
+
+        with file_path.open("wb") as buffer:
+            shutil.copyfileobj(file.file, buffer)
+
+        old_path = doc.file_path
+        doc.file_path = str(file_path)
+        doc.status = "queued"
+        doc.progress = 0
+        doc.error = None
+
+        # Una sola ingesta pendiente por documento: la de la versión anterior
+        # se cancela si sigue en cola; si ya corre, se detiene sola (ver ingest_document)
+        jobs = BackgroundJobRepository(db)
+        jobs.cancel_queued(
+            "ingest_document", "document_id", document_id,
+            reason="Reemplazado por una versión nueva del documento"
+        )
+        jobs.enqueue(
+            "ingest_document",
+            {"document_id": document_id, "file_path": str(file_path)},
+            max_attempts=settings.JOB_MAX_ATTEMPTS
+        )
+        db.commit()
+
+        if old_path and old_path != str(file_path) and FilePath(old_path).exists():
+            FilePath(old_path).unlink()
+
+        logger.info(f"Documento {doc.title} reemplazado, re-ingesta encolada")
+
+        return DocumentProcessStatus(
+            document_id=document_id,
+            title=doc.title,
+            status="queued",
+            chunk_count=doc.chunk_count
+        )
+
+    except Exception as e:
+        logger.error(f"Error reemplazando documento: {e}")
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error reemplazando el documento"
+        )
+
+
 @router.post("/register-link", response_model=DocumentProcessStatus, status_code=status.HTTP_201_CREATED)
 async def register_document_link(
     course_id: str = Path(..., description="ID del curso"),
@@ -198,7 +250,8 @@ async def register_document_link(
             title=request.title,
             source_url=request.source_url,
             document_type=request.document_type,
-            chunk_count=0  # Links no se procesan automáticamente
+            chunk_count=0,  # Links no se procesan automáticamente
+            status="completed"
         )
         db.add(doc)
         db.commit()
@@ -258,9 +311,11 @@ async def list_course_documents(
         DocumentProcessStatus(
             document_id=doc.id,
             title=doc.title,
-            status="completed" if doc.processed_at else "pending",
+            status=doc.status,
+            progress=doc.progress,
             chunk_count=doc.chunk_count,
-            processed_at=doc.processed_at
+            processed_at=doc.processed_at,
+            error=doc.error
         )
         for doc in documents
     ]
@@ -304,16 +359,11 @@ async def delete_document(
         if doc.file_path and FilePath(doc.file_path).exists():
             FilePath(doc.file_path).unlink()
         
-        # TODO: Borrar embeddings de ChromaDB
-        # Esto requeriría iterar sobre todos los chunks con document_id matching
-        # Por simplicidad, dejamos los chunks (no afecta mucho el storage)
-        
         # Borrar registro de BD
         db.delete(doc)
         db.commit()
         
         logger.info(f"Documento {doc.title} eliminado")
-        return None
         
     except Exception as e:
         logger.error(f"Error eliminando documento: {e}")
@@ -321,4 +371,14 @@ async def delete_document(
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error eliminando el documento"
-        )
\ No newline at end of file
+        )
+
+    # Borrar sus embeddings de ChromaDB (delete filtrado por document_id).
+    # Si falla, los chunks quedan huérfanos y los purga
+    # `python -m app.workers.vector_compaction`
+    try:
+        EmbeddingService().delete_document_chunks(course_id, document_id)
+    except Exception as e:
+        logger.error(f"❌ Error borrando chunks del documento {document_id}: {e}")
+
+    return None
\ No newline at end of file
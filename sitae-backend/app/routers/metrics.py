@@ -0,0 +1,20 @@
+# app/routers/metrics.py
+from fastapi import APIRouter, Depends
+from app.core.security import get_current_user
+from app.core.cache import cache_stats
+from app.core.admission import get_admission_controller
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+
+@router.get("/caches")
+def get_cache_metrics(current_user: dict = Depends(get_current_user)):
+    """Tamaño, hits/misses y hit rate de cada caché del proceso"""
+    return cache_stats()
+
+
+@router.get("/admission")
+async def get_admission_metrics(current_user: dict = Depends(get_current_user)):
+    """Slots en uso, cola y rechazos del control de admisión LLM"""
+    controller = get_admission_controller()
+    return await controller.stats() if controller else {"enabled": False}
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 # Request schemas
 class ChatMessageRequest(BaseModel):
@@ -28,6 +28,8 @@ class ChatMessageResponse(BaseModel):
     sources: List[SourceReference] = []
     created_at: datetime
     tokens_used: int = Field(default=0, description="Tokens consumidos en esta respuesta")
+    prompt_tokens: Dict[str, int] = Field(default_factory=dict, description="Tokens del prompt por sección (profile, weak_areas, context, history, system, message, total)")
+    cached: bool = Field(default=False, description="Respuesta servida desde la caché semántica del curso")
 
 class ConversationHistoryItem(BaseModel):
     id: str
@@ -40,11 +42,13 @@ class ConversationHistoryResponse(BaseModel):
     course_id: str
     conversations: List[ConversationHistoryItem]
     total: int
+    next_cursor: Optional[str] = Field(default=None, description="Pasar como `before` para la página siguiente; null si no hay más")
 
 class DocumentProcessStatus(BaseModel):
     document_id: str
     title: str
-    status: str = Field(..., description="'processing', 'completed', 'failed'")
+    status: str = Field(..., description="'queued', 'running', 'completed', 'failed'")
+    progress: int = Field(default=0, description="Avance de la ingesta (0-100)")
     chunk_count: int = 0
     processed_at: Optional[datetime] = None
     error: Optional[str] = None
\ No newline at end of file
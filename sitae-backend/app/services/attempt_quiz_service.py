@@ -12,6 +12,7 @@ from app.repositories.topic_repository import TopicRepository
 from app.repositories.module_repository import ModuleRepository
 from app.repositories.course_repository import CourseRepository
 from app.repositories.question_recommendation_repository import QuestionRecommendationRepository
+from app.repositories.weak_area_repository import WeakAreaRepository
 from app.models.attempt_quiz import AttemptState
 from app.schemas.attempt_quiz import (
     AttemptQuizCreate,
@@ -25,8 +26,10 @@ from app.schemas.attempt_quiz import (
     ResourceOut
 )
 from datetime import datetime
+from app.core.config import settings
 from app.services.profile_service import ProfileService
 from app.services.personalized_recommendation_service import PersonalizedRecommendationService
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
@@ -43,6 +46,7 @@ class AttemptQuizService:
         self.module_repo = ModuleRepository(db)
         self.course_repo = CourseRepository(db)
         self.qrec_repo = QuestionRecommendationRepository(db)
+        self.weak_area_repo = WeakAreaRepository(db)
 
     def _get_course_id_from_quiz(self, quiz_id: str) -> str:
         """Obtener course_id desde quiz_id"""
@@ -141,7 +145,7 @@ class AttemptQuizService:
     ) -> SubmitQuizOut:
         """
         1) Valida intento (dueño y estado).
-        2) Guarda respuestas recibidas (delete+insert por pregunta).
+        2) Guarda respuestas recibidas (reemplazo en bloque).
         3) Califica.
         4) Genera y persiste recomendaciones para incorrectas.
         5) Devuelve review detallado.
@@ -202,11 +206,11 @@ class AttemptQuizService:
             tsec = a.time_seconds
             resp_map[qid] = (opt, tsec)
 
-        # Guardar respuestas (delete+insert) y calcular
+        # Calificar en memoria; la BD se toca con pocas sentencias por conjunto,
+        # sin importar cuántas preguntas tenga el quiz
         total_max = 0.0
         total_earned = 0.0
-        incorrect_qids: list[str] = []
-        results: List[QuestionResultOut] = []
+        graded: List[Dict] = []
 
         for qid, meta in qmeta.items():
             total_max += meta["score"]
@@ -214,101 +218,86 @@ class AttemptQuizService:
             is_correct = (marked_id is not None and marked_id == meta["ok_id"])
             earned = meta["score"] if is_correct else 0.0
             total_earned += earned
-            if not is_correct:
-                incorrect_qids.append(qid)
+            graded.append({
+                "question_id": qid,
+                "is_correct": is_correct,
+                "score": earned,
+                "option_id": marked_id,
+                "time_seconds": tsec,
+            })
 
-            # DELETE previas de ese attempt+question (si existieran)
-            self.db.execute(
-                text("""DELETE FROM public.question_response
-                        WHERE attempt_quiz_id = :aid AND question_id = :qid"""),
-                {"aid": attempt_id, "qid": qid}
-            )
-            # INSERT actual
-            self.db.execute(
+        # Guardar respuestas (reemplaza las previas de esas preguntas)
+        self.question_response_repo.replace_for_attempt(attempt_id, graded)
+
+        # Texto de todas las opciones marcadas
+        marked_ids = list({g["option_id"] for g in graded if g["option_id"]})
+        option_texts: Dict[str, str] = {}
+        if marked_ids:
+            opt_rows = self.db.execute(
+                text("SELECT id, text FROM public.option WHERE id = ANY(CAST(:oids AS uuid[]))"),
+                {"oids": marked_ids}
+            ).fetchall()
+            option_texts = {str(o.id): o.text for o in opt_rows}
+
+        # Recursos de todos los objetivos fallados, ya ordenados por objetivo
+        failed_ots = list({qmeta[g["question_id"]]["ot_id"] for g in graded if not g["is_correct"]})
+        resources_by_ot: Dict[str, List[ResourceOut]] = {ot: [] for ot in failed_ots}
+        if failed_ots:
+            rec_rows = self.db.execute(
                 text("""
-                    INSERT INTO public.question_response
-                      (attempt_quiz_id, question_id, is_correct, score, option_id, time_seconds)
-                    VALUES
-                      (:aid, :qid, :ok, :score, :oid, :tsec)
+                    SELECT r.topic_objective_id, r.id, r.title, r.type, r.url,
+                           r.duration_minutes, r.is_mandatory
+                    FROM public.resource r
+                    WHERE r.topic_objective_id = ANY(CAST(:ots AS uuid[]))
+                    ORDER BY r.topic_objective_id, r.is_mandatory DESC, r."order" ASC,
+                             r.duration_minutes NULLS LAST
                 """),
-                {
-                    "aid": attempt_id,
-                    "qid": qid,
-                    "ok": is_correct,
-                    "score": earned,
-                    "oid": marked_id,
-                    "tsec": tsec
-                }
-            )
+                {"ots": failed_ots}
+            ).fetchall()
+            for rr in rec_rows:
+                resources_by_ot[str(rr.topic_objective_id)].append(ResourceOut(
+                    id=str(rr.id),
+                    title=rr.title,
+                    type=rr.type,
+                    url=rr.url,
+                    duration_min=rr.duration_minutes,
+                    mandatory=bool(rr.is_mandatory)
+                ))
 
-            # Armar objeto de salida (completar texto seleccionado si lo tenemos)
+        # Armar salida y recomendaciones por cada incorrecta
+        results: List[QuestionResultOut] = []
+        rec_rows_to_insert: List[Dict] = []
+        for g in graded:
+            qid, meta, marked_id = g["question_id"], qmeta[g["question_id"]], g["option_id"]
             selected_opt: Optional[OptionOut] = None
             if marked_id:
-                # traer texto de la opción marcada
-                opt_row = self.db.execute(
-                    text("SELECT text FROM public.option WHERE id = :oid"),
-                    {"oid": marked_id}
-                ).fetchone()
-                selected_opt = OptionOut(id=marked_id, text=opt_row.text if opt_row else "")
+                selected_opt = OptionOut(id=marked_id, text=option_texts.get(marked_id, ""))
 
-            item = QuestionResultOut(
+            recommendations: List[ResourceOut] = []
+            if not g["is_correct"]:
+                recommendations = list(resources_by_ot[meta["ot_id"]])
+                rec_rows_to_insert.extend(
+                    {"question_id": qid, "resource_id": r.id, "rank_position": idx}
+                    for idx, r in enumerate(recommendations, start=1)
+                )
+
+            results.append(QuestionResultOut(
                 question_id=qid,
                 text=meta["text"],
-                correct=is_correct,
+                correct=g["is_correct"],
                 selected_option=selected_opt,
                 correct_option=OptionOut(id=meta["ok_id"], text=meta["ok_text"]),
                 topic_objective=TopicObjectiveOut(
                     id=meta["ot_id"], code=meta["ot_code"], description=meta["ot_desc"]
                 ),
                 correct_explanation=meta["explanation"],
-                recommendations=[]
-            )
-            results.append(item)
+                recommendations=recommendations
+            ))
 
         percent = (total_earned * 100.0 / total_max) if total_max else 0.0
 
-        # Generar y persistir recomendaciones por cada incorrecta
-        for item in results:
-            if item.correct:
-                continue
-            rec_rows = self.db.execute(
-                text("""
-                    SELECT r.id, r.title, r.type, r.url, r.duration_minutes, r.is_mandatory
-                    FROM public.resource r
-                    WHERE r.topic_objective_id = :ot
-                    ORDER BY r.is_mandatory DESC, r."order" ASC, r.duration_minutes NULLS LAST
-                """),
-                {"ot": item.topic_objective.id}
-            ).fetchall()
-
-            mapped: List[ResourceOut] = []
-            for idx, rr in enumerate(rec_rows, start=1):
-                mapped.append(ResourceOut(
-                    id=str(rr.id),
-                    title=rr.title,
-                    type=rr.type,
-                    url=rr.url,
-                    duration_min=rr.duration_minutes,
-                    mandatory=bool(rr.is_mandatory)
-                ))
-                # Persistir en question_recommendation
-                self.db.execute(
-                    text("""
-                        INSERT INTO public.question_recommendation
-                          (attempt_quiz_id, question_id, resource_id, rank_position, why_text, source)
-                        VALUES (:aid, :qid, :rid, :rank, :why, :src)
-                        ON CONFLICT (question_id, attempt_quiz_id, resource_id) DO NOTHING
-                    """),
-                    {
-                        "aid": attempt_id,
-                        "qid": item.question_id,
-                        "rid": str(rr.id),
-                        "rank": idx,
-                        "why": None,
-                        "src": "filtered",   # valor fijo/por defecto   # e.g., "rule-based" / "embedding" / "llm"
-                    }
-                )
-            item.recommendations = mapped
+        # Persistir todas las recomendaciones en un solo INSERT
+        self.qrec_repo.upsert_many(attempt_id, rec_rows_to_insert, source="filtered")
 
         # Cerrar intento
         self.attempt_repo.update(attempt_id, {
@@ -317,6 +306,8 @@ class AttemptQuizService:
             "score_total": float(total_earned),
             "percent": round(percent, 2)
         })
+        # Áreas débiles del chat: recalcular con este intento ya calificado
+        self._refresh_weak_areas(attempt_id)
 
         self.db.commit()
 
@@ -472,127 +463,89 @@ class AttemptQuizService:
         
         logger.info(f"Perfil obtenido - user_profile: {bool(user_profile)}, course_profile: {bool(course_profile)}")
         
-        # Para cada pregunta INCORRECTA
-        for item in results:
-            if item.correct:
-                continue
-            
+        # Todas las preguntas INCORRECTAS juntas: en modo batch un solo request JSON,
+        # si no, en paralelo (acotado por PERSONALIZATION_MAX_CONCURRENCY).
+        # Las escrituras se juntan y se aplican en bloque después
+        incorrect = [item for item in results if not item.correct]
+        questions = [self._personalization_input(item) for item in incorrect]
+        if settings.PERSONALIZATION_BATCH_MODE and incorrect:
             try:
-                logger.info(f"Procesando pregunta incorrecta: {item.question_id}")
-                
-                # 5.1 GENERAR ANÁLISIS DEL ERROR (para la pregunta)
-                error_analysis = await rec_service.generate_error_analysis(
-                    question_text=item.text,
-                    topic_objective=item.topic_objective.description,
-                    selected_option=item.selected_option.text if item.selected_option else "No respondió",
-                    correct_option=item.correct_option.text,
-                    user_profile=user_profile,
-                    course_profile=course_profile
-                )
-                
-                logger.info(f"Análisis de error generado: {len(error_analysis)} chars")
-
-                # Guarda el análisis del sistema en comment (BD y DTO)
-                self.db.execute(
-                    text("""
-                        UPDATE public.question_response
-                        SET comment = :exp
-                        WHERE attempt_quiz_id = :aid AND question_id = :qid
-                    """),
-                    {"exp": error_analysis or "", "aid": attempt_id, "qid": item.question_id}
-                )
-
-                cr = self.db.execute(
-                    text("""SELECT comment FROM public.question_response
-                            WHERE attempt_quiz_id=:aid AND question_id=:qid"""),
-                    {"aid": attempt_id, "qid": item.question_id}
-                ).fetchone()
-                item.comment = cr.comment if cr else error_analysis
-
-
-                
-                # 5.2 OBTENER RECURSOS PERSONALIZADOS
-                personalized_recs = await rec_service.get_personalized_recommendations(
-                    topic_objective_id=item.topic_objective.id,
-                    topic_objective_description=item.topic_objective.description,
-                    question_text=item.text,
+                outcomes = await rec_service.personalize_batch(
+                    questions,
                     user_profile=user_profile,
                     course_profile=course_profile,
                     max_recommendations=3
                 )
-                
-                logger.info(f"Recursos personalizados obtenidos: {len(personalized_recs)}")
-                
-                # 5.3 AGREGAR RECURSOS A LA RESPUESTA Y PERSISTIR
-                for rec in personalized_recs:
-                    # Agregar a la respuesta
-                    item.recommendations.append(ResourceOut(
-                        id=rec["resource_id"],
-                        title=rec["title"],
-                        type=rec["type"],
-                        url=rec.get("url", ""),
-                        duration_min=rec.get("duration_min"),
-                        mandatory=bool(rec.get("mandatory", True)),
-                        why_text=rec["why_text"]
-                    ))
-                    
-                    # Persistir en BD
-                    self.db.execute(text("""
-                        INSERT INTO public.question_recommendation
-                        (attempt_quiz_id, question_id, resource_id, rank_position, why_text, source)
-                        VALUES (:aid, :qid, :rid, :rank, :why, :src)
-                        ON CONFLICT (attempt_quiz_id, question_id, resource_id) 
-                        DO UPDATE SET 
-                            why_text = EXCLUDED.why_text,
-                            rank_position = EXCLUDED.rank_position,
-                            source = EXCLUDED.source
-                    """), {
-                        "aid": attempt_id,
-                        "qid": item.question_id,
-                        "rid": rec["resource_id"],
-                        "rank": rec["rank"],
-                        "why": rec["why_text"],
-                        "src": "llm_personalized"
-                    })
-                    
-                    logger.info(f"Recurso persistido: {rec['title']}")
-            
             except Exception as e:
-                logger.error(f"Error en personalización para pregunta {item.question_id}: {e}", exc_info=True)
-                
-                # FALLBACK: usar método básico sin personalización
-                fallback_text = f"Revisa el concepto: {item.topic_objective.description}. Practica con los recursos del curso."
-
-                self.db.execute(
-                    text("""
-                        UPDATE public.question_response
-                        SET comment = :exp
-                        WHERE attempt_quiz_id = :aid AND question_id = :qid
-                    """),
-                    {"exp": fallback_text, "aid": attempt_id, "qid": item.question_id}
-                )
+                logger.error(f"Error en personalización batch: {e}", exc_info=True)
+                outcomes = [None] * len(incorrect)
+        else:
+            # Análisis y why_text ya cacheados, y recursos por objetivo: antes del
+            # fan-out; lo generado se guarda en bloque con save_generated_texts()
+            rec_service.preload_error_analyses(questions, course_profile)
+            rec_service.preload_why_texts(questions, user_profile, course_profile, max_recommendations=3)
+            outcomes = await asyncio.gather(*(
+                self._personalize_item(rec_service, question, user_profile, course_profile)
+                for question in questions
+            ))
+            rec_service.save_generated_texts()
 
-                cr = self.db.execute(
-                    text("""SELECT comment FROM public.question_response
-                            WHERE attempt_quiz_id=:aid AND question_id=:qid"""),
-                    {"aid": attempt_id, "qid": item.question_id}
-                ).fetchone()
-                item.comment = cr.comment if cr else fallback_text
+        comments: Dict[str, str] = {}
+        personalized_rows: List[Dict] = []
+        fallback_items: List[QuestionResultOut] = []
+        for item, outcome in zip(incorrect, outcomes):
+            if outcome is None:
+                fallback_items.append(item)
+                continue
+            error_analysis, personalized_recs = outcome
+            comments[item.question_id] = error_analysis or ""
+            item.comment = error_analysis
+            for rec in personalized_recs:
+                item.recommendations.append(ResourceOut(
+                    id=rec["resource_id"],
+                    title=rec["title"],
+                    type=rec["type"],
+                    url=rec.get("url", ""),
+                    duration_min=rec.get("duration_min"),
+                    mandatory=bool(rec.get("mandatory", True)),
+                    why_text=rec["why_text"]
+                ))
+                personalized_rows.append({
+                    "question_id": item.question_id,
+                    "resource_id": rec["resource_id"],
+                    "rank_position": rec["rank"],
+                    "why_text": rec["why_text"],
+                })
 
-                
-                # Obtener recursos básicos del curso
-                rec_rows = self.db.execute(
-                    text("""
-                        SELECT r.id, r.title, r.type, r.url, r.duration_minutes, r.is_mandatory
+        # FALLBACK: método básico sin personalización (top 3 recursos del OT, una sola consulta)
+        fallback_rows: List[Dict] = []
+        if fallback_items:
+            fallback_ots = list({item.topic_objective.id for item in fallback_items})
+            basic = self.db.execute(
+                text("""
+                    SELECT topic_objective_id, id, title, type, url, duration_minutes, is_mandatory
+                    FROM (
+                        SELECT r.*, ROW_NUMBER() OVER (
+                            PARTITION BY r.topic_objective_id
+                            ORDER BY r.is_mandatory DESC, r."order" ASC
+                        ) AS rn
                         FROM public.resource r
-                        WHERE r.topic_objective_id = :ot
-                        ORDER BY r.is_mandatory DESC, r."order" ASC
-                        LIMIT 3
-                    """),
-                    {"ot": item.topic_objective.id}
-                ).fetchall()
-                
-                for idx, rr in enumerate(rec_rows, start=1):
+                        WHERE r.topic_objective_id = ANY(CAST(:ots AS uuid[]))
+                    ) ranked
+                    WHERE rn <= 3
+                    ORDER BY topic_objective_id, rn
+                """),
+                {"ots": fallback_ots}
+            ).fetchall()
+            basic_by_ot: Dict[str, list] = {ot: [] for ot in fallback_ots}
+            for rr in basic:
+                basic_by_ot[str(rr.topic_objective_id)].append(rr)
+
+            for item in fallback_items:
+                fallback_text = f"Revisa el concepto: {item.topic_objective.description}. Practica con los recursos del curso."
+                comments[item.question_id] = fallback_text
+                item.comment = fallback_text
+                for idx, rr in enumerate(basic_by_ot[item.topic_objective.id], start=1):
                     item.recommendations.append(ResourceOut(
                         id=str(rr.id),
                         title=rr.title,
@@ -602,21 +555,20 @@ class AttemptQuizService:
                         mandatory=bool(rr.is_mandatory),
                         why_text=None  # Sin personalización en fallback
                     ))
-                    
-                    # Persistir sin why_text
-                    self.db.execute(text("""
-                        INSERT INTO public.question_recommendation
-                        (attempt_quiz_id, question_id, resource_id, rank_position, why_text, source)
-                        VALUES (:aid, :qid, :rid, :rank, :why, :src)
-                        ON CONFLICT (attempt_quiz_id, question_id, resource_id) DO NOTHING
-                    """), {
-                        "aid": attempt_id,
-                        "qid": item.question_id,
-                        "rid": str(rr.id),
-                        "rank": idx,
-                        "why": None,
-                        "src": "fallback_basic"
+                    fallback_rows.append({
+                        "question_id": item.question_id,
+                        "resource_id": str(rr.id),
+                        "rank_position": idx,
                     })
+
+        # Persistir análisis y recomendaciones en bloque
+        self.question_response_repo.set_comments(attempt_id, comments)
+        self.qrec_repo.upsert_many(attempt_id, personalized_rows, source="llm_personalized", update_existing=True)
+        self.qrec_repo.upsert_many(attempt_id, fallback_rows, source="fallback_basic")
+        logger.info(
+            f"Personalización: {len(incorrect) - len(fallback_items)} preguntas con LLM, "
+            f"{len(fallback_items)} con fallback, {len(personalized_rows) + len(fallback_rows)} recursos"
+        )
         
         # ========== 6. CERRAR INTENTO ==========
         self.attempt_repo.update(attempt_id, {
@@ -627,6 +579,8 @@ class AttemptQuizService:
         })
         
         logger.info(f"Intento finalizado: {attempt_id}, score: {total_earned}/{total_max}")
+        # Áreas débiles del chat: recalcular con este intento ya calificado
+        self._refresh_weak_areas(attempt_id)
         
         # ========== 7. COMMIT Y RETORNAR ==========
         self.db.commit()
@@ -640,6 +594,60 @@ class AttemptQuizService:
             questions=results
         )
     
+    @staticmethod
+    def _personalization_input(item: QuestionResultOut) -> Dict:
+        """Lo que necesita PersonalizedRecommendationService de una pregunta incorrecta"""
+        return {
+            "question_id": item.question_id,
+            "selected_option_id": item.selected_option.id if item.selected_option else None,
+            "question_text": item.text,
+            "topic_objective_id": item.topic_objective.id,
+            "topic_objective": item.topic_objective.description,
+            "selected_option": item.selected_option.text if item.selected_option else "No respondió",
+            "correct_option": item.correct_option.text,
+        }
+
+    async def _personalize_item(
+        self,
+        rec_service: PersonalizedRecommendationService,
+        question: Dict,
+        user_profile: Dict,
+        course_profile: Dict
+    ) -> Optional[Tuple[str, List[Dict]]]:
+        """
+        Análisis del error y recursos personalizados de una pregunta incorrecta,
+        en paralelo. Devuelve None si algo falla (se usa el fallback básico).
+        """
+        question_id = question["question_id"]
+        logger.info(f"Procesando pregunta incorrecta: {question_id}")
+        error_analysis, personalized_recs = await asyncio.gather(
+            rec_service.generate_error_analysis(
+                question_text=question["question_text"],
+                topic_objective=question["topic_objective"],
+                selected_option=question["selected_option"],
+                correct_option=question["correct_option"],
+                user_profile=user_profile,
+                course_profile=course_profile,
+                question_id=question_id,
+                selected_option_id=question["selected_option_id"]
+            ),
+            rec_service.get_personalized_recommendations(
+                topic_objective_id=question["topic_objective_id"],
+                topic_objective_description=question["topic_objective"],
+                question_text=question["question_text"],
+                user_profile=user_profile,
+                course_profile=course_profile,
+                max_recommendations=3
+            ),
+            return_exceptions=True
+        )
+        for outcome in (error_analysis, personalized_recs):
+            if isinstance(outcome, BaseException):
+                logger.error(f"Error en personalización para pregunta {question_id}: {outcome}", exc_info=outcome)
+                return None
+        logger.info(f"Análisis de error: {len(error_analysis)} chars, recursos personalizados: {len(personalized_recs)}")
+        return error_analysis, personalized_recs
+
     def finish_attempt(self, attempt_id: str, user_id: str) -> AttemptQuizResponse:
         """Finalizar intento y calcular puntaje"""
         db_attempt = self.attempt_repo.get_by_id(attempt_id)
@@ -673,9 +681,23 @@ class AttemptQuizService:
             "score_total": score_data["score_total"],
             "percent": score_data["percent"]
         })
+        self._refresh_weak_areas(attempt_id)
+        self.db.commit()
         
         return AttemptQuizResponse.model_validate(updated)
 
+    def _refresh_weak_areas(self, attempt_id: str) -> None:
+        """
+        Recalcula las áreas débiles del chat en un savepoint: si falla se
+        revierte solo el recálculo y la calificación se guarda igual
+        (`python -m app.workers.backfill_weak_areas` lo repara después).
+        """
+        try:
+            with self.db.begin_nested():
+                self.weak_area_repo.refresh_for_attempt(attempt_id)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudieron recalcular las áreas débiles del intento {attempt_id}: {e}")
+
     def _calculate_score(self, attempt_id: str) -> dict:
         """Calcular puntaje del intento"""
         # Obtener intento
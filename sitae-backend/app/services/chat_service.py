@@ -1,15 +1,20 @@
-from openai import OpenAI
 from sqlalchemy.orm import Session
 from app.core.config import settings
+from app.core.llm_gateway import get_llm_gateway
+from app.core.answer_cache import CachedAnswer, get_answer_cache
 from app.services.embedding_service import EmbeddingService
+from app.services.prompt_builder import PromptBudget, PromptBuilder
 from app.models.chat import Conversation
 from app.models.user import User
 from app.models.course import Course
 from app.schemas.chat import ChatMessageResponse, SourceReference
-from typing import List, Dict, Optional
+from typing import AsyncIterator, List, Dict, Optional, Tuple
 import logging
 import tiktoken
 import asyncio
+import threading
+import time
+from functools import partial
 from app.services.profile_service import ProfileService
 from typing import Dict, List
 from collections import defaultdict
@@ -21,7 +26,7 @@ logger = logging.getLogger(__name__)
 class ChatService:
     def __init__(self, db: Session):
         self.db = db
-        self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
+        self.gateway = get_llm_gateway()
         self.embedding_service = EmbeddingService()
         self.chat_model = settings.CHAT_MODEL
         
@@ -30,106 +35,51 @@ class ChatService:
         
     # app/services/chat_service.py
 
-from app.services.profile_service import ProfileService
-from sqlalchemy import text
+from app.services.profile_service import ProfileService, render_student_context
+from app.repositories.weak_area_repository import WeakAreaRepository
+from app.repositories.background_job_repository import BackgroundJobRepository
+from app.services.conversation_summary_service import ConversationSummaryService
+from app.db.timeouts import statement_timeout
+from sqlalchemy import literal, text, tuple_
+from sqlalchemy.orm import defer
+from datetime import datetime
 
 class ChatService:
     def __init__(self, db: Session):
         self.db = db
-        self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
+        self.gateway = get_llm_gateway()
         self.embedding_service = EmbeddingService()
         self.chat_model = settings.CHAT_MODEL
         self.profile_service = ProfileService(db)
+        self.weak_area_repo = WeakAreaRepository(db)
+        # La sesión SQLAlchemy no es thread-safe: las etapas que la usan se serializan
+        self._db_lock = threading.Lock()
         
         # Para contar tokens
         self.encoding = tiktoken.encoding_for_model("gpt-4")
+        self.answer_cache = get_answer_cache()  # None si está desactivada
+        self._profiles: Dict[tuple, Dict] = {}
+        self.prompt_builder = PromptBuilder(
+            count_tokens=lambda t: len(self.encoding.encode(t)),
+            budget=PromptBudget.from_settings()
+        )
     
+    def _load_profile(self, user_id: str, course_id: str) -> Dict:
+        """Perfil completo (una sola consulta por request aunque se use en varias etapas)"""
+        key = (user_id, course_id)
+        if key not in self._profiles:
+            self._profiles[key] = self.profile_service.get_complete_profile_for_agent(user_id, course_id)
+        return self._profiles[key]
+
     def _get_student_context(self, user_id: str, course_id: str) -> str:
         """
         Obtiene contexto del estudiante desde su perfil real.
+        El snapshot cacheado de ProfileService ya trae el texto renderizado.
         """
         try:
             # Obtener perfil completo
-            profile_data = self.profile_service.get_complete_profile_for_agent(
-                user_id, course_id
-            )
-            
-            learning_profile = profile_data.get("learning_profile") or {}
-            course_profile = profile_data.get("course_profile") or {}
-            
-            # Si no hay perfil, retornar contexto mínimo
-            if not learning_profile and not course_profile:
-                return "Perfil del estudiante: No disponible (aún no ha completado su perfil)."
-            
-            # Construir contexto textual
-            context_parts = ["Perfil del estudiante:"]
-            
-            # Del perfil de aprendizaje general
-            if learning_profile.get("career"):
-                context_parts.append(f"- Carrera: {learning_profile['career']}")
-            
-            if learning_profile.get("job_role"):
-                context_parts.append(f"- Ocupación actual: {learning_profile['job_role']}")
-            
-            if learning_profile.get("preferred_modalities"):
-                modalities_map = {
-                    "video": "videos",
-                    "lectura": "lecturas",
-                    "ejercicio": "ejercicios prácticos",
-                    "interactivo": "contenido interactivo"
-                }
-                modalities_text = ", ".join([
-                    modalities_map.get(m, m) 
-                    for m in learning_profile["preferred_modalities"]
-                ])
-                context_parts.append(f"- Prefiere aprender con: {modalities_text}")
-            
-            if learning_profile.get("devices"):
-                devices_map = {
-                    "laptop_pc": "laptop/PC",
-                    "movil": "dispositivo móvil",
-                    "tablet": "tablet"
-                }
-                devices_text = ", ".join([
-                    devices_map.get(d, d) 
-                    for d in learning_profile["devices"]
-                ])
-                context_parts.append(f"- Estudia desde: {devices_text}")
-            
-            # Del perfil del curso
-            if course_profile.get("prereq_level"):
-                level_map = {
-                    "bajo": "principiante/básico",
-                    "medio": "intermedio",
-                    "avanzado": "avanzado"
-                }
-                level_text = level_map.get(course_profile["prereq_level"], course_profile["prereq_level"])
-                context_parts.append(f"- Nivel en el curso: {level_text}")
-            
-            if course_profile.get("weekly_time"):
-                time_map = {
-                    "h1_3": "1-3 horas semanales (tiempo limitado)",
-                    "h3_6": "3-6 horas semanales (tiempo moderado)",
-                    "h6_10": "6-10 horas semanales (buen tiempo disponible)",
-                    "h10_plus": "más de 10 horas semanales (dedicación alta)"
-                }
-                time_text = time_map.get(course_profile["weekly_time"], course_profile["weekly_time"])
-                context_parts.append(f"- Tiempo de dedicación: {time_text}")
-            
-            if course_profile.get("goals"):
-                goals_map = {
-                    "aprobar": "aprobar el curso",
-                    "mejorar_nota": "mejorar su nota",
-                    "dominar": "dominar los conceptos a profundidad",
-                    "aplicar_trabajo": "aplicar los conocimientos en su trabajo"
-                }
-                goals_text = ", ".join([
-                    goals_map.get(g, g) 
-                    for g in course_profile["goals"]
-                ])
-                context_parts.append(f"- Objetivos: {goals_text}")
-            
-            return "\n".join(context_parts)
+            profile_data = self._load_profile(user_id, course_id)
+            return profile_data.get("student_context") or render_student_context(profile_data)
         
         except Exception as e:
             logger.error(f"Error obteniendo contexto del estudiante: {e}")
@@ -138,46 +88,12 @@ class ChatService:
     def _get_weak_areas(self, user_id: str, course_id: str) -> str:
         """
         Obtiene áreas débiles del estudiante basado en sus quizzes fallidos.
-        Analiza los últimos intentos para identificar objetivos temáticos problemáticos.
+        Lee la proyección por objetivo temático que se actualiza al calificar cada intento.
         """
         try:
-            # Query corregida (quitar DISTINCT o agregar date_start al SELECT)
-            rows = self.db.execute(text("""
-                WITH recent_attempts AS (
-                    -- Últimos 5 intentos del estudiante en este curso
-                    SELECT aq.id
-                    FROM attempt_quiz aq
-                    JOIN quiz q ON q.id = aq.quiz_id
-                    JOIN topic t ON t.id = q.topic_id
-                    JOIN module m ON m.id = t.module_id
-                    WHERE aq.user_id = :user_id
-                    AND m.course_id = :course_id
-                    AND aq.state = 'CALIFICADO'
-                    ORDER BY aq.date_start DESC
-                    LIMIT 5
-                ),
-                failed_questions AS (
-                    -- Preguntas falladas en esos intentos
-                    SELECT 
-                        qr.question_id,
-                        q.topic_objective_id
-                    FROM question_response qr
-                    JOIN question q ON q.id = qr.question_id
-                    WHERE qr.attempt_quiz_id IN (SELECT id FROM recent_attempts)
-                    AND qr.is_correct = FALSE
-                )
-                -- Agrupar por objetivo temático y contar fallos
-                SELECT 
-                    ot.code,
-                    ot.description,
-                    COUNT(*) as fail_count
-                FROM failed_questions fq
-                JOIN topic_objective ot ON ot.id = fq.topic_objective_id
-                GROUP BY ot.id, ot.code, ot.description
-                HAVING COUNT(*) >= 2  -- Al menos 2 fallos en ese objetivo
-                ORDER BY fail_count DESC
-                LIMIT 5  -- Top 5 áreas débiles
-            """), {"user_id": user_id, "course_id": course_id}).fetchall()
+            # Proyección mantenida al calificar intentos (user_topic_objective_stats):
+            # top 5 objetivos con >= 2 fallos en los últimos 5 intentos calificados
+            rows = self.weak_area_repo.get_weak_areas(user_id, course_id)
             
             if not rows:
                 return "Áreas de oportunidad: No se han detectado dificultades recurrentes (aún no ha realizado suficientes quizzes o ha tenido buen desempeño)."
@@ -213,7 +129,8 @@ class ChatService:
         course_name: str,
         student_context: str,
         weak_areas: str,
-        relevant_content: List[str]
+        relevant_content: List[str],
+        conversation_summary: str = ""
     ) -> str:
         """Construye el prompt del sistema con todo el contexto"""
         
@@ -222,6 +139,8 @@ class ChatService:
             content_context = "\n\nMaterial de referencia del curso:\n"
             for i, content in enumerate(relevant_content, 1):
                 content_context += f"\n[Fuente {i}]\n{content}\n"
+        if conversation_summary:
+            content_context += f"\n\nResumen de la conversación previa con el estudiante:\n{conversation_summary}\n"
         
         return f"""Eres un asistente pedagógico experto para el curso "{course_name}".
 
@@ -283,6 +202,274 @@ class ChatService:
             total += len(self.encoding.encode(msg["content"]))
         return total
     
+    async def _run_stage(self, name: str, fn, *args, timeout: float, fallback, uses_db: bool = True):
+        """
+        Ejecuta una etapa bloqueante en un thread con timeout. Si tarda o falla
+        se usa `fallback` y la respuesta sigue sin ese contexto. En las etapas
+        con BD el timeout corre desde que la etapa obtiene el lock de la sesión
+        (la espera detrás de otras etapas no cuenta), el servidor cancela la
+        consulta al vencer, y una etapa abandonada antes de obtener el lock ya
+        no toca la sesión (el request pudo haber terminado y cerrado la sesión).
+        """
+        started = time.perf_counter()
+        try:
+            if uses_db:
+                return await self._run_db_stage(fn, *args, timeout=timeout)
+            return await asyncio.wait_for(asyncio.to_thread(fn, *args), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⏱️ Etapa '{name}' superó {timeout}s; se continúa sin ella")
+        except Exception as e:
+            logger.error(f"Error en etapa '{name}': {e}")
+        finally:
+            logger.debug(f"Etapa '{name}': {(time.perf_counter() - started) * 1000:.0f} ms")
+        return fallback
+
+    async def _run_db_stage(self, fn, *args, timeout: float):
+        loop = asyncio.get_running_loop()
+        acquired = loop.create_future()
+        abandoned = threading.Event()
+
+        def mark_acquired():
+            if not acquired.done():
+                acquired.set_result(None)
+
+        def call():
+            with self._db_lock:
+                # Vencida o cancelada mientras esperaba el lock: no se ejecuta
+                if abandoned.is_set():
+                    return None
+                loop.call_soon_threadsafe(mark_acquired)
+                with statement_timeout(self.db, timeout):
+                    return fn(*args)
+
+        task = asyncio.ensure_future(asyncio.to_thread(call))
+        # Si se abandona, su resultado o error ya no lo lee nadie
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        try:
+            await asyncio.wait({acquired, task}, return_when=asyncio.FIRST_COMPLETED)
+            return await asyncio.wait_for(asyncio.shield(task), timeout=timeout)
+        finally:
+            abandoned.set()
+            acquired.cancel()
+
+    def _locked(self, fn, *args, timeout: Optional[float] = None):
+        """Usa la sesión con el lock; con `timeout`, sus consultas se cancelan al vencer"""
+        with self._db_lock, statement_timeout(self.db, timeout):
+            return fn(*args)
+
+    def _get_course(self, course_id: str):
+        return self.db.query(Course).filter(Course.id == course_id).first()
+
+    async def _prepare_messages(
+        self,
+        user_id: str,
+        course_id: str,
+        message: str,
+        include_history: bool
+    ) -> Tuple[List[Dict], Dict, Dict[str, int]]:
+        """
+        Pasos 1-5: curso, RAG, contexto del estudiante y mensajes para el LLM.
+        Devuelve (messages, search_results recortado a los chunks usados, tokens por sección).
+
+        La búsqueda RAG (embedding + vector store) corre en paralelo con las
+        consultas SQL, que comparten la sesión y van de a una. Cada etapa tiene
+        timeout y valor por defecto: la latencia queda cerca de la etapa más
+        lenta y no de la suma.
+        """
+        # 2. Buscar contenido relevante (RAG): arranca primero, no usa la sesión
+        search_task = asyncio.create_task(self._run_stage(
+            "búsqueda RAG",
+            partial(
+                self.embedding_service.search_similar_content,
+                course_id=course_id,
+                query=message,
+                n_results=3  # Top 3 chunks más relevantes
+            ),
+            timeout=settings.CHAT_SEARCH_TIMEOUT_SECONDS,
+            fallback={"documents": [], "metadatas": [], "distances": []},
+            uses_db=False,
+        ))
+
+        # 1. Validar acceso al curso (obligatorio: sin curso no hay respuesta)
+        try:
+            course = await asyncio.to_thread(self._locked, self._get_course, course_id)
+            if not course:
+                raise ValueError("Curso no encontrado")
+        except BaseException:
+            search_task.cancel()
+            raise
+
+        # 3. Contexto del estudiante e historial
+        db_timeout = settings.CHAT_DB_STAGE_TIMEOUT_SECONDS
+        stages = [
+            self._run_stage("perfil", self._get_student_context, user_id, course_id,
+                            timeout=db_timeout, fallback="Perfil del estudiante: No disponible."),
+            self._run_stage("áreas débiles", self._get_weak_areas, user_id, course_id,
+                            timeout=db_timeout, fallback="Áreas de oportunidad: No disponible."),
+        ]
+        # Con memoria resumida: resumen + último turno completo en vez de los últimos 3
+        use_summary = include_history and settings.CONVERSATION_SUMMARY_ENABLED
+        if include_history:
+            stages.append(self._run_stage("historial", self._get_conversation_history, user_id, course_id,
+                                          1 if use_summary else 3, timeout=db_timeout, fallback=[]))
+        if use_summary:
+            stages.append(self._run_stage("resumen", ConversationSummaryService(self.db).get_summary,
+                                          user_id, course_id, timeout=db_timeout, fallback=""))
+        student_context, weak_areas, *rest = await asyncio.gather(*stages)
+        history = rest[0] if include_history else []
+        summary = rest[1] if use_summary else ""
+        search_results = await search_task
+
+        # 4. Recortar cada sección a su presupuesto de tokens
+        sections = self.prompt_builder.build(
+            student_context=student_context,
+            weak_areas=weak_areas,
+            chunks=search_results["documents"],
+            history=history,
+            summary=summary,
+            course_name=course.name
+        )
+        used = len(sections.chunks)
+        search_results = {key: values[:used] for key, values in search_results.items()}
+
+        # 5. Construir prompt del sistema y mensajes para el LLM
+        system_prompt = self._build_system_prompt(
+            course_name=sections.course_name,
+            student_context=sections.student_context,
+            weak_areas=sections.weak_areas,
+            relevant_content=sections.chunks,
+            conversation_summary=sections.summary
+        )
+        messages = [{"role": "system", "content": system_prompt}]
+        messages.extend(sections.history)
+        messages.append({"role": "user", "content": message})
+
+        breakdown = dict(sections.breakdown)
+        breakdown["system"] = self._count_tokens(messages[:1]) - (
+            breakdown["profile"] + breakdown["weak_areas"] + breakdown["context"] + breakdown["summary"]
+        )
+        breakdown["message"] = self._count_tokens(messages[-1:])
+        breakdown["total"] = self._count_tokens(messages)
+        logger.info(f"🧮 Tokens del prompt: {breakdown} (descartados: {sections.dropped})")
+        return messages, search_results, breakdown
+
+    def _build_sources(self, search_results: Dict) -> List[SourceReference]:
+        """Referencias a los chunks usados como contexto"""
+        sources = []
+        for i, (doc, meta, distance) in enumerate(zip(
+            search_results["documents"],
+            search_results["metadatas"],
+            search_results["distances"]
+        )):
+            # Convertir distancia a score de similitud (1 - distance normalizada)
+            relevance_score = max(0, 1 - (distance / 2))
+            
+            sources.append(SourceReference(
+                document_id=meta["document_id"],
+                document_title=meta["document_title"],
+                document_type=meta["document_type"],
+                chunk_text=doc[:200] + "..." if len(doc) > 200 else doc,
+                relevance_score=round(relevance_score, 2)
+            ))
+        return sources
+
+    def _save_conversation(
+        self,
+        user_id: str,
+        course_id: str,
+        message: str,
+        assistant_response: str,
+        sources: List[SourceReference]
+    ) -> Conversation:
+        conversation = Conversation(
+            user_id=user_id,
+            course_id=course_id,
+            message=message,
+            response=assistant_response,
+            sources=[s.dict() for s in sources] if sources else None
+        )
+        with self._db_lock:
+            self.db.add(conversation)
+            if settings.CONVERSATION_SUMMARY_ENABLED:
+                # El resumen se actualiza en el job worker, fuera del request
+                BackgroundJobRepository(self.db).enqueue(
+                    "summarize_conversation",
+                    {"user_id": user_id, "course_id": course_id},
+                    max_attempts=settings.JOB_MAX_ATTEMPTS
+                )
+            self.db.commit()
+            self.db.refresh(conversation)
+        
+        logger.info(f"✅ Conversación guardada: {conversation.id}")
+        return conversation
+
+    def _answer_cache_key(self, user_id: str, course_id: str) -> Tuple[str, str]:
+        """Bucket de perfil (prereq_level) y versión del material del curso"""
+        try:
+            course_profile = self._load_profile(user_id, course_id).get("course_profile") or {}
+            bucket = course_profile.get("prereq_level") or "sin_nivel"
+        except Exception:
+            bucket = "sin_nivel"
+        row = self.db.execute(text("""
+            SELECT COUNT(*) AS documents, MAX(processed_at) AS last_processed
+            FROM public.course_document
+            WHERE course_id = :course_id AND status = 'completed'
+        """), {"course_id": course_id}).fetchone()
+        version = f"{row.documents}:{row.last_processed}" if row else "0:None"
+        return bucket, version
+
+    def _has_conversation(self, user_id: str, course_id: str) -> bool:
+        """Hay turnos previos: el prompt llevará historial y/o resumen"""
+        return self.db.execute(text("""
+            SELECT 1 FROM public.conversation
+            WHERE user_id = :user_id AND course_id = :course_id
+            LIMIT 1
+        """), {"user_id": user_id, "course_id": course_id}).fetchone() is not None
+
+    async def _lookup_cached_answer(self, user_id: str, course_id: str, message: str, include_history: bool):
+        """
+        Busca una respuesta equivalente en la caché semántica. Devuelve
+        (CachedAnswer o None, clave para guardar la respuesta nueva o None).
+        El embedding de la consulta queda en la caché de queries y la búsqueda
+        RAG posterior lo reutiliza.
+
+        Si el prompt va a llevar historial o resumen, la pregunta puede depender
+        de la conversación ("¿y el segundo ejemplo?"): no se sirve desde la caché.
+        """
+        timeout = settings.CHAT_DB_STAGE_TIMEOUT_SECONDS
+        stages = [
+            self._run_stage("embedding de la consulta", self.embedding_service._embed_query, message,
+                            timeout=settings.CHAT_SEARCH_TIMEOUT_SECONDS, fallback=None, uses_db=False),
+            self._run_stage("clave de caché", self._answer_cache_key, user_id, course_id,
+                            timeout=timeout, fallback=None),
+        ]
+        if include_history:
+            # Ante la duda (etapa fallida) se asume que hay conversación
+            stages.append(self._run_stage("conversación previa", self._has_conversation, user_id, course_id,
+                                          timeout=timeout, fallback=True))
+        embedding, key, *has_conversation = await asyncio.gather(*stages)
+        if embedding is None or key is None:
+            return None, None
+        bucket, version = key
+        if has_conversation and has_conversation[0]:
+            return None, (bucket, embedding, version)
+        found = self.answer_cache.lookup(course_id, bucket, embedding, version)
+        if found is None:
+            return None, (bucket, embedding, version)
+        cached, similarity = found
+        logger.info(f"♻️ Respuesta desde caché semántica (similitud {similarity:.3f}, curso {course_id})")
+        return cached, None
+
+    def _store_cached_answer(self, course_id: str, cache_key, message: str, response: str,
+                             sources: List[SourceReference], prompt_tokens: Dict[str, int]) -> None:
+        # Solo respuestas sin historial ni resumen: no dependen de la conversación de un estudiante
+        if cache_key is None or prompt_tokens.get("history") or prompt_tokens.get("summary") or not response:
+            return
+        bucket, embedding, version = cache_key
+        self.answer_cache.store(course_id, bucket, embedding, version, CachedAnswer(
+            question=message, response=response, sources=[s.dict() for s in sources]
+        ))
+
     async def process_message(
         self,
         user_id: str,
@@ -294,51 +481,29 @@ class ChatService:
         Procesa un mensaje del estudiante y genera respuesta del asistente.
         """
         try:
-            # 1. Validar acceso al curso
-            course = self.db.query(Course).filter(Course.id == course_id).first()
-            if not course:
-                raise ValueError("Curso no encontrado")
-            
-            # 2. Buscar contenido relevante (RAG)
-            search_results = self.embedding_service.search_similar_content(
-                course_id=course_id,
-                query=message,
-                n_results=3  # Top 3 chunks más relevantes
-            )
-            
-            # 3. Obtener contexto del estudiante
-            student_context = self._get_student_context(user_id, course_id)
-            weak_areas = self._get_weak_areas(user_id, course_id)
-            
-            # 4. Construir prompt del sistema
-            system_prompt = self._build_system_prompt(
-                course_name=course.name,
-                student_context=student_context,
-                weak_areas=weak_areas,
-                relevant_content=search_results["documents"]
-            )
-            
-            # 5. Construir mensajes para el LLM
-            messages = [{"role": "system", "content": system_prompt}]
-            
-            # Agregar historial si se solicita
-            if include_history:
-                history = self._get_conversation_history(user_id, course_id, limit=3)
-                messages.extend(history)
-            
-            # Agregar mensaje actual
-            messages.append({"role": "user", "content": message})
-
-            #imprimir mensajes
-            print("=== Mensajes para LLM ===")
-            for m in messages:
-                print(m)
-            print("=========================")
+            # 0. Caché semántica: pregunta equivalente de otro estudiante del mismo nivel
+            cache_key = None
+            if self.answer_cache is not None:
+                cached, cache_key = await self._lookup_cached_answer(user_id, course_id, message, include_history)
+                if cached is not None:
+                    sources = [SourceReference(**s) for s in cached.sources]
+                    conversation = self._save_conversation(user_id, course_id, message, cached.response, sources)
+                    return ChatMessageResponse(
+                        conversation_id=conversation.id,
+                        message=message,
+                        response=cached.response,
+                        sources=sources,
+                        created_at=conversation.created_at,
+                        tokens_used=0,
+                        cached=True
+                    )
+
+            # 1-5. Curso, RAG, contexto y mensajes
+            messages, search_results, prompt_tokens = await self._prepare_messages(user_id, course_id, message, include_history)
             
             # 6. Llamar al LLM
             logger.info(f"Enviando {len(messages)} mensajes a {self.chat_model}")
-            response = await asyncio.to_thread(
-                self.client.chat.completions.create,
+            response = await self.gateway.chat(
                 model=self.chat_model,
                 messages=messages,
                 temperature=0.7,
@@ -349,36 +514,11 @@ class ChatService:
             tokens_used = response.usage.total_tokens
             
             # 7. Preparar referencias a fuentes
-            sources = []
-            for i, (doc, meta, distance) in enumerate(zip(
-                search_results["documents"],
-                search_results["metadatas"],
-                search_results["distances"]
-            )):
-                # Convertir distancia a score de similitud (1 - distance normalizada)
-                relevance_score = max(0, 1 - (distance / 2))
-                
-                sources.append(SourceReference(
-                    document_id=meta["document_id"],
-                    document_title=meta["document_title"],
-                    document_type=meta["document_type"],
-                    chunk_text=doc[:200] + "..." if len(doc) > 200 else doc,
-                    relevance_score=round(relevance_score, 2)
-                ))
+            sources = self._build_sources(search_results)
             
             # 8. Guardar conversación en BD
-            conversation = Conversation(
-                user_id=user_id,
-                course_id=course_id,
-                message=message,
-                response=assistant_response,
-                sources=[s.dict() for s in sources] if sources else None
-            )
-            self.db.add(conversation)
-            self.db.commit()
-            self.db.refresh(conversation)
-            
-            logger.info(f"✅ Conversación guardada: {conversation.id}")
+            conversation = self._save_conversation(user_id, course_id, message, assistant_response, sources)
+            self._store_cached_answer(course_id, cache_key, message, assistant_response, sources, prompt_tokens)
             
             return ChatMessageResponse(
                 conversation_id=conversation.id,
@@ -386,28 +526,111 @@ class ChatService:
                 response=assistant_response,
                 sources=sources,
                 created_at=conversation.created_at,
-                tokens_used=tokens_used
+                tokens_used=tokens_used,
+                prompt_tokens=prompt_tokens
             )
             
         except Exception as e:
             logger.error(f"Error procesando mensaje: {e}", exc_info=True)
-            self.db.rollback() 
+            self._locked(self.db.rollback)
+            raise
+
+    async def stream_message(
+        self,
+        user_id: str,
+        course_id: str,
+        message: str,
+        include_history: bool = True
+    ) -> AsyncIterator[Dict]:
+        """
+        Variante streaming de process_message. Produce eventos
+        {"event": ..., "data": ...} en este orden:
+          sources -> token (uno por fragmento del modelo) -> done
+        La conversación se guarda solo si el stream termina completo; si el
+        cliente se desconecta (el generador se cierra) no se persiste nada.
+        """
+        try:
+            cache_key = None
+            if self.answer_cache is not None:
+                cached, cache_key = await self._lookup_cached_answer(user_id, course_id, message, include_history)
+                if cached is not None:
+                    sources = [SourceReference(**s) for s in cached.sources]
+                    yield {"event": "sources", "data": cached.sources}
+                    yield {"event": "token", "data": cached.response}
+                    conversation = self._save_conversation(user_id, course_id, message, cached.response, sources)
+                    yield {"event": "done", "data": {
+                        "conversation_id": conversation.id,
+                        "created_at": conversation.created_at.isoformat(),
+                        "tokens_used": 0,
+                        "cached": True,
+                    }}
+                    return
+
+            messages, search_results, prompt_tokens = await self._prepare_messages(user_id, course_id, message, include_history)
+            sources = self._build_sources(search_results)
+            yield {"event": "sources", "data": [s.dict() for s in sources]}
+
+            logger.info(f"Enviando {len(messages)} mensajes a {self.chat_model} (stream)")
+            parts: List[str] = []
+            tokens_used = 0
+            async for chunk in self.gateway.chat_stream(
+                model=self.chat_model,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=1000,
+                stream_options={"include_usage": True}
+            ):
+                # El último chunk trae solo `usage` (sin choices)
+                if getattr(chunk, "usage", None):
+                    tokens_used = chunk.usage.total_tokens
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    yield {"event": "token", "data": chunk.choices[0].delta.content}
+
+            assistant_response = "".join(parts)
+            conversation = self._save_conversation(user_id, course_id, message, assistant_response, sources)
+            self._store_cached_answer(course_id, cache_key, message, assistant_response, sources, prompt_tokens)
+            yield {"event": "done", "data": {
+                "conversation_id": conversation.id,
+                "created_at": conversation.created_at.isoformat(),
+                "tokens_used": tokens_used,
+                "prompt_tokens": prompt_tokens,
+            }}
+
+        except Exception as e:
+            logger.error(f"Error procesando mensaje (stream): {e}", exc_info=True)
+            self._locked(self.db.rollback)
             raise
     
     def get_conversation_history(
         self, 
         user_id: str, 
         course_id: str,
-        limit: int = 20
+        limit: int = 20,
+        before: Optional[Tuple[datetime, str]] = None,
+        include_sources: bool = True
     ) -> List[Conversation]:
-        """Obtiene historial de conversaciones del estudiante en el curso"""
+        """
+        Obtiene historial de conversaciones del estudiante en el curso, de la
+        más reciente a la más antigua. Paginación por cursor: `before` es el
+        (created_at, id) de la última conversación de la página anterior.
+        Usa el índice ix_conversation_user_course_created.
+        """
+        query = self.db.query(Conversation).filter(
+            Conversation.user_id == user_id,
+            Conversation.course_id == course_id
+        )
+        if before is not None:
+            created_at, conversation_id = before
+            query = query.filter(tuple_(Conversation.created_at, Conversation.id) < tuple_(
+                literal(created_at, Conversation.created_at.type),
+                literal(conversation_id, Conversation.id.type)
+            ))
+        if not include_sources:
+            query = query.options(defer(Conversation.sources))
         return (
-            self.db.query(Conversation)
-            .filter(
-                Conversation.user_id == user_id,
-                Conversation.course_id == course_id
-            )
-            .order_by(Conversation.created_at.desc())
+            query
+            .order_by(Conversation.created_at.desc(), Conversation.id.desc())
             .limit(limit)
             .all()
         )
\ No newline at end of file
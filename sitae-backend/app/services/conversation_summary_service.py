@@ -0,0 +1,169 @@
+# app/services/conversation_summary_service.py
+"""
+Memoria de conversaciones largas: un resumen acumulado por (usuario, curso).
+
+El prompt del chat lleva el resumen + solo el último turno completo, en vez
+de los últimos N turnos crudos. El resumen se actualiza fuera del request
+(job 'summarize_conversation', encolado al guardar cada conversación):
+
+- "llm":        una llamada corta al modelo de chat vía el gateway; si falla
+                o el circuito está abierto, se usa el modo extractivo.
+- "extractive": local, sin red: primera oración de cada pregunta/respuesta,
+                conservando lo más reciente dentro del presupuesto.
+"""
+import logging
+import re
+from typing import List
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.chat import ConversationSummary
+
+logger = logging.getLogger(__name__)
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s")
+# Turnos nuevos que se integran por ejecución del job
+MAX_TURNS_PER_UPDATE = 20
+CHARS_PER_TOKEN = 4
+
+
+def _first_sentence(text_value: str, max_chars: int = 160) -> str:
+    flat = " ".join((text_value or "").split())
+    sentence = _SENTENCE_END_RE.split(flat, maxsplit=1)[0]
+    return sentence if len(sentence) <= max_chars else sentence[:max_chars].rstrip() + "..."
+
+
+def extractive_summary(previous: str, turns: List, max_chars: int) -> str:
+    """Agrega una línea por turno y descarta las más antiguas si no caben"""
+    lines = [line for line in (previous or "").split("\n") if line.strip()]
+    for turn in turns:
+        lines.append(f"- Preguntó: {_first_sentence(turn.message)} | Se explicó: {_first_sentence(turn.response)}")
+    kept, used = [], 0
+    for line in reversed(lines):
+        if used + len(line) + 1 > max_chars:
+            break
+        kept.insert(0, line)
+        used += len(line) + 1
+    return "\n".join(kept)
+
+
+def llm_summary(previous: str, turns: List, max_tokens: int) -> str:
+    from app.core.llm_gateway import get_llm_gateway
+
+    transcript = "\n\n".join(f"Estudiante: {t.message}\nAsistente: {t.response}" for t in turns)
+    response = get_llm_gateway().chat_sync(
+        model=settings.CHAT_MODEL,
+        messages=[
+            {
+                "role": "system",
+                "content": (
+                    "Actualiza el resumen de una conversación entre un estudiante y su tutor. "
+                    "Conserva temas consultados, dudas recurrentes, conceptos ya explicados y "
+                    f"acuerdos. Máximo {max_tokens} tokens, en viñetas breves, sin saludos."
+                )
+            },
+            {
+                "role": "user",
+                "content": f"Resumen actual:\n{previous or '(vacío)'}\n\nTurnos nuevos:\n{transcript}"
+            }
+        ],
+        temperature=0.2,
+        max_tokens=max_tokens
+    )
+    return (response.choices[0].message.content or "").strip()
+
+
+class ConversationSummaryService:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def get_summary(self, user_id: str, course_id: str) -> str:
+        row = (
+            self.db.query(ConversationSummary)
+            .filter(
+                ConversationSummary.user_id == user_id,
+                ConversationSummary.course_id == course_id
+            )
+            .first()
+        )
+        return row.summary if row else ""
+
+    def summarize(self, previous: str, turns: List) -> str:
+        max_tokens = settings.CONVERSATION_SUMMARY_MAX_TOKENS
+        if settings.CONVERSATION_SUMMARY_MODE == "llm":
+            try:
+                summary = llm_summary(previous, turns, max_tokens)
+                if summary:
+                    return summary
+            except Exception as e:
+                logger.warning(f"Resumen LLM no disponible, se usa el extractivo: {e}")
+        return extractive_summary(previous, turns, max_tokens * CHARS_PER_TOKEN)
+
+    def update(self, user_id: str, course_id: str) -> int:
+        """
+        Integra al resumen los turnos aún no cubiertos (todos menos el más
+        reciente). Idempotente; el FOR UPDATE serializa workers concurrentes
+        del mismo (usuario, curso). Devuelve cuántos turnos se agregaron.
+        """
+        params = {"user_id": user_id, "course_id": course_id}
+        self.db.execute(text("""
+            INSERT INTO public.conversation_summary (user_id, course_id, summary, turns_covered)
+            VALUES (:user_id, :course_id, '', 0)
+            ON CONFLICT (user_id, course_id) DO NOTHING
+        """), params)
+        current = self.db.execute(text("""
+            SELECT summary, covered_until_at, covered_until_id
+            FROM public.conversation_summary
+            WHERE user_id = :user_id AND course_id = :course_id
+            FOR UPDATE
+        """), params).fetchone()
+
+        turns = self.db.execute(text("""
+            WITH newest AS (
+                SELECT created_at, id FROM public.conversation
+                WHERE user_id = :user_id AND course_id = :course_id
+                ORDER BY created_at DESC, id DESC
+                LIMIT 1
+            )
+            SELECT c.id, c.created_at, c.message, c.response
+            FROM public.conversation c, newest
+            WHERE c.user_id = :user_id AND c.course_id = :course_id
+              AND (c.created_at, c.id) < (newest.created_at, newest.id)
+              AND (CAST(:after_at AS timestamptz) IS NULL
+                   OR (c.created_at, c.id) > (CAST(:after_at AS timestamptz), CAST(:after_id AS uuid)))
+            ORDER BY c.created_at, c.id
+            LIMIT :limit
+        """), {
+            **params,
+            "after_at": current.covered_until_at,
+            "after_id": current.covered_until_id,
+            "limit": MAX_TURNS_PER_UPDATE,
+        }).fetchall()
+
+        if not turns:
+            self.db.commit()
+            return 0
+
+        summary = self.summarize(current.summary, turns)
+        last = turns[-1]
+        self.db.execute(text("""
+            UPDATE public.conversation_summary
+            SET summary = :summary,
+                turns_covered = turns_covered + :added,
+                covered_until_at = :last_at,
+                covered_until_id = :last_id,
+                updated_at = now()
+            WHERE user_id = :user_id AND course_id = :course_id
+        """), {**params, "summary": summary, "added": len(turns), "last_at": last.created_at, "last_id": last.id})
+        self.db.commit()
+        logger.info(f"📝 Resumen de conversación actualizado ({len(turns)} turnos) para {user_id} en {course_id}")
+        return len(turns)
+
+    def delete(self, user_id: str, course_id: str) -> None:
+        """Al borrar el historial también se borra su resumen (sin commit)"""
+        self.db.query(ConversationSummary).filter(
+            ConversationSummary.user_id == user_id,
+            ConversationSummary.course_id == course_id
+        ).delete()
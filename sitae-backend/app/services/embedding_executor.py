@@ -0,0 +1,180 @@
+# app/services/embedding_executor.py
+"""
+Ejecutor de embeddings por lotes, concurrente y consciente de rate limits.
+
+- Parte las entradas en lotes acotados por tokens y por cantidad de textos.
+- Ejecuta los lotes con concurrencia acotada sobre un cliente compartido.
+- Respeta requests/min y tokens/min con token buckets.
+- Reintenta con backoff exponencial (+ jitter) ante 429 / 5xx / errores de red.
+- Devuelve los vectores en el mismo orden que las entradas.
+"""
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Callable, List, Optional
+
+import openai
+from openai import OpenAI
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.InternalServerError,
+    openai.APIConnectionError,  # incluye APITimeoutError
+)
+
+
+class TokenBucket:
+    """Token bucket thread-safe: `rate_per_minute` unidades, recarga continua."""
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = float(rate_per_minute)
+        self.tokens = float(rate_per_minute)
+        self.fill_rate = float(rate_per_minute) / 60.0
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.fill_rate)
+        self.updated_at = now
+
+    def acquire(self, amount: float = 1.0) -> None:
+        """Bloquea hasta poder consumir `amount` (se acota a la capacidad)."""
+        amount = min(float(amount), self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.fill_rate
+            time.sleep(wait)
+
+
+def _retry_after_seconds(error: Exception) -> Optional[float]:
+    """Lee Retry-After de la respuesta HTTP si el proveedor lo envía"""
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class EmbeddingExecutor:
+    def __init__(
+        self,
+        client: OpenAI,
+        model: str,
+        count_tokens: Callable[[str], int],
+        max_batch_tokens: int = 100_000,
+        max_batch_inputs: int = 16,
+        max_concurrency: int = 4,
+        requests_per_minute: int = 3_000,
+        tokens_per_minute: int = 1_000_000,
+        max_retries: int = 5,
+        backoff_base: float = 0.5,
+        backoff_max: float = 20.0,
+    ):
+        self.client = client
+        self.model = model
+        self.count_tokens = count_tokens
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_inputs = max_batch_inputs
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.request_limiter = TokenBucket(requests_per_minute)
+        self.token_limiter = TokenBucket(tokens_per_minute)
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="embeddings")
+
+    def _make_batches(self, texts: List[str]) -> List[tuple[int, List[str], int]]:
+        """Lotes (índice inicial, textos, tokens) respetando límites de tokens e inputs"""
+        batches = []
+        start, current, current_tokens = 0, [], 0
+        for i, text in enumerate(texts):
+            n = self.count_tokens(text)
+            if current and (
+                current_tokens + n > self.max_batch_tokens
+                or len(current) >= self.max_batch_inputs
+            ):
+                batches.append((start, current, current_tokens))
+                start, current, current_tokens = i, [], 0
+            current.append(text)
+            current_tokens += n
+        if current:
+            batches.append((start, current, current_tokens))
+        return batches
+
+    def _embed_batch(self, texts: List[str], n_tokens: int) -> List[List[float]]:
+        for attempt in range(self.max_retries + 1):
+            self.request_limiter.acquire(1)
+            self.token_limiter.acquire(n_tokens)
+            try:
+                response = self.client.embeddings.create(model=self.model, input=texts)
+                # El proveedor indica la posición de cada vector
+                data = sorted(response.data, key=lambda d: d.index)
+                return [d.embedding for d in data]
+            except _RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = _retry_after_seconds(e)
+                if delay is None:
+                    delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+                    delay += random.uniform(0, delay / 2)
+                logger.warning(
+                    f"Embeddings: {type(e).__name__} en lote de {len(texts)} textos, "
+                    f"reintento {attempt + 1}/{self.max_retries} en {delay:.1f}s"
+                )
+                time.sleep(delay)
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Genera embeddings para `texts` conservando el orden de entrada"""
+        if not texts:
+            return []
+        batches = self._make_batches(texts)
+        if len(batches) == 1:
+            _, batch, n_tokens = batches[0]
+            return self._embed_batch(batch, n_tokens)
+
+        futures = [
+            (start, self._pool.submit(self._embed_batch, batch, n_tokens))
+            for start, batch, n_tokens in batches
+        ]
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        for start, future in futures:
+            for offset, vector in enumerate(future.result()):
+                results[start + offset] = vector
+        return results
+
+
+@lru_cache()
+def get_embedding_executor() -> EmbeddingExecutor:
+    """
+    Ejecutor compartido por todo el proceso: un solo cliente HTTP (keep-alive)
+    y un solo presupuesto de rate limit para todas las instancias de EmbeddingService.
+    """
+    import tiktoken
+
+    encoding = tiktoken.encoding_for_model("gpt-4")
+    from app.core.llm_gateway import get_llm_gateway
+
+    # Mismo pool HTTP que el resto de llamadas a OpenAI (max_retries=0: reintenta el ejecutor)
+    return EmbeddingExecutor(
+        client=get_llm_gateway().sync_client.with_options(timeout=120.0),
+        model=settings.EMBEDDING_MODEL,
+        count_tokens=lambda text: len(encoding.encode_ordinary(text)),
+        max_batch_tokens=settings.EMBEDDING_MAX_BATCH_TOKENS,
+        max_batch_inputs=settings.EMBEDDING_MAX_BATCH_INPUTS,
+        max_concurrency=settings.EMBEDDING_MAX_CONCURRENCY,
+        requests_per_minute=settings.EMBEDDING_RPM,
+        tokens_per_minute=settings.EMBEDDING_TPM,
+        max_retries=settings.EMBEDDING_MAX_RETRIES,
+    )
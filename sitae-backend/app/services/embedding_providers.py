@@ -0,0 +1,99 @@
+# app/services/embedding_providers.py
+"""
+Proveedores de embeddings, elegidos con settings.EMBEDDING_PROVIDER.
+
+Todo proveedor expone:
+    model: str                                  -> nombre (clave de las cachés)
+    embed(texts: List[str]) -> List[List[float]]  (mismo orden que la entrada)
+
+- "openai": EmbeddingExecutor (lotes, concurrencia, rate limits, reintentos).
+- "local":  HashingEmbeddingProvider, CPU/NumPy, sin red y determinista.
+            Sirve para tests de carga y benchmarks end-to-end en una máquina
+            sin acceso a internet; NO tiene calidad semántica de un modelo real.
+"""
+import re
+import zlib
+from functools import lru_cache
+from typing import List
+
+import numpy as np
+
+from app.core.config import settings
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+@lru_cache(maxsize=1 << 18)
+def _feature_hash(feature: str) -> int:
+    # crc32 es estable entre procesos (hash() de Python no: usa semilla aleatoria)
+    return zlib.crc32(feature.encode("utf-8"))
+
+
+class HashingEmbeddingProvider:
+    """
+    Feature hashing de palabras y trigramas de caracteres a `dimensions`
+    posiciones con signo, normalizado a norma 1 (las distancias quedan en la
+    misma escala que las de text-embedding-3-*).
+
+    Vectorizado por lote: los hashes de todos los textos se acumulan en una
+    sola llamada a np.bincount sobre la matriz (textos x dimensiones).
+    """
+
+    def __init__(self, dimensions: int = 384, ngram: int = 3):
+        self.dimensions = dimensions
+        self.ngram = ngram
+        self.model = f"local-hashing-{dimensions}"
+
+    def _features(self, text: str) -> List[str]:
+        words = _WORD_RE.findall(text.lower())
+        features = list(words)
+        n = self.ngram
+        for word in words:
+            padded = f"<{word}>"
+            features.extend(padded[i:i + n] for i in range(max(1, len(padded) - n + 1)))
+        return features
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        rows, hashes = [], []
+        for row, text in enumerate(texts):
+            features = self._features(text)
+            rows.extend([row] * len(features))
+            hashes.extend(_feature_hash(f) for f in features)
+
+        hashes = np.asarray(hashes, dtype=np.uint32)
+        rows = np.asarray(rows, dtype=np.int64)
+        buckets = (hashes % self.dimensions).astype(np.int64)
+        # Un bit del hash decide el signo: reduce el sesgo de las colisiones
+        signs = np.where((hashes >> 31) & 1, -1.0, 1.0)
+
+        matrix = np.bincount(
+            rows * self.dimensions + buckets,
+            weights=signs,
+            minlength=len(texts) * self.dimensions,
+        ).reshape(len(texts), self.dimensions)
+
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (matrix / norms).astype(np.float32).tolist()
+
+
+def _openai_provider():
+    from app.services.embedding_executor import get_embedding_executor
+    return get_embedding_executor()
+
+
+EMBEDDING_PROVIDERS = {
+    "openai": _openai_provider,
+    "local": lambda: HashingEmbeddingProvider(dimensions=settings.LOCAL_EMBEDDING_DIMENSIONS),
+}
+
+
+@lru_cache()
+def get_embedding_provider():
+    """Proveedor de embeddings del proceso según settings.EMBEDDING_PROVIDER"""
+    try:
+        return EMBEDDING_PROVIDERS[settings.EMBEDDING_PROVIDER]()
+    except KeyError:
+        raise ValueError(f"EMBEDDING_PROVIDER desconocido: {settings.EMBEDDING_PROVIDER}")
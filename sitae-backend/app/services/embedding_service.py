@@ -1,19 +1,100 @@
-from openai import OpenAI
 from app.core.config import settings
 from app.core.vector_store import get_vector_store, get_course_collection_name
+from app.core.embedding_cache import get_embedding_cache, pack_vector, text_hash, unpack_vector
+from app.core.cache import make_cache
 from PyPDF2 import PdfReader
 import logging
-import uuid
-from typing import List, Dict
+import os
+import re
+import unicodedata
+from typing import Callable, List, Dict, Iterable, Iterator, Optional
+from itertools import islice
+from functools import lru_cache
 import tiktoken
+from app.services.text_chunker import ChunkingConfig, WordWindowChunker, get_chunker
+from app.services.embedding_providers import get_embedding_provider
 
 logger = logging.getLogger(__name__)
 
+# Estrategia de chunking por tipo de documento (ver app/services/text_chunker.py)
+CHUNKING_BY_DOCUMENT_TYPE = {
+    "pdf": ChunkingConfig(strategy="words", max_tokens=500, overlap=50),
+    # Cortes por contenido: una edición no corre las ventanas del resto del archivo
+    "code": ChunkingConfig(strategy="lines", max_tokens=500, overlap=64),
+}
+SUPPORTED_DOCUMENT_TYPES = set(CHUNKING_BY_DOCUMENT_TYPE)
+
+
+_QUERY_PUNCT_RE = re.compile(r"^[\s¿¡?!.,;:]+|[\s¿¡?!.,;:]+$")
+
+
+def normalize_query(query: str) -> str:
+    """Clave de caché: '¿Qué es una  lista?' y 'qué es una lista' comparten embedding"""
+    query = unicodedata.normalize("NFC", query).lower()
+    return _QUERY_PUNCT_RE.sub("", " ".join(query.split()))
+
+
+@lru_cache()
+def get_query_embedding_cache():
+    """LRU + TTL de query normalizada -> embedding, compartida por el proceso (y por Redis si existe)"""
+    return make_cache(
+        "query_embeddings",
+        maxsize=settings.QUERY_EMBEDDING_CACHE_SIZE,
+        ttl=settings.QUERY_EMBEDDING_CACHE_TTL,
+        dumps=pack_vector,
+        loads=unpack_vector,
+    )
+
+
+def _batched(items: Iterable, size: int) -> Iterator[list]:
+    """Agrupa un iterable en listas de como máximo `size` elementos"""
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class _ReadProgress:
+    """Cuánto del documento se leyó (páginas o caracteres)"""
+
+    def __init__(self):
+        self.done = 0
+        self.total = 0
+
+    @property
+    def fraction(self) -> float:
+        return min(1.0, self.done / self.total) if self.total else 0.0
+
+
+def _iter_file_blocks(
+    file_path: str,
+    block_chars: int = 32_000,
+    progress: Optional[_ReadProgress] = None,
+) -> Iterator[str]:
+    """Lee un archivo de texto en bloques de líneas completas de ~block_chars"""
+    progress = progress or _ReadProgress()
+    progress.total = os.path.getsize(file_path)
+    with open(file_path, 'r', encoding='utf-8') as f:
+        block = []
+        size = 0
+        for line in f:
+            block.append(line)
+            size += len(line)
+            if size >= block_chars:
+                progress.done += size
+                yield "".join(block)
+                block, size = [], 0
+        if block:
+            progress.done += size
+            yield "".join(block)
+
 class EmbeddingService:
     def __init__(self):
-        self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
+        # Proveedor compartido (settings.EMBEDDING_PROVIDER): OpenAI o local
+        self.provider = get_embedding_provider()
         self.vector_store = get_vector_store()
-        self.embedding_model = settings.EMBEDDING_MODEL
+        self.cache = get_embedding_cache()
+        self.query_cache = get_query_embedding_cache()
+        self.embedding_model = self.provider.model
         
         # Para contar tokens
         self.encoding = tiktoken.encoding_for_model("gpt-4")
@@ -22,124 +103,251 @@ class EmbeddingService:
         """
         Divide texto en chunks con overlap para no perder contexto.
         """
-        words = text.split()
-        chunks = []
-        current_chunk = []
-        current_tokens = 0
-        
-        for word in words:
-            word_tokens = len(self.encoding.encode(word))
-            
-            if current_tokens + word_tokens > max_tokens and current_chunk:
-                # Guardar chunk actual
-                chunks.append(" ".join(current_chunk))
-                
-                # Empezar nuevo chunk con overlap
-                overlap_words = current_chunk[-overlap:] if len(current_chunk) > overlap else current_chunk
-                current_chunk = overlap_words + [word]
-                current_tokens = sum(len(self.encoding.encode(w)) for w in current_chunk)
-            else:
-                current_chunk.append(word)
-                current_tokens += word_tokens
-        
-        # Último chunk
-        if current_chunk:
-            chunks.append(" ".join(current_chunk))
-        
-        return chunks
+        return WordWindowChunker(self.encoding, max_tokens=max_tokens, overlap=overlap).split(text)
     
-    def _extract_text_from_pdf(self, file_path: str) -> str:
-        """Extrae texto de un PDF"""
+    def _iter_pdf_pages(self, file_path: str, progress: Optional[_ReadProgress] = None) -> Iterator[str]:
+        """Extrae el texto de un PDF página por página (sin acumular el documento)"""
+        progress = progress or _ReadProgress()
         try:
             reader = PdfReader(file_path)
-            text = ""
+            progress.total = len(reader.pages)
             for page in reader.pages:
-                text += page.extract_text() + "\n"
-            return text
+                progress.done += 1
+                yield (page.extract_text() or "") + "\n"
         except Exception as e:
             logger.error(f"Error extrayendo texto de PDF {file_path}: {e}")
             raise
+
+    def _extract_text_from_pdf(self, file_path: str) -> str:
+        """Extrae texto de un PDF"""
+        return "".join(self._iter_pdf_pages(file_path))
+
+    def _iter_document_segments(
+        self, file_path: str, document_type: str, progress: Optional[_ReadProgress] = None
+    ) -> Iterator[str]:
+        """Emite el documento segmento a segmento (páginas o bloques de líneas) según su tipo"""
+        if document_type == "pdf":
+            return self._iter_pdf_pages(file_path, progress)
+        if document_type == "code":
+            return _iter_file_blocks(file_path, progress=progress)
+        raise ValueError(f"Tipo de documento {document_type} no soportado para embeddings")
     
     def _generate_embeddings(self, texts: List[str]) -> List[List[float]]:
-        """Genera embeddings para una lista de textos"""
+        """Genera embeddings para una lista de textos (solo los que no están en caché van al proveedor)"""
         try:
-            response = self.client.embeddings.create(
-                model=self.embedding_model,
-                input=texts
-            )
-            return [data.embedding for data in response.data]
+            if self.cache is None:
+                return self.provider.embed(texts)
+
+            vectors = self.cache.get_many(self.embedding_model, texts)
+            missing = [i for i, v in enumerate(vectors) if v is None]
+            if missing:
+                fresh = self.provider.embed([texts[i] for i in missing])
+                for i, vector in zip(missing, fresh):
+                    vectors[i] = vector
+                self.cache.put_many(self.embedding_model, ((texts[i], vectors[i]) for i in missing))
+            return vectors
         except Exception as e:
             logger.error(f"Error generando embeddings: {e}")
             raise
     
+    def _embed_query(self, query: str) -> List[float]:
+        """
+        Embedding de una query de búsqueda; las repetidas no salen a la red.
+        La forma normalizada es solo la clave: se embebe la query tal cual la
+        escribió el estudiante, y sin pasar por la caché persistente de chunks
+        (las queries la llenarían y desalojarían vectores de documentos).
+        """
+        key = (self.embedding_model, normalize_query(query))
+        embedding = self.query_cache.get(key)
+        if embedding is None:
+            embedding = self.provider.embed([query])[0]
+            self.query_cache.set(key, embedding)
+        return embedding
+
     def process_document(
         self, 
         course_id: str, 
         document_id: str,
         file_path: str,
         document_type: str,
-        title: str
+        title: str,
+        chunking: Optional[ChunkingConfig] = None,
+        on_progress: Optional[Callable[[int, float], None]] = None
     ) -> int:
         """
         Procesa un documento y guarda sus embeddings en ChromaDB.
-        
+
         Returns:
-            int: Número de chunks generados
+            int: Número de chunks del documento
         """
+        stats = self.sync_document(
+            course_id, document_id, file_path, document_type, title,
+            chunking=chunking, on_progress=on_progress
+        )
+        return stats["total"]
+
+    def sync_document(
+        self,
+        course_id: str,
+        document_id: str,
+        file_path: str,
+        document_type: str,
+        title: str,
+        chunking: Optional[ChunkingConfig] = None,
+        on_progress: Optional[Callable[[int, float], None]] = None
+    ) -> Dict[str, int]:
+        """
+        Sincroniza los chunks de un documento (nuevo o nueva versión) con ChromaDB.
+
+        Cada chunk tiene un ID estable derivado del hash de su contenido, así
+        que al reemplazar un documento solo se embeben los chunks nuevos o
+        modificados, los que desaparecieron se borran y los que no cambiaron
+        conservan su ID (solo se actualiza su metadata si cambió de posición).
+
+        Pipeline en streaming: páginas -> chunks -> lotes de embeddings -> lotes
+        en ChromaDB. Solo un lote vive en memoria a la vez, así que el consumo es
+        constante sin importar el tamaño del documento, y los primeros chunks
+        quedan disponibles para búsqueda antes de terminar de leer el archivo.
+
+        El chunking usa la estrategia del tipo de documento
+        (CHUNKING_BY_DOCUMENT_TYPE) salvo que se pase `chunking`.
+
+        `on_progress(chunks_procesados, fraccion_leida)` se llama tras cada lote.
+
+        Returns:
+            Dict con total, added, unchanged y removed
+        """
+        stats = {"total": 0, "added": 0, "unchanged": 0, "removed": 0}
+        if document_type not in SUPPORTED_DOCUMENT_TYPES:
+            logger.warning(f"Tipo de documento {document_type} no soportado para embeddings")
+            return stats
+
         try:
-            # 1. Extraer texto según tipo
-            if document_type == "pdf":
-                text = self._extract_text_from_pdf(file_path)
-            elif document_type == "code":
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    text = f.read()
-            else:
-                logger.warning(f"Tipo de documento {document_type} no soportado para embeddings")
-                return 0
-            
-            # 2. Dividir en chunks
-            chunks = self._chunk_text(text)
-            logger.info(f"Documento {title} dividido en {len(chunks)} chunks")
-            
-            if not chunks:
-                return 0
-            
-            # 3. Generar embeddings
-            embeddings = self._generate_embeddings(chunks)
-            
-            # 4. Guardar en ChromaDB
             collection_name = get_course_collection_name(course_id)
             collection = self.vector_store.get_or_create_collection(name=collection_name)
-            
-            # IDs únicos para cada chunk
-            chunk_ids = [f"{document_id}_chunk_{i}" for i in range(len(chunks))]
-            
-            # Metadatos para cada chunk
-            metadatas = [
-                {
-                    "document_id": document_id,
-                    "document_title": title,
-                    "document_type": document_type,
-                    "chunk_index": i,
-                    "course_id": course_id
-                }
-                for i in range(len(chunks))
-            ]
-            
-            collection.add(
-                ids=chunk_ids,
-                embeddings=embeddings,
-                documents=chunks,
-                metadatas=metadatas
+
+            # Lo que ya está indexado para este documento: id -> metadata
+            existing = collection.get(where={"document_id": document_id}, include=["metadatas"])
+            stored = dict(zip(existing["ids"], existing["metadatas"]))
+
+            chunker = get_chunker(self.encoding, chunking or CHUNKING_BY_DOCUMENT_TYPE[document_type])
+            progress = _ReadProgress()
+            segments = self._iter_document_segments(file_path, document_type, progress)
+
+            seen = set()
+            occurrences: Dict[str, int] = {}
+            for batch in _batched(chunker.iter_chunks(segments), settings.EMBEDDING_BATCH_SIZE):
+                new_ids, new_docs, new_metas = [], [], []
+                moved_ids, moved_metas = [], []
+
+                for chunk in batch:
+                    chunk_hash = text_hash(chunk)
+                    # Un mismo texto puede repetirse en el documento
+                    occurrence = occurrences.get(chunk_hash, 0)
+                    occurrences[chunk_hash] = occurrence + 1
+                    chunk_id = f"{document_id}_{chunk_hash[:32]}_{occurrence}"
+                    seen.add(chunk_id)
+
+                    metadata = {
+                        "document_id": document_id,
+                        "document_title": title,
+                        "document_type": document_type,
+                        "chunk_index": stats["total"],
+                        "chunk_hash": chunk_hash,
+                        "course_id": course_id
+                    }
+                    stats["total"] += 1
+
+                    if chunk_id not in stored:
+                        new_ids.append(chunk_id)
+                        new_docs.append(chunk)
+                        new_metas.append(metadata)
+                    elif stored[chunk_id] != metadata:
+                        moved_ids.append(chunk_id)
+                        moved_metas.append(metadata)
+
+                if new_ids:
+                    # upsert: si un reintento re-procesa el documento no duplica chunks
+                    collection.upsert(
+                        ids=new_ids,
+                        embeddings=self._generate_embeddings(new_docs),
+                        documents=new_docs,
+                        metadatas=new_metas
+                    )
+                if moved_ids:
+                    collection.update(ids=moved_ids, metadatas=moved_metas)
+
+                stats["added"] += len(new_ids)
+                stats["unchanged"] += len(batch) - len(new_ids)
+                logger.info(f"Documento {title}: {stats['total']} chunks procesados")
+                if on_progress:
+                    on_progress(stats["total"], progress.fraction)
+
+            vanished = [chunk_id for chunk_id in stored if chunk_id not in seen]
+            for ids in _batched(vanished, 500):
+                collection.delete(ids=ids)
+            stats["removed"] = len(vanished)
+
+            logger.info(
+                f"✅ Documento {title}: {stats['total']} chunks "
+                f"({stats['added']} nuevos, {stats['unchanged']} sin cambios, {stats['removed']} eliminados)"
             )
-            
-            logger.info(f"✅ {len(chunks)} chunks guardados para documento {title}")
-            return len(chunks)
+            return stats
             
         except Exception as e:
             logger.error(f"Error procesando documento {title}: {e}")
             raise
-    
+
+    def _get_course_collection(self, course_id: str):
+        """Colección del curso o None si todavía no existe"""
+        try:
+            return self.vector_store.get_collection(name=get_course_collection_name(course_id))
+        except Exception:
+            return None
+
+    def delete_document_chunks(self, course_id: str, document_id: str) -> int:
+        """
+        Borra todos los chunks de un documento con un delete filtrado por metadata.
+
+        Returns:
+            int: Número de chunks eliminados
+        """
+        collection = self._get_course_collection(course_id)
+        if collection is None:
+            return 0
+
+        where = {"document_id": document_id}
+        count = len(collection.get(where=where, include=[])["ids"])
+        if count:
+            collection.delete(where=where)
+        logger.info(f"🗑️ {count} chunks eliminados del documento {document_id}")
+        return count
+
+    def find_orphan_chunks(self, course_id: str, valid_document_ids: Iterable[str]) -> Dict[str, int]:
+        """Chunks del curso cuyo document_id ya no existe: {document_id: cantidad}"""
+        collection = self._get_course_collection(course_id)
+        if collection is None:
+            return {}
+
+        valid = set(valid_document_ids)
+        orphans: Dict[str, int] = {}
+        page_size = 5000
+        for offset in range(0, collection.count(), page_size):
+            page = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+            for metadata in page["metadatas"]:
+                document_id = (metadata or {}).get("document_id")
+                if document_id and document_id not in valid:
+                    orphans[document_id] = orphans.get(document_id, 0) + 1
+        return orphans
+
+    def delete_orphan_chunks(self, course_id: str, orphan_document_ids: Iterable[str]) -> None:
+        """Purga en bloque los chunks de los documentos indicados"""
+        collection = self._get_course_collection(course_id)
+        if collection is None:
+            return
+        for batch in _batched(orphan_document_ids, 100):
+            collection.delete(where={"document_id": {"$in": batch}})
+
     def search_similar_content(
         self, 
         course_id: str, 
@@ -154,7 +362,7 @@ class EmbeddingService:
         """
         try:
             # Generar embedding de la query
-            query_embedding = self._generate_embeddings([query])[0]
+            query_embedding = self._embed_query(query)
             
             # Buscar en la colección del curso
             collection_name = get_course_collection_name(course_id)
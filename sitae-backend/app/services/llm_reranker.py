@@ -11,7 +11,7 @@ logger = logging.getLogger(__name__)
 
 # LLM opcional
 try:
-    from openai import OpenAI
+    from app.core.llm_gateway import get_llm_gateway
     _HAS_OPENAI = True
 except Exception:
     _HAS_OPENAI = False
@@ -101,8 +101,7 @@ def rerank_with_llm(
     }
 
     try:
-        client = OpenAI(api_key=api_key)
-        completion = client.chat.completions.create(
+        completion = get_llm_gateway().chat_sync(
             model=model,
             temperature=temperature,
             response_format={"type": "json_object"},
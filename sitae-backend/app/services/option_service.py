@@ -7,6 +7,7 @@ from app.repositories.quiz_repository import QuizRepository
 from app.repositories.topic_repository import TopicRepository
 from app.repositories.module_repository import ModuleRepository
 from app.repositories.course_repository import CourseRepository
+from app.repositories.question_error_analysis_repository import QuestionErrorAnalysisRepository
 from app.schemas.option import (
     OptionCreate,
     OptionUpdate,
@@ -127,6 +128,9 @@ class OptionService:
             option_id, 
             option_data.model_dump(exclude_unset=True)
         )
+        # Los análisis de error cacheados de la pregunta ya no aplican
+        QuestionErrorAnalysisRepository(self.db).delete_for_question(db_option.question_id)
+        self.db.commit()
         
         # Verificar que hay al menos una opción correcta
         correct_count = self.option_repo.count_correct_options(db_option.question_id)
@@ -1,19 +1,66 @@
 # app/services/personalized_recommendation_service.py
 
-from openai import AsyncOpenAI
 from sqlalchemy.orm import Session
 from app.core.config import settings
-from typing import List, Dict, Optional
+from app.core.llm_gateway import get_llm_gateway
+from typing import List, Dict, Optional, Tuple
 from sqlalchemy import text
+from app.repositories.resource_why_text_repository import ResourceWhyTextRepository
+from app.repositories.question_error_analysis_repository import QuestionErrorAnalysisRepository
+import asyncio
+import hashlib
+import json
 import logging
 
 logger = logging.getLogger(__name__)
 
+
+def why_text_profile(user_profile: Dict, course_profile: Dict) -> Tuple[str, str, List[str]]:
+    """Lo único del perfil que usa el why_text: nivel, tiempo semanal y modalidades (normalizadas)"""
+    prereq_level = (course_profile or {}).get("prereq_level") or "medio"
+    weekly_time = (course_profile or {}).get("weekly_time") or "h3_6"
+    modalities = (user_profile or {}).get("preferred_modalities") or []
+    return prereq_level, weekly_time, sorted({str(m).strip().lower() for m in modalities if m})
+
+
+def profile_bucket(user_profile: Dict, course_profile: Dict) -> str:
+    prereq_level, weekly_time, modalities = why_text_profile(user_profile, course_profile)
+    return f"{prereq_level}|{weekly_time}|{','.join(modalities)}"
+
+
+def _content_hash(fields: List) -> str:
+    return hashlib.sha1(json.dumps(fields, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+
+def resource_version(resource: Dict, topic_description: str) -> str:
+    """Hash de los campos del recurso que entran al prompt: si cambian, el texto cacheado ya no aplica"""
+    return _content_hash([resource.get("title"), resource.get("type"), resource.get("duration_min"),
+                          resource.get("difficulty"), topic_description])
+
+
+def error_analysis_version(question: Dict) -> str:
+    """Hash de los textos de la pregunta que entran al prompt del análisis de error"""
+    return _content_hash([question["question_text"], question["topic_objective"],
+                          question["selected_option"], question["correct_option"]])
+
+
 class PersonalizedRecommendationService:
     def __init__(self, db: Session):
         self.db = db
-        self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+        self.gateway = get_llm_gateway()
         self.chat_model = settings.CHAT_MODEL
+        # Llamadas LLM simultáneas de un mismo request (análisis + why_text en paralelo)
+        self._llm_slots = asyncio.Semaphore(settings.PERSONALIZATION_MAX_CONCURRENCY)
+        # why_text cacheados por (recurso, versión, bucket de perfil, modelo)
+        self.why_cache = ResourceWhyTextRepository(db) if settings.WHY_TEXT_CACHE_ENABLED else None
+        self._new_why_texts: Dict[Tuple[str, str, str], str] = {}
+        # Modo por ítem: recursos por (objetivo, máx) y why_text precargados (ver preload_why_texts)
+        self._resources_by_ot: Dict[Tuple[str, int], List[Dict]] = {}
+        self._preloaded_why: Optional[Dict[str, str]] = None
+        # Análisis de error cacheados por (pregunta, opción marcada, nivel, versión, modelo)
+        self.analysis_cache = QuestionErrorAnalysisRepository(db) if settings.ERROR_ANALYSIS_CACHE_ENABLED else None
+        self._cached_analyses: Dict[Tuple[str, str], str] = {}
+        self._new_analyses: Dict[Tuple[str, str, str, str], str] = {}
     
     def _get_course_resources(self, topic_objective_id: str) -> list[dict]:
         """
@@ -137,16 +184,22 @@ class PersonalizedRecommendationService:
         selected_option: str,
         correct_option: str,
         user_profile: Dict,
-        course_profile: Dict
+        course_profile: Dict,
+        question_id: Optional[str] = None,
+        selected_option_id: Optional[str] = None
     ) -> str:
         """
         Genera análisis del error para la pregunta.
+        Con question_id usa/alimenta la caché (ver preload_error_analyses).
         
         Returns:
             str: Texto con análisis completo (qué falló, por qué importa, qué reforzar)
         """
         
-        prereq_level = course_profile.get("prereq_level", "medio")
+        prereq_level = (course_profile or {}).get("prereq_level") or "medio"
+        cache_key = (question_id, selected_option_id or "") if question_id else None
+        if cache_key in self._cached_analyses:
+            return self._cached_analyses[cache_key]
         
         prompt = f"""Genera un análisis breve del error (máximo 80 palabras, 3 frases).
 
@@ -177,23 +230,34 @@ Ejemplo (nivel avanzado):
 """
 
         try:
-            response = await self.client.chat.completions.create(
-                model=self.chat_model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "Eres un tutor experto que analiza errores de forma pedagógica y concisa."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=0.6,
-                max_tokens=150
-            )
+            async with self._llm_slots:
+                response = await self.gateway.chat(
+                    model=self.chat_model,
+                    messages=[
+                        {
+                            "role": "system",
+                            "content": "Eres un tutor experto que analiza errores de forma pedagógica y concisa."
+                        },
+                        {
+                            "role": "user",
+                            "content": prompt
+                        }
+                    ],
+                    temperature=0.6,
+                    max_tokens=150
+                )
             
-            return response.choices[0].message.content.strip()
+            analysis = response.choices[0].message.content.strip()
+            if cache_key:
+                self._remember_error_analysis({
+                    "question_id": question_id,
+                    "selected_option_id": selected_option_id,
+                    "question_text": question_text,
+                    "topic_objective": topic_objective,
+                    "selected_option": selected_option,
+                    "correct_option": correct_option,
+                }, prereq_level, analysis)
+            return analysis
             
         except Exception as e:
             logger.error(f"Error generando análisis: {e}")
@@ -222,7 +286,79 @@ Ejemplo (nivel avanzado):
             List con: resource_id, title, type, url, duration_min, is_external=False, rank, why_text
         """
         
-        # 1. Obtener recursos SOLO de BD (is_external siempre False)
+        # 1-3. Recursos de BD filtrados y ordenados por perfil (precargados en modo por ítem)
+        top_resources = self._resources_by_ot.get((topic_objective_id, max_recommendations))
+        if top_resources is None:
+            top_resources = self.select_resources(topic_objective_id, user_profile, course_profile, max_recommendations)
+        if not top_resources:
+            return []
+        
+        # 4. why_text CORTO para cada recurso: caché persistente o LLM (en paralelo, acotado por _llm_slots).
+        # Con preload_why_texts la lectura ya se hizo y la escritura queda para save_generated_texts()
+        deferred = self._preloaded_why is not None
+        cached = self._preloaded_why if deferred else self._cached_why_texts(
+            [(r, topic_objective_description) for r in top_resources], profile_bucket(user_profile, course_profile)
+        )
+
+        async def why_text(resource: Dict) -> str:
+            if resource["id"] in cached:
+                return cached[resource["id"]]
+            return await self._generate_resource_why_text(
+                resource=resource,
+                topic_description=topic_objective_description,
+                user_profile=user_profile,
+                course_profile=course_profile
+            )
+
+        why_texts = await asyncio.gather(*(why_text(r) for r in top_resources))
+        if not deferred:
+            self._flush_why_texts()
+        return self._to_recommendations(top_resources, why_texts)
+
+    def preload_why_texts(
+        self,
+        questions: List[Dict],
+        user_profile: Dict,
+        course_profile: Dict,
+        max_recommendations: int = 3
+    ) -> None:
+        """
+        Modo por ítem, antes del fan-out: recursos de cada objetivo (una consulta
+        por OT distinto) y why_text ya cacheados de todos ellos (una consulta).
+        Después get_personalized_recommendations no consulta ni escribe la caché;
+        los why_text nuevos se guardan con save_generated_texts().
+        `questions` como en personalize_batch.
+        """
+        topic_by_ot = {q["topic_objective_id"]: q["topic_objective"] for q in questions}
+        for ot_id in topic_by_ot:
+            key = (ot_id, max_recommendations)
+            if key in self._resources_by_ot:
+                continue
+            try:
+                self._resources_by_ot[key] = self.select_resources(
+                    ot_id, user_profile, course_profile, max_recommendations
+                )
+            except Exception as e:
+                # Sin precarga ese objetivo se reintenta (y cae al fallback) en su ítem
+                logger.error(f"Error obteniendo recursos de {ot_id}: {e}")
+        self._preloaded_why = self._cached_why_texts(
+            [
+                (r, topic_by_ot[ot_id])
+                for (ot_id, limit), resources in self._resources_by_ot.items()
+                if ot_id in topic_by_ot and limit == max_recommendations
+                for r in resources
+            ],
+            profile_bucket(user_profile, course_profile)
+        )
+
+    def select_resources(
+        self,
+        topic_objective_id: str,
+        user_profile: Dict,
+        course_profile: Dict,
+        max_recommendations: int = 3
+    ) -> List[Dict]:
+        """Recursos SOLO de BD (is_external siempre False), filtrados y ordenados por perfil"""
         course_resources = self._get_course_resources(topic_objective_id)
         
         if not course_resources:
@@ -231,27 +367,19 @@ Ejemplo (nivel avanzado):
         
         logger.info(f"Recursos obtenidos de BD: {len(course_resources)}")
         
-        # 2. Filtrar por perfil (marca flags para scoring)
+        # Filtrar por perfil (marca flags para scoring) y ordenar por score
         filtered = self._filter_by_profile(course_resources, user_profile, course_profile)
-        
-        # 3. Ordenar por score (con nueva priorización)
         scored = self._calculate_scores(filtered, user_profile, course_profile)
         top_resources = scored[:max_recommendations]
         
         logger.info(f"Top {len(top_resources)} recursos después de scoring:")
         for r in top_resources:
             logger.info(f"  - {r['title']} | difficulty: {r['difficulty']} | score: {r['score']:.1f}")
-        
-        # 4. Generar why_text CORTO para cada recurso
-        recommendations = []
-        for rank, resource in enumerate(top_resources, start=1):
-            why_text = await self._generate_resource_why_text(
-                resource=resource,
-                topic_description=topic_objective_description,
-                user_profile=user_profile,
-                course_profile=course_profile
-            )
+        return top_resources
 
+    def _to_recommendations(self, top_resources: List[Dict], why_texts: List[str]) -> List[Dict]:
+        recommendations = []
+        for rank, (resource, why_text) in enumerate(zip(top_resources, why_texts), start=1):
             recommendations.append({
                 "resource_id": resource["id"],       # SIEMPRE id de BD
                 "title": resource["title"],
@@ -262,9 +390,359 @@ Ejemplo (nivel avanzado):
                 "rank": rank,
                 "why_text": why_text
             })
-
         return recommendations
 
+    # ========== MODO BATCH: un request JSON por intento ==========
+
+    async def personalize_batch(
+        self,
+        questions: List[Dict],
+        user_profile: Dict,
+        course_profile: Dict,
+        max_recommendations: int = 3
+    ) -> List[Optional[Tuple[str, List[Dict]]]]:
+        """
+        Análisis de error + why_text de todas las preguntas incorrectas en un
+        solo request JSON (o uno cada PERSONALIZATION_BATCH_SIZE preguntas).
+
+        `questions`: dicts con question_id, selected_option_id, question_text,
+        topic_objective_id, topic_objective, selected_option y correct_option.
+
+        Devuelve, alineado con `questions`, (análisis, recomendaciones) o None
+        si no se pudieron obtener los recursos (el llamador usa su fallback).
+        Los análisis y why_text ya cacheados no se piden; lo que falte o no se pueda
+        parsear del JSON se genera con las llamadas individuales de siempre,
+        solo para esos ítems.
+        """
+        # Recursos por objetivo (una consulta por OT distinto, sin LLM)
+        resources_by_ot: Dict[str, Optional[List[Dict]]] = {}
+        topic_by_ot: Dict[str, str] = {}
+        for q in questions:
+            ot_id = q["topic_objective_id"]
+            topic_by_ot[ot_id] = q["topic_objective"]
+            if ot_id not in resources_by_ot:
+                try:
+                    resources_by_ot[ot_id] = self.select_resources(
+                        ot_id, user_profile, course_profile, max_recommendations
+                    )
+                except Exception as e:
+                    logger.error(f"Error obteniendo recursos de {ot_id}: {e}")
+                    resources_by_ot[ot_id] = None
+
+        bucket = profile_bucket(user_profile, course_profile)
+        why_texts = self._cached_why_texts(
+            [(r, topic_by_ot[ot_id]) for ot_id, rs in resources_by_ot.items() for r in rs or []], bucket
+        )
+
+        analyses = self.preload_error_analyses(questions, course_profile)
+
+        size = max(1, settings.PERSONALIZATION_BATCH_SIZE)
+        chunks = [questions[i:i + size] for i in range(0, len(questions), size)]
+        for chunk_analyses, chunk_whys in await asyncio.gather(*(
+            self._batch_feedback(chunk, resources_by_ot, analyses, why_texts, bucket, user_profile, course_profile)
+            for chunk in chunks
+        )):
+            analyses.update(chunk_analyses)
+            why_texts.update(chunk_whys)
+
+        outcomes = await asyncio.gather(*(
+            self._complete_batch_item(q, resources_by_ot[q["topic_objective_id"]], analyses.get(q["question_id"]),
+                                      why_texts, user_profile, course_profile)
+            for q in questions
+        ))
+        self.save_generated_texts()
+        return outcomes
+
+    async def _batch_feedback(
+        self,
+        chunk: List[Dict],
+        resources_by_ot: Dict[str, Optional[List[Dict]]],
+        cached_analyses: Dict[str, str],
+        cached_why: Dict[str, str],
+        bucket: str,
+        user_profile: Dict,
+        course_profile: Dict
+    ) -> Tuple[Dict[str, str], Dict[str, str]]:
+        """
+        Un request JSON para el chunk -> ({question_id: análisis}, {resource_id: why_text}).
+        El why_text no depende de la pregunta: se pide una vez por recurso no cacheado.
+        Sin nada que pedir (todo cacheado) no hay request.
+        """
+        prereq_level, weekly_time, modalities = why_text_profile(user_profile, course_profile)
+
+        # Ids cortos (P1, R1, ...) para que el modelo no tenga que copiar UUIDs
+        question_keys: Dict[str, Dict] = {}
+        resource_keys: Dict[str, Tuple[Dict, str]] = {}
+        seen = set(cached_why)
+        question_lines, resource_lines = [], []
+        for q in chunk:
+            if q["question_id"] not in cached_analyses:
+                qkey = f"P{len(question_keys) + 1}"
+                question_keys[qkey] = q
+                question_lines.append(
+                    f"[{qkey}] Pregunta: {q['question_text'][:200]}\n"
+                    f"Tema: {q['topic_objective']}\n"
+                    f"Marcó: {q['selected_option']} | Correcto: {q['correct_option']}"
+                )
+            for r in resources_by_ot.get(q["topic_objective_id"]) or []:
+                if r["id"] in seen:
+                    continue
+                seen.add(r["id"])
+                rkey = f"R{len(resource_keys) + 1}"
+                resource_keys[rkey] = (r, q["topic_objective"])
+                dur = r.get("duration_min")
+                resource_lines.append(
+                    f"[{rkey}] {r.get('title', '')} ({r.get('type', '')}, "
+                    f"{f'{dur} min' if dur is not None else 'duración variable'}, "
+                    f"{r.get('difficulty', 'intermedio')}) - Tema: {q['topic_objective']}"
+                )
+
+        if not question_lines and not resource_lines:
+            return {}, {}
+
+        prompt = f"""Para cada pregunta fallada escribe "analisis": máximo 80 palabras, 3 frases
+(qué concepto falló, por qué importa, qué reforzar).
+Para cada recurso escribe "por_que": máximo 40 palabras conectándolo con el perfil
+(nivel, modalidad, tiempo) y si su dificultad es apropiada.
+Sin emojis. Tono {"técnico y directo" if prereq_level == "avanzado" else "claro y educativo"}.
+
+PERFIL: nivel {prereq_level}, tiempo semanal {weekly_time}, prefiere {", ".join(modalities) if modalities else "no especificado"}
+
+PREGUNTAS:
+{chr(10).join(question_lines) if question_lines else "(ninguna)"}
+
+RECURSOS:
+{chr(10).join(resource_lines) if resource_lines else "(ninguno)"}
+
+Responde SOLO con JSON:
+{{"preguntas": [{{"id": "P1", "analisis": "..."}}], "recursos": [{{"id": "R1", "por_que": "..."}}]}}"""
+
+        try:
+            async with self._llm_slots:
+                response = await self.gateway.chat(
+                    model=self.chat_model,
+                    messages=[
+                        {"role": "system", "content": "Eres un tutor experto que analiza errores de forma pedagógica y concisa."},
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=0.6,
+                    max_tokens=150 * len(question_keys) + 80 * len(resource_keys),
+                    response_format={"type": "json_object"}
+                )
+            data = json.loads(response.choices[0].message.content or "{}")
+        except Exception as e:
+            logger.error(f"Error en feedback batch ({len(question_keys)} preguntas): {e}")
+            return {}, {}
+
+        def entries(key: str) -> List[Dict]:
+            value = data.get(key) if isinstance(data, dict) else None
+            return [e for e in value if isinstance(e, dict)] if isinstance(value, list) else []
+
+        analyses: Dict[str, str] = {}
+        for entry in entries("preguntas"):
+            text_value = entry.get("analisis")
+            if entry.get("id") in question_keys and isinstance(text_value, str) and text_value.strip():
+                question = question_keys[entry["id"]]
+                analyses[question["question_id"]] = text_value.strip()
+                self._remember_error_analysis(question, prereq_level, analyses[question["question_id"]])
+
+        whys: Dict[str, str] = {}
+        for entry in entries("recursos"):
+            text_value = entry.get("por_que")
+            if entry.get("id") in resource_keys and isinstance(text_value, str) and text_value.strip():
+                resource, topic = resource_keys[entry["id"]]
+                whys[resource["id"]] = text_value.strip()
+                self._remember_why_text(resource, topic, bucket, whys[resource["id"]])
+
+        logger.info(
+            f"Feedback batch: {len(analyses)}/{len(question_keys)} análisis, "
+            f"{len(whys)}/{len(resource_keys)} why_text parseados"
+        )
+        return analyses, whys
+
+    async def _complete_batch_item(
+        self,
+        question: Dict,
+        resources: Optional[List[Dict]],
+        analysis: Optional[str],
+        why_texts: Dict[str, str],
+        user_profile: Dict,
+        course_profile: Dict
+    ) -> Optional[Tuple[str, List[Dict]]]:
+        """Usa lo cacheado o parseado del batch y completa con llamadas individuales lo que falte"""
+        if resources is None:
+            return None
+
+        async def error_analysis() -> str:
+            if analysis:
+                return analysis
+            return await self.generate_error_analysis(
+                question_text=question["question_text"],
+                topic_objective=question["topic_objective"],
+                selected_option=question["selected_option"],
+                correct_option=question["correct_option"],
+                user_profile=user_profile,
+                course_profile=course_profile,
+                question_id=question["question_id"],
+                selected_option_id=question.get("selected_option_id")
+            )
+
+        async def why_text(resource: Dict) -> str:
+            if why_texts.get(resource["id"]):
+                return why_texts[resource["id"]]
+            return await self._generate_resource_why_text(
+                resource=resource,
+                topic_description=question["topic_objective"],
+                user_profile=user_profile,
+                course_profile=course_profile
+            )
+
+        result, *resource_whys = await asyncio.gather(error_analysis(), *(why_text(r) for r in resources))
+        return result, self._to_recommendations(resources, resource_whys)
+
+    # ========== CACHÉ PERSISTENTE DE ANÁLISIS DE ERROR ==========
+
+    def preload_error_analyses(self, questions: List[Dict], course_profile: Dict) -> Dict[str, str]:
+        """
+        Una consulta: análisis ya generados para (pregunta, opción marcada) con
+        este nivel. Quedan disponibles para generate_error_analysis y se
+        devuelven como {question_id: análisis}. `questions` como en personalize_batch.
+        """
+        if self.analysis_cache is None or not questions:
+            return {}
+        prereq_level = (course_profile or {}).get("prereq_level") or "medio"
+        found = self._cache_statement(
+            "análisis de error",
+            self.analysis_cache.get_many,
+            [(q["question_id"], q.get("selected_option_id") or "", error_analysis_version(q)) for q in questions],
+            prereq_level,
+            self.chat_model,
+            default={}
+        )
+        self._cached_analyses.update(found)
+        logger.info(f"Análisis de error en caché: {len(found)}/{len(questions)}")
+        return {question_id: analysis for (question_id, _), analysis in found.items()}
+
+    def _remember_error_analysis(self, question: Dict, prereq_level: str, analysis: str) -> None:
+        """Anota un análisis generado por el LLM (los textos de fallback no se cachean)"""
+        if self.analysis_cache is not None and analysis:
+            key = (question["question_id"], question.get("selected_option_id") or "",
+                   prereq_level, error_analysis_version(question))
+            self._new_analyses[key] = analysis
+
+    def save_generated_texts(self) -> None:
+        """Guarda en bloque los análisis y why_text nuevos (sin commit)"""
+        self._flush_why_texts()
+        if self.analysis_cache is None or not self._new_analyses:
+            return
+        rows = [(*key, analysis) for key, analysis in self._new_analyses.items()]
+        self._new_analyses = {}
+        self._cache_statement("análisis de error", self.analysis_cache.put_many, rows, self.chat_model)
+
+    # ========== CACHÉ PERSISTENTE DE why_text ==========
+
+    def _cache_statement(self, description: str, fn, *args, default=None):
+        """
+        Sentencia de caché en un savepoint: si falla (tabla sin migrar, timeout,
+        conflicto) se revierte solo el savepoint y cuenta como fallo de caché,
+        sin abortar la transacción del intento.
+        """
+        try:
+            with self.db.begin_nested():
+                return fn(*args)
+        except Exception as e:
+            logger.warning(f"⚠️ Caché de {description} no disponible: {e}")
+            return default
+
+    def _cached_why_texts(self, resources: List[Tuple[Dict, str]], bucket: str) -> Dict[str, str]:
+        """(recurso, tema) -> {resource_id: why_text} ya generados para este bucket (una consulta)"""
+        if self.why_cache is None or not resources:
+            return {}
+        versions = {r["id"]: resource_version(r, topic) for r, topic in resources}
+        found = self._cache_statement("why_text", self.why_cache.get_many,
+                                      list(versions.items()), bucket, self.chat_model, default={})
+        cached = {rid: found[(rid, v)] for rid, v in versions.items() if (rid, v) in found}
+        logger.info(f"why_text en caché: {len(cached)}/{len(versions)}")
+        return cached
+
+    def _remember_why_text(self, resource: Dict, topic_description: str, bucket: str, why_text: str) -> None:
+        """Anota un why_text generado por el LLM (los textos de fallback no se cachean)"""
+        if self.why_cache is not None and why_text:
+            key = (resource["id"], resource_version(resource, topic_description), bucket)
+            self._new_why_texts[key] = why_text
+
+    def _flush_why_texts(self) -> None:
+        if self.why_cache is None or not self._new_why_texts:
+            return
+        rows = [(rid, version, bucket, why) for (rid, version, bucket), why in self._new_why_texts.items()]
+        self._new_why_texts = {}
+        self._cache_statement("why_text", self.why_cache.put_many, rows, self.chat_model)
+
+    async def prewarm_why_texts(self, resource_id: str, max_buckets: int = 50) -> int:
+        """
+        Genera los why_text de un recurso para los buckets de perfil de los
+        estudiantes de su curso (los más frecuentes primero). Devuelve cuántos
+        textos nuevos quedaron guardados. No hace commit.
+        """
+        row = self.db.execute(text("""
+            SELECT r.id, r.title, r.type, r.url, r.duration_minutes, r.is_mandatory, r.difficulty,
+                   ot.description AS topic_description, m.course_id
+            FROM public.resource r
+            JOIN public.topic_objective ot ON ot.id = r.topic_objective_id
+            JOIN public.topic t ON t.id = r.topic_id
+            JOIN public.module m ON m.id = t.module_id
+            WHERE r.id = :rid
+        """), {"rid": resource_id}).fetchone()
+        if not row or self.why_cache is None:
+            return 0
+        resource = {
+            "id": str(row.id),
+            "title": row.title,
+            "type": row.type,
+            "url": row.url or "",
+            "duration_min": row.duration_minutes,
+            "is_mandatory": bool(row.is_mandatory),
+            "difficulty": row.difficulty or "intermedio",
+        }
+        version = resource_version(resource, row.topic_description)
+        self.why_cache.delete_other_versions(resource["id"], version)
+
+        profiles = self.db.execute(text("""
+            SELECT ucp.prereq_level, ucp.weekly_time, ulp.preferred_modalities
+            FROM public.user_course_profile ucp
+            LEFT JOIN public.user_learning_profile ulp ON ulp.user_id = ucp.user_id
+            WHERE ucp.course_id = :course_id
+        """), {"course_id": row.course_id}).fetchall()
+
+        # Buckets distintos, por cantidad de estudiantes
+        counts: Dict[str, int] = {}
+        examples: Dict[str, Tuple[Dict, Dict]] = {}
+        for p in profiles:
+            user_profile = {"preferred_modalities": p.preferred_modalities or []}
+            course_profile = {"prereq_level": p.prereq_level, "weekly_time": p.weekly_time}
+            bucket = profile_bucket(user_profile, course_profile)
+            counts[bucket] = counts.get(bucket, 0) + 1
+            examples.setdefault(bucket, (user_profile, course_profile))
+        buckets = sorted(counts, key=counts.get, reverse=True)[:max_buckets]
+
+        missing = [
+            b for b in buckets
+            if not self.why_cache.get_many([(resource["id"], version)], b, self.chat_model)
+        ]
+        await asyncio.gather(*(
+            self._generate_resource_why_text(
+                resource=resource,
+                topic_description=row.topic_description,
+                user_profile=examples[b][0],
+                course_profile=examples[b][1]
+            )
+            for b in missing
+        ))
+        generated = len(self._new_why_texts)
+        self._flush_why_texts()
+        logger.info(f"🔥 why_text precalculados para {resource['title']}: {generated}/{len(buckets)} buckets")
+        return generated
+
     async def _generate_resource_why_text(
         self,
         resource: Dict,
@@ -276,9 +754,7 @@ Ejemplo (nivel avanzado):
         SOLO recursos del curso. Máx 40 palabras. Sin emojis.
         Menciona nivel de dificultad si es relevante.
         """
-        prereq_level = (course_profile or {}).get("prereq_level", "medio")
-        weekly_time = (course_profile or {}).get("weekly_time", "h3_6")
-        preferred_modalities = (user_profile or {}).get("preferred_modalities", []) or []
+        prereq_level, weekly_time, preferred_modalities = why_text_profile(user_profile, course_profile)
 
         time_desc = {
             "h1_3": "poco tiempo",
@@ -312,13 +788,16 @@ Instrucciones:
 """
 
         try:
-            resp = await self.client.chat.completions.create(
-                model=self.chat_model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-                max_tokens=80
-            )
-            return (resp.choices[0].message.content or "").strip()
+            async with self._llm_slots:
+                resp = await self.gateway.chat(
+                    model=self.chat_model,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=0.7,
+                    max_tokens=80
+                )
+            why_text = (resp.choices[0].message.content or "").strip()
+            self._remember_why_text(resource, topic_description, profile_bucket(user_profile, course_profile), why_text)
+            return why_text
         except Exception as e:
             logger.error(f"Error generando why_text: {e}", exc_info=True)
             # Fallback sin emojis, menciona dificultad
@@ -15,6 +15,61 @@ from app.schemas import (
     UserCourseProfileResponse
 )
 from typing import Optional
+import json
+import logging
+import uuid
+from functools import lru_cache
+
+from app.core.cache import make_cache
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache()
+def get_profile_snapshot_cache():
+    """
+    Snapshot (user_id, course_id) -> perfil para el agente + texto renderizado.
+    Se invalida en save_complete_profile; el TTL acota lo que otro worker
+    pueda seguir viendo de su copia en memoria.
+
+    Guarda también la versión de cada usuario (clave "v:<user_id>"), que forma
+    parte de la clave de sus snapshots: cambiarla invalida todos sus cursos.
+    """
+    return make_cache(
+        "profile_snapshots",
+        maxsize=settings.PROFILE_SNAPSHOT_CACHE_SIZE,
+        ttl=settings.PROFILE_SNAPSHOT_CACHE_TTL,
+        dumps=lambda value: json.dumps(value, default=str).encode("utf-8"),
+        loads=json.loads,
+    )
+
+
+def _user_version_key(user_id: str) -> str:
+    return f"v:{user_id}"
+
+
+def _snapshot_key(user_id: str, course_id: str) -> str:
+    cache = get_profile_snapshot_cache()
+    version = cache.get(_user_version_key(user_id))
+    if version is None:
+        # Sin versión (nueva, expirada o desalojada) se abre un espacio nuevo:
+        # nunca se vuelve a una versión anterior con snapshots viejos
+        version = uuid.uuid4().hex[:12]
+        cache.set(_user_version_key(user_id), version)
+    return f"{user_id}:{version}:{course_id}"
+
+
+def invalidate_profile_snapshots(user_id: str, course_id: Optional[str] = None) -> None:
+    """
+    Invalida el snapshot de un curso, o todos los del usuario si no se indica
+    curso (el perfil de aprendizaje es común a todos sus cursos).
+    """
+    cache = get_profile_snapshot_cache()
+    if course_id is None:
+        cache.set(_user_version_key(user_id), uuid.uuid4().hex[:12])
+    else:
+        cache.delete(_snapshot_key(user_id, course_id))
 
 class ProfileService:
     """Servicio para manejar perfiles completos (general + curso)"""
@@ -110,6 +165,7 @@ class ProfileService:
             
             # CRITICAL: explicit commit to close transaction
             self.db.commit()
+            invalidate_profile_snapshots(user_id, None if learning_data else course_id)
             
             # refresh objects to get latest data after commit
             if learning_profile:
@@ -148,7 +204,14 @@ class ProfileService:
         """
         Obtener perfil completo en formato para enviar al agente.
         USO INTERNO - sin validaciones HTTP.
+        Sale del snapshot cacheado si existe; incluye `student_context` (texto para el prompt).
         """
+        cache = get_profile_snapshot_cache()
+        key = _snapshot_key(user_id, course_id)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
         try:
             learning_profile = self.learning_repo.get_by_user_id(user_id)
             course_profile = self.course_profile_repo.get_by_user_and_course(user_id, course_id)
@@ -180,7 +243,89 @@ class ProfileService:
                     "weekly_time": course_profile.weekly_time
                 }
             
+            result["student_context"] = render_student_context(result)
+            cache.set(key, result)
             return result
         except SQLAlchemyError as e:
             self.db.rollback()
-            raise
\ No newline at end of file
+            raise
+
+
+def render_student_context(profile_data: dict) -> str:
+    """Texto del perfil para el prompt del asistente (a partir de get_complete_profile_for_agent)"""
+    learning_profile = profile_data.get("learning_profile") or {}
+    course_profile = profile_data.get("course_profile") or {}
+    
+    # Si no hay perfil, retornar contexto mínimo
+    if not learning_profile and not course_profile:
+        return "Perfil del estudiante: No disponible (aún no ha completado su perfil)."
+    
+    # Construir contexto textual
+    context_parts = ["Perfil del estudiante:"]
+    
+    # Del perfil de aprendizaje general
+    if learning_profile.get("career"):
+        context_parts.append(f"- Carrera: {learning_profile['career']}")
+    
+    if learning_profile.get("job_role"):
+        context_parts.append(f"- Ocupación actual: {learning_profile['job_role']}")
+    
+    if learning_profile.get("preferred_modalities"):
+        modalities_map = {
+            "video": "videos",
+            "lectura": "lecturas",
+            "ejercicio": "ejercicios prácticos",
+            "interactivo": "contenido interactivo"
+        }
+        modalities_text = ", ".join([
+            modalities_map.get(m, m) 
+            for m in learning_profile["preferred_modalities"]
+        ])
+        context_parts.append(f"- Prefiere aprender con: {modalities_text}")
+    
+    if learning_profile.get("devices"):
+        devices_map = {
+            "laptop_pc": "laptop/PC",
+            "movil": "dispositivo móvil",
+            "tablet": "tablet"
+        }
+        devices_text = ", ".join([
+            devices_map.get(d, d) 
+            for d in learning_profile["devices"]
+        ])
+        context_parts.append(f"- Estudia desde: {devices_text}")
+    
+    # Del perfil del curso
+    if course_profile.get("prereq_level"):
+        level_map = {
+            "bajo": "principiante/básico",
+            "medio": "intermedio",
+            "avanzado": "avanzado"
+        }
+        level_text = level_map.get(course_profile["prereq_level"], course_profile["prereq_level"])
+        context_parts.append(f"- Nivel en el curso: {level_text}")
+    
+    if course_profile.get("weekly_time"):
+        time_map = {
+            "h1_3": "1-3 horas semanales (tiempo limitado)",
+            "h3_6": "3-6 horas semanales (tiempo moderado)",
+            "h6_10": "6-10 horas semanales (buen tiempo disponible)",
+            "h10_plus": "más de 10 horas semanales (dedicación alta)"
+        }
+        time_text = time_map.get(course_profile["weekly_time"], course_profile["weekly_time"])
+        context_parts.append(f"- Tiempo de dedicación: {time_text}")
+    
+    if course_profile.get("goals"):
+        goals_map = {
+            "aprobar": "aprobar el curso",
+            "mejorar_nota": "mejorar su nota",
+            "dominar": "dominar los conceptos a profundidad",
+            "aplicar_trabajo": "aplicar los conocimientos en su trabajo"
+        }
+        goals_text = ", ".join([
+            goals_map.get(g, g) 
+            for g in course_profile["goals"]
+        ])
+        context_parts.append(f"- Objetivos: {goals_text}")
+    
+    return "\n".join(context_parts)
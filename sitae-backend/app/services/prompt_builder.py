@@ -0,0 +1,174 @@
+# app/services/prompt_builder.py
+"""
+Armado del prompt del chat con presupuesto de tokens por sección.
+
+Secciones y qué se recorta primero cuando no caben:
+- profile / weak_areas: texto por líneas, ya ordenado de más a menos
+  relevante -> se descartan las últimas líneas.
+- context (chunks RAG): vienen ordenados por similitud -> se descartan los
+  menos similares; el último que entra a medias se trunca si vale la pena.
+- history: pares pregunta/respuesta -> se descartan los más antiguos.
+- summary: resumen acumulado de la conversación; las líneas más nuevas van
+  al final -> se descartan las primeras.
+- course_name: único dato variable de las instrucciones -> se trunca.
+- system: instrucciones fijas del template; no se recortan (sin ellas el
+  modelo pierde las reglas) y su tamaño es constante, así que solo se miden.
+  Con el nombre del curso acotado, el prompt completo queda acotado por
+  system + la suma de los presupuestos + el mensaje del estudiante.
+
+`breakdown` registra los tokens finales de cada sección para el log y la respuesta.
+"""
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List
+
+from app.core.config import settings
+
+# Un chunk truncado a menos de esto no aporta: mejor descartarlo
+MIN_TRUNCATED_CHUNK_TOKENS = 60
+TRUNCATION_MARK = " [...]"
+
+
+@dataclass
+class PromptBudget:
+    profile: int = 300
+    weak_areas: int = 300
+    context: int = 1500
+    history: int = 800
+    summary: int = 300
+    course_name: int = 30
+
+    @classmethod
+    def from_settings(cls) -> "PromptBudget":
+        return cls(
+            profile=settings.CHAT_BUDGET_PROFILE_TOKENS,
+            weak_areas=settings.CHAT_BUDGET_WEAK_AREAS_TOKENS,
+            context=settings.CHAT_BUDGET_CONTEXT_TOKENS,
+            history=settings.CHAT_BUDGET_HISTORY_TOKENS,
+            summary=settings.CHAT_BUDGET_SUMMARY_TOKENS,
+        )
+
+
+@dataclass
+class PromptSections:
+    student_context: str
+    weak_areas: str
+    chunks: List[str]
+    history: List[Dict[str, str]]
+    summary: str = ""
+    course_name: str = ""
+    breakdown: Dict[str, int] = field(default_factory=dict)
+    dropped: Dict[str, int] = field(default_factory=dict)
+
+
+class PromptBuilder:
+    def __init__(self, count_tokens: Callable[[str], int], budget: PromptBudget):
+        self.count_tokens = count_tokens
+        self.budget = budget
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Corta `text` a <= max_tokens, preferentemente en un fin de línea o palabra"""
+        if max_tokens <= 0:
+            return ""
+        total = self.count_tokens(text)
+        if total <= max_tokens:
+            return text
+        mark = self.count_tokens(TRUNCATION_MARK)
+        cut = int(len(text) * (max_tokens - mark) / total)
+        while cut > 0 and self.count_tokens(text[:cut]) + mark > max_tokens:
+            cut = int(cut * 0.9)
+        if cut <= 0:
+            return ""
+        head = text[:cut]
+        for sep in ("\n", " "):
+            pos = head.rfind(sep)
+            if pos >= cut * 0.8:
+                head = head[:pos]
+                break
+        return head.rstrip() + TRUNCATION_MARK
+
+    def fit_lines(self, text: str, max_tokens: int) -> str:
+        """Conserva líneas completas desde el inicio; trunca solo si ni la primera cabe"""
+        if self.count_tokens(text) <= max_tokens:
+            return text
+        kept, used = [], 0
+        for line in text.split("\n"):
+            cost = self.count_tokens(line + "\n")
+            if used + cost > max_tokens:
+                break
+            kept.append(line)
+            used += cost
+        if not kept:
+            return self.truncate(text, max_tokens)
+        return "\n".join(kept)
+
+    def fit_recent_lines(self, text: str, max_tokens: int) -> str:
+        """Como fit_lines pero conserva las últimas líneas (lo más reciente)"""
+        if self.count_tokens(text) <= max_tokens:
+            return text
+        kept, used = [], 0
+        for line in reversed(text.split("\n")):
+            cost = self.count_tokens(line + "\n")
+            if used + cost > max_tokens:
+                break
+            kept.insert(0, line)
+            used += cost
+        if not kept:
+            return self.truncate(text, max_tokens)
+        return "\n".join(kept)
+
+    def fit_chunks(self, chunks: List[str], max_tokens: int) -> List[str]:
+        kept, used = [], 0
+        for chunk in chunks:
+            cost = self.count_tokens(chunk)
+            remaining = max_tokens - used
+            if cost <= remaining:
+                kept.append(chunk)
+                used += cost
+                continue
+            if remaining >= MIN_TRUNCATED_CHUNK_TOKENS:
+                kept.append(self.truncate(chunk, remaining))
+            break
+        return kept
+
+    def fit_history(self, history: List[Dict[str, str]], max_tokens: int) -> List[Dict[str, str]]:
+        """Recorre los turnos del más reciente al más antiguo; pares user/assistant juntos"""
+        turns = [history[i:i + 2] for i in range(0, len(history), 2)]
+        kept, used = [], 0
+        for turn in reversed(turns):
+            cost = sum(self.count_tokens(m["content"]) for m in turn)
+            if used + cost > max_tokens:
+                break
+            kept.insert(0, turn)
+            used += cost
+        return [m for turn in kept for m in turn]
+
+    def build(
+        self,
+        student_context: str,
+        weak_areas: str,
+        chunks: List[str],
+        history: List[Dict[str, str]],
+        summary: str = "",
+        course_name: str = "",
+    ) -> PromptSections:
+        b = self.budget
+        sections = PromptSections(
+            student_context=self.fit_lines(student_context, b.profile),
+            weak_areas=self.fit_lines(weak_areas, b.weak_areas),
+            chunks=self.fit_chunks(chunks, b.context),
+            history=self.fit_history(history, b.history),
+            summary=self.fit_recent_lines(summary, b.summary),
+            course_name=self.truncate(course_name, b.course_name),
+        )
+        sections.breakdown = {
+            "profile": self.count_tokens(sections.student_context),
+            "weak_areas": self.count_tokens(sections.weak_areas),
+            "context": sum(self.count_tokens(c) for c in sections.chunks),
+            "history": sum(self.count_tokens(m["content"]) for m in sections.history),
+            "summary": self.count_tokens(sections.summary),
+        }
+        sections.dropped = {
+            "chunks": len(chunks) - len(sections.chunks),
+            "history_messages": len(history) - len(sections.history),
+        }
+        return sections
@@ -7,6 +7,7 @@ from app.repositories.topic_objective_repository import TopicObjectiveRepository
 from app.repositories.topic_repository import TopicRepository
 from app.repositories.module_repository import ModuleRepository
 from app.repositories.course_repository import CourseRepository
+from app.repositories.question_error_analysis_repository import QuestionErrorAnalysisRepository
 from app.schemas.question import (
     QuestionCreate,
     QuestionUpdate,
@@ -180,6 +181,9 @@ class QuestionService:
             question_id, 
             question_data.model_dump(exclude_unset=True)
         )
+        # Los análisis de error cacheados de la pregunta ya no aplican
+        QuestionErrorAnalysisRepository(self.db).delete_for_question(question_id)
+        self.db.commit()
         
         return QuestionResponse.model_validate(updated)
 
@@ -12,6 +12,8 @@ from app.schemas.resource import (
     ResourceResponse,
     ResourceListResponse
 )
+from app.repositories.background_job_repository import BackgroundJobRepository
+from app.core.config import settings
 from typing import Optional
 
 class ResourceService:
@@ -56,6 +58,17 @@ class ResourceService:
                 detail="El objetivo no pertenece a este topic"
             )
 
+    def _enqueue_why_text_prewarm(self, resource_id: str) -> None:
+        """Precalcula los why_text del recurso en el job worker (opcional)"""
+        if not settings.WHY_TEXT_PREWARM_ENABLED:
+            return
+        BackgroundJobRepository(self.db).enqueue(
+            "prewarm_why_texts",
+            {"resource_id": resource_id},
+            max_attempts=settings.JOB_MAX_ATTEMPTS
+        )
+        self.db.commit()
+
     def _verify_teacher_access(self, topic_id: str, user_id: str):
         """Verificar que el usuario es docente del curso"""
         course_id = self._get_course_id_from_topic(topic_id)
@@ -119,6 +132,7 @@ class ResourceService:
             topic_id, 
             resource_data.model_dump()
         )
+        self._enqueue_why_text_prewarm(db_resource.id)
         
         return ResourceResponse.model_validate(db_resource)
 
@@ -149,6 +163,7 @@ class ResourceService:
             resource_id, 
             resource_data.model_dump(exclude_unset=True)
         )
+        self._enqueue_why_text_prewarm(resource_id)
         
         return ResourceResponse.model_validate(updated)
 
@@ -0,0 +1,296 @@
+# app/services/text_chunker.py
+"""
+Chunkers de texto para la ingesta de documentos.
+
+Ambas estrategias codifican cada segmento del texto UNA sola vez con tiktoken
+y cortan ventanas sobre los token ids; los chunks se reconstruyen con los
+offsets (en bytes) del texto original, así se conservan saltos de línea e
+indentación.
+
+- "words":  ventanas alineadas a palabras. max_tokens = tokens por chunk,
+            overlap = palabras repetidas al inicio del siguiente chunk
+            (misma semántica que el chunker original por palabra).
+- "tokens": ventanas fijas de max_tokens tokens con overlap de tokens.
+            Útil para texto sin estructura, donde las "palabras" pueden ser
+            muy largas.
+- "lines":  líneas completas con cortes definidos por el contenido (código).
+            Una edición en medio del archivo solo cambia los chunks vecinos,
+            así la re-ingesta incremental no re-embebe todo lo que sigue.
+
+Los chunkers son incrementales: `iter_chunks` recibe segmentos (páginas,
+bloques de líneas) y emite cada chunk apenas queda cerrado, arrastrando solo
+el chunk abierto entre segmentos.
+"""
+import re
+import zlib
+from bisect import bisect_left
+from dataclasses import dataclass
+from itertools import accumulate
+from typing import Iterable, Iterator, List, Tuple
+
+_WORD_RE = re.compile(rb"\S+")
+
+
+class _TokenByteLengths(dict):
+    """token id -> longitud en bytes (se llena a demanda; el vocabulario es finito)"""
+
+    def __init__(self, encoding):
+        super().__init__()
+        self.encoding = encoding
+
+    def __missing__(self, token: int) -> int:
+        length = self[token] = len(self.encoding.decode_single_token_bytes(token))
+        return length
+
+
+class _SegmentEncoder:
+    """Codifica cada segmento una sola vez y devuelve dónde empieza cada token"""
+
+    def __init__(self, encoding):
+        # encode_ordinary no falla si el documento contiene "<|endoftext|>"
+        self._encode = getattr(encoding, "encode_ordinary", None) or encoding.encode
+        self._lengths = _TokenByteLengths(encoding)
+
+    def token_starts(self, data: bytes) -> List[int]:
+        """Offset en bytes (dentro de `data`) donde empieza cada token"""
+        tokens = self._encode(data.decode("utf-8"))
+        return list(accumulate(map(self._lengths.__getitem__, tokens), initial=0))[:-1]
+
+
+def _text(data: bytes) -> str:
+    return data.decode("utf-8", errors="ignore").strip()
+
+
+@dataclass(frozen=True)
+class ChunkingConfig:
+    strategy: str = "words"
+    max_tokens: int = 500
+    overlap: int = 50
+
+
+class WordWindowChunker:
+    """Ventanas greedy de palabras con presupuesto de tokens (un solo encode)"""
+
+    def __init__(self, encoding, max_tokens: int = 500, overlap: int = 50):
+        self.encoder = _SegmentEncoder(encoding)
+        self.max_tokens = max_tokens
+        self.overlap = overlap
+
+    def _word_token_counts(self, data: bytes) -> Tuple[List[Tuple[int, int]], List[int], int]:
+        """
+        Spans de cada palabra, cuántos tokens le corresponden y cuántos tokens
+        de espacio quedan después de la última palabra.
+        """
+        spans = [m.span() for m in _WORD_RE.finditer(data)]
+        starts = self.encoder.token_starts(data)
+        # Un token pertenece a la primera palabra que termina después de su
+        # inicio: el espacio previo (" foo") cuenta para la palabra siguiente
+        firsts = [bisect_left(starts, end) for _, end in spans]
+        counts = [b - a for a, b in zip([0] + firsts, firsts)]
+        trailing = len(starts) - (firsts[-1] if firsts else 0)
+        return spans, counts, trailing
+
+    def iter_chunks(self, segments: Iterable[str]) -> Iterator[str]:
+        buf = b""          # bytes desde el inicio del chunk abierto
+        spans = []         # spans de palabras dentro de buf
+        counts = []        # tokens por palabra
+        start = 0          # primera palabra del chunk abierto
+        tokens = 0         # tokens acumulados en el chunk abierto
+        carry = 0          # tokens de espacio al final del segmento anterior
+
+        for segment in segments:
+            data = segment.encode("utf-8")
+            seg_spans, seg_counts, trailing = self._word_token_counts(data)
+            if seg_counts:
+                # El espacio final del segmento anterior cuenta para la siguiente palabra
+                seg_counts[0] += carry
+                carry = 0
+            carry += trailing
+            # Toda palabra cuenta al menos 1 token (p.ej. si un token cubre dos palabras)
+            seg_counts = [max(c, 1) for c in seg_counts]
+            offset = len(buf)
+            buf += data
+            first_new = len(spans)
+            spans.extend((a + offset, b + offset) for a, b in seg_spans)
+            counts.extend(seg_counts)
+
+            for i in range(first_new, len(counts)):
+                n = counts[i]
+                if tokens + n > self.max_tokens and i > start:
+                    yield _text(buf[spans[start][0]:spans[i - 1][1]])
+                    # Nuevo chunk con overlap de palabras
+                    if i - start > self.overlap:
+                        start = i - self.overlap
+                    tokens = sum(counts[start:i])
+                tokens += n
+
+            # Descarta lo ya emitido: solo se arrastra el chunk abierto
+            if start:
+                cut = spans[start][0]
+                buf = buf[cut:]
+                spans = [(a - cut, b - cut) for a, b in spans[start:]]
+                counts = counts[start:]
+                start = 0
+
+        if start < len(spans):
+            yield _text(buf[spans[start][0]:spans[-1][1]])
+
+    def split(self, text: str) -> List[str]:
+        return list(self.iter_chunks([text]))
+
+
+class TokenWindowChunker:
+    """Ventanas fijas sobre token ids con overlap en tokens"""
+
+    def __init__(self, encoding, max_tokens: int = 500, overlap: int = 50):
+        if overlap >= max_tokens:
+            raise ValueError("overlap debe ser menor que max_tokens")
+        self.encoder = _SegmentEncoder(encoding)
+        self.max_tokens = max_tokens
+        self.stride = max_tokens - overlap
+
+    def iter_chunks(self, segments: Iterable[str]) -> Iterator[str]:
+        buf = b""
+        starts = []        # inicio (en bytes de buf) de cada token pendiente
+        for segment in segments:
+            data = segment.encode("utf-8")
+            offset = len(buf)
+            buf += data
+            starts.extend(s + offset for s in self.encoder.token_starts(data))
+
+            start = 0
+            while start + self.max_tokens < len(starts):
+                chunk = _text(buf[starts[start]:starts[start + self.max_tokens]])
+                if chunk:
+                    yield chunk
+                start += self.stride
+            if start:
+                cut = starts[start]
+                buf = buf[cut:]
+                starts = [s - cut for s in starts[start:]]
+
+        # Cola: ventanas restantes hasta cubrir el final del texto
+        start = 0
+        while start < len(starts):
+            end = start + self.max_tokens
+            chunk = _text(buf[starts[start]:starts[end]] if end < len(starts) else buf[starts[start]:])
+            if chunk:
+                yield chunk
+            if end >= len(starts):
+                break
+            start += self.stride
+
+    def split(self, text: str) -> List[str]:
+        return list(self.iter_chunks([text]))
+
+
+class LineChunker:
+    """
+    Chunks de líneas completas cortados por el contenido, no por posición.
+
+    Con al menos max_tokens/4 tokens acumulados se corta antes de una línea
+    "ancla": una línea sin indentar después de una línea en blanco (inicio de
+    función o clase) o una línea cuyo hash cae en 1/ANCHOR_MODULUS. Si no
+    aparece ninguna se corta antes de pasar de max_tokens. Como los cortes
+    dependen de las líneas y no de offsets absolutos, tras una inserción los
+    chunks siguientes se realinean en el próximo ancla.
+    overlap = tokens de las últimas líneas del chunk anterior que se repiten.
+    Una línea más larga que max_tokens se corta con ventanas de tokens.
+    """
+    ANCHOR_MODULUS = 8
+
+    def __init__(self, encoding, max_tokens: int = 500, overlap: int = 50):
+        if overlap >= max_tokens // 2:
+            raise ValueError("overlap debe ser menor que max_tokens / 2")
+        self.encoder = _SegmentEncoder(encoding)
+        self.long_lines = TokenWindowChunker(encoding, max_tokens=max_tokens, overlap=overlap)
+        self.max_tokens = max_tokens
+        self.min_tokens = max_tokens // 4
+        self.overlap = overlap
+
+    def _line_token_counts(self, data: bytes) -> List[Tuple[bytes, int]]:
+        """Cada línea (con su salto) y los tokens que empiezan en ella"""
+        starts = self.encoder.token_starts(data)
+        out, pos = [], 0
+        for line in data.splitlines(keepends=True):
+            end = pos + len(line)
+            out.append((line, max(bisect_left(starts, end) - bisect_left(starts, pos), 1)))
+            pos = end
+        return out
+
+    def _is_anchor(self, line: bytes, previous: bytes) -> bool:
+        stripped = line.strip()
+        if not stripped:
+            return False
+        if not previous.strip() and line[:1] not in b" \t":
+            return True
+        return zlib.crc32(stripped) % self.ANCHOR_MODULUS == 0
+
+    def iter_chunks(self, segments: Iterable[str]) -> Iterator[str]:
+        chunk: List[Tuple[bytes, int]] = []   # líneas del chunk abierto (overlap incluido)
+        tokens = 0
+        fresh = False                          # el chunk abierto tiene líneas nuevas
+        previous = b""
+        partial = b""                          # línea incompleta al final de un segmento
+
+        def close() -> Iterator[str]:
+            nonlocal chunk, tokens, fresh
+            text = _text(b"".join(line for line, _ in chunk))
+            if text:
+                yield text
+            # Overlap: últimas líneas completas que entran en `overlap` tokens
+            tail, used = [], 0
+            for line, n in reversed(chunk):
+                if used + n > self.overlap:
+                    break
+                tail.insert(0, (line, n))
+                used += n
+            chunk, tokens, fresh = tail, used, False
+
+        def feed(data: bytes) -> Iterator[str]:
+            nonlocal chunk, tokens, previous, fresh
+            for line, n in self._line_token_counts(data):
+                if n > self.max_tokens:
+                    if fresh:
+                        yield from close()
+                    yield from self.long_lines.split(line.decode("utf-8", errors="ignore"))
+                    chunk, tokens, fresh, previous = [], 0, False, line
+                    continue
+                anchor = tokens >= self.min_tokens and self._is_anchor(line, previous)
+                if fresh and (anchor or tokens + n > self.max_tokens):
+                    yield from close()
+                if tokens + n > self.max_tokens:
+                    chunk, tokens = [], 0  # ni el overlap entra con esta línea
+                chunk.append((line, n))
+                tokens += n
+                fresh = True
+                previous = line
+
+        for segment in segments:
+            data = partial + segment.encode("utf-8")
+            cut = data.rfind(b"\n") + 1
+            data, partial = data[:cut], data[cut:]
+            yield from feed(data)
+        if partial:
+            yield from feed(partial)
+        # El último chunk solo si trae algo además del overlap
+        if fresh:
+            yield from close()
+
+    def split(self, text: str) -> List[str]:
+        return list(self.iter_chunks([text]))
+
+
+CHUNKERS = {
+    "words": WordWindowChunker,
+    "tokens": TokenWindowChunker,
+    "lines": LineChunker,
+}
+
+
+def get_chunker(encoding, config: ChunkingConfig):
+    try:
+        chunker_cls = CHUNKERS[config.strategy]
+    except KeyError:
+        raise ValueError(f"Estrategia de chunking desconocida: {config.strategy}")
+    return chunker_cls(encoding, max_tokens=config.max_tokens, overlap=config.overlap)
@@ -0,0 +1,46 @@
+# app/workers/backfill_weak_areas.py
+"""
+Reconstruye public.user_topic_objective_stats (áreas débiles del chat) desde
+el historial de intentos calificados. Necesario una vez al desplegar la
+tabla, o si se corrigen respuestas/intentos a mano.
+
+Uso (desde sitae-backend/):
+    python -m app.workers.backfill_weak_areas
+    python -m app.workers.backfill_weak_areas --course-id ID --window 5
+
+Es idempotente: borra y recalcula las filas del alcance en una transacción.
+"""
+import argparse
+import logging
+from typing import List, Optional
+
+from app.repositories.weak_area_repository import WEAK_AREA_WINDOW, WeakAreaRepository
+
+logger = logging.getLogger(__name__)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Reconstruye la proyección de áreas débiles")
+    parser.add_argument("--course-id", help="solo este curso (por defecto, todos)")
+    parser.add_argument("--window", type=int, default=WEAK_AREA_WINDOW,
+                        help="intentos calificados recientes por estudiante y curso")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    from app.db.session import SessionLocal
+
+    db = SessionLocal()
+    try:
+        rows = WeakAreaRepository(db).rebuild(course_id=args.course_id, window=args.window)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    print(f"Filas de áreas débiles recalculadas: {rows}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+# app/workers/handlers.py
+"""
+Handlers de trabajos en background, por `kind`.
+
+Cada handler recibe el payload del trabajo y una Session propia del worker.
+`on_failure` deja el estado de dominio consistente (p.ej. el documento en 'failed').
+Los handlers largos (`heartbeat=True`) reciben además `heartbeat()`, que renueva
+el lock del trabajo en la misma Session (se confirma con su próximo commit).
+"""
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, Optional
+import logging
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.models.chat import CourseDocument
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class JobHandler:
+    run: Callable[..., None]
+    on_failure: Optional[Callable[[dict, Session, str, bool], None]] = None
+    heartbeat: bool = False  # run(payload, db, heartbeat)
+
+
+class JobLockLost(Exception):
+    """Otro worker retomó el trabajo: esta copia no debe seguir escribiendo"""
+
+
+class DocumentSuperseded(Exception):
+    """El documento se reemplazó por una versión nueva mientras se ingería la anterior"""
+
+
+@contextmanager
+def _document_lock(db: Session, document_id: str):
+    """
+    Serializa las ingestas de un mismo documento (advisory lock de sesión en
+    una conexión aparte: los commits del handler no lo sueltan).
+    """
+    bind = db.get_bind()
+    if bind.dialect.name != "postgresql":
+        yield
+        return
+    key = f"ingest_document:{document_id}"
+    with bind.connect() as conn:
+        conn.execute(text("SELECT pg_advisory_lock(hashtext(:key))"), {"key": key})
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(hashtext(:key))"), {"key": key})
+            conn.commit()
+
+
+def ingest_document(payload: dict, db: Session, heartbeat: Callable[[], None]) -> None:
+    """
+    Chunking + embeddings de un CourseDocument, reportando progreso en la BD.
+    Un trabajo cuya versión (payload["file_path"]) ya fue reemplazada termina
+    sin tocar chunks ni estado: la ingesta de la versión nueva es la que vale.
+    """
+    from app.services.embedding_service import EmbeddingService
+
+    with _document_lock(db, payload["document_id"]):
+        doc = db.query(CourseDocument).filter(CourseDocument.id == payload["document_id"]).first()
+        if not doc:
+            logger.warning(f"Documento {payload['document_id']} ya no existe, se omite")
+            return
+        db.refresh(doc)  # lo que dejó la ingesta anterior, si esperó el lock
+        # Trabajos encolados antes de versionar el payload: la versión actual
+        version = payload.get("file_path") or doc.file_path
+
+        def ensure_current() -> None:
+            db.refresh(doc, ["file_path"])
+            if doc.file_path != version:
+                raise DocumentSuperseded(f"{doc.title}: {version} reemplazado por {doc.file_path}")
+
+        try:
+            ensure_current()
+            doc.status = "running"
+            doc.progress = 0
+            doc.error = None
+            db.commit()
+
+            def on_progress(chunks: int, fraction: float) -> None:
+                heartbeat()
+                ensure_current()
+                doc.chunk_count = chunks
+                doc.progress = min(99, int(fraction * 100))
+                db.commit()
+
+            chunk_count = EmbeddingService().process_document(
+                course_id=doc.course_id,
+                document_id=doc.id,
+                file_path=version,
+                document_type=doc.document_type,
+                title=doc.title,
+                on_progress=on_progress
+            )
+            ensure_current()
+        except DocumentSuperseded as e:
+            db.rollback()
+            logger.info(f"⏭️ Ingesta obsoleta, se omite: {e}")
+            return
+
+        doc.chunk_count = chunk_count
+        doc.progress = 100
+        doc.status = "completed"
+        doc.processed_at = datetime.utcnow()
+        db.commit()
+        logger.info(f"✅ Documento {doc.title} procesado: {chunk_count} chunks")
+
+
+def mark_document_failed(payload: dict, db: Session, error: str, final: bool) -> None:
+    doc = db.query(CourseDocument).filter(CourseDocument.id == payload["document_id"]).first()
+    if doc and payload.get("file_path") not in (None, doc.file_path):
+        # Falló una versión ya reemplazada (p.ej. su archivo se borró): el estado es de la nueva
+        logger.info(f"⏭️ Fallo de una versión reemplazada de {doc.title}, no cambia su estado")
+        return
+    if doc:
+        # Si quedan reintentos vuelve a la cola; el error queda visible igual
+        doc.status = "failed" if final else "queued"
+        doc.error = error
+        db.commit()
+
+
+def summarize_conversation(payload: dict, db: Session) -> None:
+    """Integra los turnos nuevos al resumen acumulado del chat"""
+    from app.services.conversation_summary_service import ConversationSummaryService
+
+    ConversationSummaryService(db).update(payload["user_id"], payload["course_id"])
+
+
+def prewarm_why_texts(payload: dict, db: Session) -> None:
+    """why_text de un recurso para los buckets de perfil de su curso"""
+    import asyncio
+    from app.core.config import settings
+    from app.services.personalized_recommendation_service import PersonalizedRecommendationService
+
+    asyncio.run(PersonalizedRecommendationService(db).prewarm_why_texts(
+        payload["resource_id"], max_buckets=settings.WHY_TEXT_PREWARM_MAX_BUCKETS
+    ))
+    db.commit()
+
+
+HANDLERS: Dict[str, JobHandler] = {
+    "ingest_document": JobHandler(run=ingest_document, on_failure=mark_document_failed, heartbeat=True),
+    "summarize_conversation": JobHandler(run=summarize_conversation),
+    "prewarm_why_texts": JobHandler(run=prewarm_why_texts),
+}
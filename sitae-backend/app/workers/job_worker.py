@@ -0,0 +1,231 @@
+# app/workers/job_worker.py
+"""
+Worker de la cola durable `background_job`.
+
+Corre fuera de la API, así la ingesta no bloquea a uvicorn, sobrevive a
+reinicios y escala por separado (más procesos o más réplicas del worker).
+
+Uso (desde sitae-backend/):
+    python -m app.workers.job_worker                 # settings.JOB_WORKER_PROCESSES
+    python -m app.workers.job_worker --processes 4
+
+El proceso principal reclama trabajos con FOR UPDATE SKIP LOCKED y los
+ejecuta en un pool de procesos; cada proceso hijo usa su propia Session y
+marca el trabajo como completado o lo reencola con backoff. Mientras corren,
+el proceso principal renueva su locked_at cada JOB_HEARTBEAT_SECONDS; así
+solo se retoman (JOB_STALE_AFTER_SECONDS) los de un worker caído.
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def retry_delay_seconds(attempts: int) -> float:
+    """Backoff exponencial con jitter para el intento `attempts` (1, 2, ...)"""
+    base = settings.JOB_RETRY_BACKOFF_SECONDS * 2 ** max(0, attempts - 1)
+    delay = min(base, settings.JOB_RETRY_BACKOFF_MAX_SECONDS)
+    return delay + random.uniform(0, delay / 4)
+
+
+def execute_job(job_id: str, kind: str, payload: dict, attempts: int, max_attempts: int, worker_id: str) -> bool:
+    """
+    Corre en el proceso hijo: ejecuta el handler y registra el resultado.
+    Solo escribe el resultado si el trabajo sigue siendo de `worker_id`.
+    """
+    from app.db.session import SessionLocal
+    from app.repositories.background_job_repository import BackgroundJobRepository
+    from app.workers.handlers import HANDLERS, JobLockLost
+
+    db = SessionLocal()
+    repo = BackgroundJobRepository(db)
+    handler = HANDLERS.get(kind)
+
+    def heartbeat() -> None:
+        if not repo.heartbeat([job_id], worker_id):
+            raise JobLockLost(f"El trabajo {job_id} ya no pertenece a {worker_id}")
+
+    try:
+        if handler is None:
+            raise ValueError(f"Tipo de trabajo desconocido: {kind}")
+        if handler.heartbeat:
+            handler.run(payload, db, heartbeat)
+        else:
+            handler.run(payload, db)
+        if not repo.complete(job_id, worker_id):
+            logger.warning(f"⚠️ Trabajo {kind} {job_id} terminó pero otro worker lo retomó: no se marca")
+        db.commit()
+        return True
+    except Exception as e:
+        db.rollback()
+        error = f"{type(e).__name__}: {e}"[:2000]
+        final = handler is None or attempts >= max_attempts
+        delay = None if final else retry_delay_seconds(attempts)
+        logger.error(
+            f"❌ Trabajo {kind} {job_id} falló (intento {attempts}/{max_attempts}): {error}"
+            + ("" if final else f" — reintento en {delay:.0f}s")
+        )
+        owned = repo.fail(job_id, worker_id, error, delay)
+        db.commit()
+        if not owned:
+            # La copia vigente del trabajo es dueña del estado de dominio
+            logger.warning(f"⚠️ Trabajo {kind} {job_id} ya no es de {worker_id}: se omite on_failure")
+            return False
+        if handler is not None and handler.on_failure:
+            try:
+                handler.on_failure(payload, db, error, final)
+            except Exception as hook_error:
+                db.rollback()
+                logger.error(f"Error actualizando estado tras fallo de {job_id}: {hook_error}")
+        return False
+    finally:
+        db.close()
+
+
+def _init_child() -> None:
+    # El padre maneja SIGINT/SIGTERM y espera a que terminen los trabajos en curso
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(level=logging.INFO, format="[%(process)d] %(levelname)s %(message)s")
+
+
+class JobWorker:
+    def __init__(self, processes: int, poll_interval: float):
+        self.processes = processes
+        self.poll_interval = poll_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.stopping = False
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        # spawn: los hijos no heredan conexiones, hilos ni clientes del padre
+        return ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_child,
+        )
+
+    def _claim(self, limit: int):
+        from app.db.session import SessionLocal
+        from app.repositories.background_job_repository import BackgroundJobRepository
+
+        db = SessionLocal()
+        try:
+            self._fail_exhausted(db)
+            jobs = BackgroundJobRepository(db).claim(
+                self.worker_id, limit, settings.JOB_STALE_AFTER_SECONDS
+            )
+            db.commit()
+            return jobs
+        except Exception as e:
+            db.rollback()
+            logger.error(f"❌ Error reclamando trabajos: {e}")
+            return []
+        finally:
+            db.close()
+
+    def _fail_exhausted(self, db) -> None:
+        """Trabajos cuyo proceso murió en el último intento: 'failed' + on_failure"""
+        from app.repositories.background_job_repository import BackgroundJobRepository
+        from app.workers.handlers import HANDLERS
+
+        error = "Proceso del worker caído durante el último intento (posible OOM o segfault)"
+        jobs = BackgroundJobRepository(db).fail_stale_exhausted(settings.JOB_STALE_AFTER_SECONDS, error)
+        db.commit()
+        for job in jobs:
+            logger.error(f"❌ Trabajo {job.kind} {job.id} agotó sus intentos ({job.attempts}/{job.max_attempts}) con el proceso caído")
+            handler = HANDLERS.get(job.kind)
+            if handler is None or not handler.on_failure:
+                continue
+            try:
+                handler.on_failure(job.payload, db, error, True)
+            except Exception as hook_error:
+                db.rollback()
+                logger.error(f"Error actualizando estado tras fallo de {job.id}: {hook_error}")
+
+    def _heartbeat(self, job_ids) -> None:
+        """Renueva locked_at de los trabajos en curso (aunque el handler no reporte progreso)"""
+        from app.db.session import SessionLocal
+        from app.repositories.background_job_repository import BackgroundJobRepository
+
+        db = SessionLocal()
+        try:
+            BackgroundJobRepository(db).heartbeat(list(job_ids), self.worker_id)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"❌ Error renovando el lock de los trabajos en curso: {e}")
+        finally:
+            db.close()
+
+    def stop(self, *_) -> None:
+        if not self.stopping:
+            logger.info("🛑 Deteniendo worker: se terminan los trabajos en curso")
+        self.stopping = True
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        logger.info(f"🚀 Worker {self.worker_id} con {self.processes} procesos")
+
+        pool = self._new_pool()
+        in_flight = {}
+        last_heartbeat = time.monotonic()
+        try:
+            while not self.stopping or in_flight:
+                if in_flight and time.monotonic() - last_heartbeat >= settings.JOB_HEARTBEAT_SECONDS:
+                    self._heartbeat(job_id for job_id, _ in in_flight.values())
+                    last_heartbeat = time.monotonic()
+
+                free = self.processes - len(in_flight)
+                if free > 0 and not self.stopping:
+                    for job in self._claim(free):
+                        future = pool.submit(
+                            execute_job, str(job.id), job.kind, job.payload,
+                            job.attempts, job.max_attempts, self.worker_id
+                        )
+                        in_flight[future] = (str(job.id), job.kind)
+
+                if not in_flight:
+                    time.sleep(self.poll_interval)
+                    continue
+
+                done, _ = wait(in_flight, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job_id, kind = in_flight.pop(future)
+                    try:
+                        ok = future.result()
+                        logger.info(f"{'✅' if ok else '⚠️'} Trabajo {kind} {job_id} terminado")
+                    except BrokenProcessPool:
+                        # Un hijo murió (OOM, segfault): al vencer JOB_STALE_AFTER_SECONDS el
+                        # trabajo se retoma o, sin intentos restantes, pasa a 'failed'; se recrea el pool
+                        logger.error(f"❌ Proceso caído ejecutando {kind} {job_id}")
+                        pool.shutdown(wait=False, cancel_futures=True)
+                        in_flight.clear()
+                        pool = self._new_pool()
+                        break
+        finally:
+            pool.shutdown(wait=True)
+            logger.info("🛑 Worker finalizado")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Worker de trabajos en background (ingesta de documentos)")
+    parser.add_argument("--processes", type=int, default=settings.JOB_WORKER_PROCESSES)
+    parser.add_argument("--poll-interval", type=float, default=settings.JOB_POLL_INTERVAL_SECONDS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    JobWorker(processes=args.processes, poll_interval=args.poll_interval).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# app/workers/migrate_vector_store.py
+"""
+Copia las colecciones de un vector store a otro (por defecto ChromaDB -> pgvector).
+Los embeddings se copian tal cual: no hay llamadas a la API de OpenAI.
+
+Uso (desde sitae-backend/):
+    python -m app.workers.migrate_vector_store                      # chroma -> pgvector
+    python -m app.workers.migrate_vector_store --course-id ID --batch-size 500
+    python -m app.workers.migrate_vector_store --source pgvector --target chroma
+
+Los chunks cuyo documento ya no existe en course_document se omiten (pgvector
+los rechazaría por la FK). Es idempotente: los IDs se insertan con upsert.
+Después de migrar, cambiar VECTOR_STORE_BACKEND en el .env y reiniciar.
+"""
+import argparse
+import logging
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+
+from app.core.vector_store import VECTOR_STORE_BACKENDS, get_course_collection_name
+
+logger = logging.getLogger(__name__)
+
+
+def _existing_document_ids(db) -> set:
+    rows = db.execute(text("SELECT id FROM public.course_document")).fetchall()
+    return {str(r.id) for r in rows}
+
+
+def migrate(
+    source,
+    target,
+    valid_document_ids: set,
+    collection_names: Optional[List[str]] = None,
+    batch_size: int = 500,
+) -> Dict[str, Dict[str, int]]:
+    """Copia colección por colección, por páginas; devuelve copiados/omitidos por colección"""
+    if collection_names is None:
+        collection_names = [getattr(c, "name", c) for c in source.list_collections()]
+
+    report = {}
+    for name in collection_names:
+        src = source.get_collection(name=name)
+        dst = target.get_or_create_collection(name=name)
+        copied = skipped = 0
+        total = src.count()
+        for offset in range(0, total, batch_size):
+            page = src.get(
+                include=["documents", "embeddings", "metadatas"],
+                limit=batch_size,
+                offset=offset,
+            )
+            keep = [
+                i for i, m in enumerate(page["metadatas"])
+                if (m or {}).get("document_id") in valid_document_ids
+            ]
+            skipped += len(page["ids"]) - len(keep)
+            if keep:
+                dst.upsert(
+                    ids=[page["ids"][i] for i in keep],
+                    embeddings=[list(page["embeddings"][i]) for i in keep],
+                    documents=[page["documents"][i] for i in keep],
+                    metadatas=[page["metadatas"][i] for i in keep],
+                )
+                copied += len(keep)
+        report[name] = {"copied": copied, "skipped": skipped}
+        logger.info(f"📦 {name}: {copied} chunks copiados, {skipped} huérfanos omitidos")
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    backends = sorted(VECTOR_STORE_BACKENDS)
+    parser = argparse.ArgumentParser(description="Migra colecciones entre vector stores")
+    parser.add_argument("--source", choices=backends, default="chroma")
+    parser.add_argument("--target", choices=backends, default="pgvector")
+    parser.add_argument("--course-id", help="solo la colección de este curso")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args(argv)
+    if args.source == args.target:
+        parser.error("--source y --target deben ser distintos")
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    from app.db.session import SessionLocal
+
+    db = SessionLocal()
+    try:
+        valid = _existing_document_ids(db)
+    finally:
+        db.close()
+
+    source = VECTOR_STORE_BACKENDS[args.source]()
+    target = VECTOR_STORE_BACKENDS[args.target]()
+    names = [get_course_collection_name(args.course_id)] if args.course_id else None
+    report = migrate(source, target, valid, names, batch_size=args.batch_size)
+
+    copied = sum(r["copied"] for r in report.values())
+    skipped = sum(r["skipped"] for r in report.values())
+    print(f"Colecciones: {len(report)}  Chunks copiados: {copied}  Omitidos: {skipped}")
+
+
+if __name__ == "__main__":
+    main()
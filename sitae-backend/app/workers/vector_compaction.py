@@ -0,0 +1,102 @@
+# app/workers/vector_compaction.py
+"""
+Reconciliación de ChromaDB con la BD: purga chunks huérfanos, es decir
+chunks cuyo document_id ya no tiene fila en course_document (documentos
+borrados antes de existir el borrado de vectores, borrados durante la
+ingesta, cursos eliminados...).
+
+Uso (desde sitae-backend/):
+    python -m app.workers.vector_compaction --dry-run
+    python -m app.workers.vector_compaction [--course-id ID] [--vacuum]
+
+--vacuum corre `chroma vacuum` al final para devolver el espacio en disco
+(detener la API antes: la carpeta de ChromaDB no debe estar en uso).
+"""
+import argparse
+import logging
+import shutil
+import subprocess
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.core.vector_store import get_course_collection_name, get_vector_store
+
+logger = logging.getLogger(__name__)
+
+_COLLECTION_PREFIX = "course_"
+
+
+def _course_ids_from_collections() -> List[str]:
+    """course_id de cada colección course_<uuid con _>"""
+    names = [getattr(c, "name", c) for c in get_vector_store().list_collections()]
+    return [
+        name[len(_COLLECTION_PREFIX):].replace("_", "-")
+        for name in names
+        if name.startswith(_COLLECTION_PREFIX)
+    ]
+
+
+def _document_ids(db, course_id: str) -> set:
+    rows = db.execute(
+        text("SELECT id FROM public.course_document WHERE course_id = :cid"),
+        {"cid": course_id}
+    ).fetchall()
+    return {str(r.id) for r in rows}
+
+
+def compact(db, service, course_ids: List[str], dry_run: bool = False) -> Dict[str, Dict[str, int]]:
+    """Encuentra y (si no es dry_run) purga los chunks huérfanos de cada curso"""
+    report = {}
+    for course_id in course_ids:
+        orphans = service.find_orphan_chunks(course_id, _document_ids(db, course_id))
+        if not orphans:
+            continue
+        report[course_id] = orphans
+        total = sum(orphans.values())
+        if dry_run:
+            logger.info(f"🔎 {get_course_collection_name(course_id)}: {total} chunks huérfanos "
+                        f"de {len(orphans)} documentos")
+        else:
+            service.delete_orphan_chunks(course_id, list(orphans))
+            logger.info(f"🗑️ {get_course_collection_name(course_id)}: {total} chunks huérfanos eliminados")
+    return report
+
+
+def _vacuum() -> None:
+    chroma = shutil.which("chroma")
+    if not chroma:
+        logger.warning("⚠️ CLI `chroma` no encontrado, se omite el vacuum")
+        return
+    subprocess.run([chroma, "vacuum", "--path", settings.CHROMA_PATH, "--force"], check=True)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Purga chunks huérfanos de ChromaDB")
+    parser.add_argument("--course-id", help="solo este curso (por defecto, todas las colecciones)")
+    parser.add_argument("--dry-run", action="store_true", help="solo reporta, no borra")
+    parser.add_argument("--vacuum", action="store_true", help="compacta la carpeta de ChromaDB al final")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    from app.db.session import SessionLocal
+    from app.services.embedding_service import EmbeddingService
+
+    course_ids = [args.course_id] if args.course_id else _course_ids_from_collections()
+    db = SessionLocal()
+    try:
+        report = compact(db, EmbeddingService(), course_ids, dry_run=args.dry_run)
+    finally:
+        db.close()
+
+    total = sum(n for orphans in report.values() for n in orphans.values())
+    action = "encontrados" if args.dry_run else "eliminados"
+    print(f"Chunks huérfanos {action}: {total} en {len(report)} de {len(course_ids)} cursos")
+
+    if args.vacuum and not args.dry_run:
+        _vacuum()
+
+
+if __name__ == "__main__":
+    main()
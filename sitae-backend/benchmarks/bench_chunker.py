@@ -0,0 +1,107 @@
+# benchmarks/bench_chunker.py
+"""
+Microbenchmark: chunker original (un encode por palabra) vs chunkers de un
+solo encode de app/services/text_chunker.py.
+
+Uso (desde sitae-backend/):
+    python -m benchmarks.bench_chunker --pages 300
+    python -m benchmarks.bench_chunker --pdf ruta/al/libro.pdf
+"""
+import argparse
+import random
+import time
+
+import tiktoken
+
+from app.services.text_chunker import ChunkingConfig, get_chunker
+
+_VOCAB = (
+    "python lista diccionario tupla función variable bucle condicional clase objeto "
+    "método atributo herencia módulo paquete excepción archivo cadena entero flotante "
+    "def return import for while if else elif try except with lambda yield None True"
+).split()
+
+
+def legacy_chunk_text(encoding, text: str, max_tokens: int = 500, overlap: int = 50):
+    """Implementación original de EmbeddingService._chunk_text (referencia)"""
+    words = text.split()
+    chunks = []
+    current_chunk = []
+    current_tokens = 0
+
+    for word in words:
+        word_tokens = len(encoding.encode(word))
+
+        if current_tokens + word_tokens > max_tokens and current_chunk:
+            chunks.append(" ".join(current_chunk))
+            overlap_words = current_chunk[-overlap:] if len(current_chunk) > overlap else current_chunk
+            current_chunk = overlap_words + [word]
+            current_tokens = sum(len(encoding.encode(w)) for w in current_chunk)
+        else:
+            current_chunk.append(word)
+            current_tokens += word_tokens
+
+    if current_chunk:
+        chunks.append(" ".join(current_chunk))
+
+    return chunks
+
+
+def synthetic_pages(pages: int, words_per_page: int = 450, seed: int = 7):
+    rnd = random.Random(seed)
+    return [
+        " ".join(rnd.choice(_VOCAB) for _ in range(words_per_page)) + "\n"
+        for _ in range(pages)
+    ]
+
+
+def pdf_pages(path: str):
+    from PyPDF2 import PdfReader
+    return [(page.extract_text() or "") + "\n" for page in PdfReader(path).pages]
+
+
+def _timeit(fn, repeat: int):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=300, help="páginas sintéticas (si no se pasa --pdf)")
+    parser.add_argument("--pdf", help="PDF real a usar como entrada")
+    parser.add_argument("--max-tokens", type=int, default=500)
+    parser.add_argument("--overlap", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    encoding = tiktoken.encoding_for_model("gpt-4")
+    pages = pdf_pages(args.pdf) if args.pdf else synthetic_pages(args.pages)
+    text = "".join(pages)
+    print(f"Entrada: {len(pages)} páginas, {len(text.split())} palabras, {len(text)} caracteres\n")
+
+    cases = {
+        "legacy (encode por palabra)": lambda: legacy_chunk_text(
+            encoding, text, max_tokens=args.max_tokens, overlap=args.overlap
+        ),
+    }
+    for strategy in ("words", "tokens"):
+        chunker = get_chunker(
+            encoding,
+            ChunkingConfig(strategy=strategy, max_tokens=args.max_tokens, overlap=args.overlap),
+        )
+        cases[f"{strategy} (un solo encode, streaming)"] = lambda c=chunker: list(c.iter_chunks(pages))
+
+    baseline = None
+    for name, fn in cases.items():
+        secs, chunks = _timeit(fn, args.repeat)
+        baseline = baseline or secs
+        print(f"{name:<36} {secs * 1000:9.1f} ms  {len(chunks):5d} chunks  x{baseline / secs:5.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# benchmarks/bench_ingestion.py
+"""
+Benchmark end-to-end sin red: ingesta (chunking + embeddings + escritura en el
+vector store) y latencia de búsqueda, con el proveedor local de embeddings.
+
+Uso (desde sitae-backend/):
+    python -m benchmarks.bench_ingestion --docs 20 --pages 50 --queries 200
+
+Usa ChromaDB en un directorio temporal. En una máquina sin internet, tiktoken
+necesita sus encodings en TIKTOKEN_CACHE_DIR.
+"""
+import argparse
+import statistics
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+from app.core.config import settings
+from benchmarks.bench_chunker import synthetic_pages
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=30, help="páginas sintéticas por documento")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dimensions", type=int, default=settings.LOCAL_EMBEDDING_DIMENSIONS)
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="sitae_bench_"))
+    # Antes de crear los singletons: proveedor local, sin caché de chunks
+    settings.EMBEDDING_PROVIDER = "local"
+    settings.LOCAL_EMBEDDING_DIMENSIONS = args.dimensions
+    settings.EMBEDDING_CACHE_ENABLED = False
+    settings.VECTOR_STORE_BACKEND = "chroma"
+    settings.CHROMA_PATH = str(workdir / "chroma")
+
+    from app.services.embedding_service import EmbeddingService
+
+    service = EmbeddingService()
+    course_id = str(uuid.uuid4())
+
+    files = []
+    for d in range(args.docs):
+        path = workdir / f"doc_{d}.txt"
+        path.write_text("".join(synthetic_pages(args.pages, seed=d)), encoding="utf-8")
+        files.append(path)
+
+    total_chunks = 0
+    t0 = time.perf_counter()
+    for path in files:
+        total_chunks += service.process_document(course_id, str(uuid.uuid4()), str(path), "code", path.name)
+    ingest_secs = time.perf_counter() - t0
+    print(f"Ingesta: {args.docs} docs, {total_chunks} chunks en {ingest_secs:.2f}s "
+          f"({total_chunks / ingest_secs:.0f} chunks/s)")
+
+    queries = [" ".join(p.split()[:6]) for p in synthetic_pages(args.queries, words_per_page=6, seed=99)]
+    latencies = []
+    for q in queries:
+        t0 = time.perf_counter()
+        service.search_similar_content(course_id, q, n_results=5)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    print(f"Búsqueda: {len(queries)} queries  p50 {statistics.median(latencies):.1f} ms  "
+          f"p95 {_percentile(latencies, 95):.1f} ms  max {max(latencies):.1f} ms")
+
+    hit = service.query_cache.stats()
+    print(f"Caché de queries: hit rate {hit['hit_rate']}")
+    print(f"Datos temporales en: {workdir}")
+
+
+if __name__ == "__main__":
+    main()
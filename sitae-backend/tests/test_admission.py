@@ -0,0 +1,53 @@
+# tests/test_admission.py
+import asyncio
+
+import pytest
+
+from app.core.admission import AdmissionController, AdmissionRejected
+
+
+@pytest.mark.asyncio
+async def test_1_token_bucket_por_usuario_rechaza_con_retry_after():
+    ctl = AdmissionController(user_rate_per_minute=6, user_burst=2)
+
+    for _ in range(2):
+        await ctl.release(await ctl.acquire("u1"))
+    with pytest.raises(AdmissionRejected) as exc:
+        await ctl.acquire("u1")
+
+    assert exc.value.reason == "rate_limited"
+    assert 1 <= exc.value.retry_after <= 10
+    # Otro usuario no se ve afectado
+    await ctl.release(await ctl.acquire("u2"))
+
+
+@pytest.mark.asyncio
+async def test_2_cola_acotada_espera_slot_y_rechaza_al_llenarse():
+    ctl = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=2, user_burst=10)
+    first = await ctl.acquire("u1")
+
+    waiting = asyncio.create_task(ctl.acquire("u2"))
+    await asyncio.sleep(0.01)
+    with pytest.raises(AdmissionRejected) as exc:
+        await ctl.acquire("u3")
+    assert exc.value.reason == "queue_full"
+
+    await ctl.release(first)
+    second = await asyncio.wait_for(waiting, timeout=1)
+    assert (await ctl.depth()) == {"in_flight": 1, "queued": 0}
+    await ctl.release(second)
+
+    stats = await ctl.stats()
+    assert stats["admitted"] == 2 and stats["rejected"]["queue_full"] == 1
+
+
+@pytest.mark.asyncio
+async def test_3_espera_vencida_responde_429():
+    ctl = AdmissionController(max_concurrent=1, queue_timeout=0.1, user_burst=10)
+    await ctl.acquire("u1")
+
+    with pytest.raises(AdmissionRejected) as exc:
+        await ctl.acquire("u2")
+
+    assert exc.value.reason == "queue_timeout"
+    assert (await ctl.depth())["queued"] == 0
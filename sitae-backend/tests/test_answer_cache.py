@@ -0,0 +1,42 @@
+# tests/test_answer_cache.py
+import time
+
+from app.core.answer_cache import CachedAnswer, SemanticAnswerCache
+
+
+def answer(text="Una lista es mutable."):
+    return CachedAnswer(question="¿qué es una lista?", response=text, sources=[])
+
+
+def test_1_reutiliza_pregunta_similar_solo_en_el_mismo_bucket():
+    cache = SemanticAnswerCache(threshold=0.9)
+    cache.store("c1", "medio", [1.0, 0.0, 0.1], "v1", answer())
+
+    hit = cache.lookup("c1", "medio", [0.98, 0.0, 0.12], "v1")
+    assert hit is not None and hit[0].response == "Una lista es mutable."
+
+    assert cache.lookup("c1", "avanzado", [1.0, 0.0, 0.1], "v1") is None  # otro nivel
+    assert cache.lookup("c1", "medio", [0.0, 1.0, 0.0], "v1") is None     # otra pregunta
+    assert cache.lookup("c2", "medio", [1.0, 0.0, 0.1], "v1") is None     # otro curso
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 3
+
+
+def test_2_cambio_de_material_invalida_el_curso():
+    cache = SemanticAnswerCache(threshold=0.9)
+    cache.store("c1", "medio", [1.0, 0.0], "3:2025-01-01", answer())
+
+    assert cache.lookup("c1", "medio", [1.0, 0.0], "4:2025-02-01") is None
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_3_ttl_y_maximo_por_curso():
+    cache = SemanticAnswerCache(threshold=0.9, ttl=0.05, max_per_course=2)
+    for i, vec in enumerate(([1.0, 0.0], [0.0, 1.0], [0.7, 0.7])):
+        cache.store("c1", "medio", vec, "v1", answer(f"r{i}"))
+    assert cache.stats()["entries"] == 2
+    assert cache.lookup("c1", "medio", [1.0, 0.0], "v1") is None  # la más antigua fue expulsada
+
+    time.sleep(0.06)
+    assert cache.lookup("c1", "medio", [0.0, 1.0], "v1") is None
+    assert cache.stats()["entries"] == 0
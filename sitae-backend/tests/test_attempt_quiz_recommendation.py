@@ -1,4 +1,5 @@
 # app/tests/test_attempt_quiz_recommendation.py
+import contextlib
 import types
 import uuid
 import pytest
@@ -59,6 +60,9 @@ class FakeDB:
     def commit(self):
         pass
 
+    def begin_nested(self):
+        return contextlib.nullcontext()
+
     def _select_questions_join_ok(self, qid_quiz):
         # Devuelve rows con alias usados en tu SQL (question_id, q_text, q_score, ot_id, ot_code, ot_desc, ok_opt_id, ok_opt_text)
         out = []
@@ -77,6 +81,7 @@ class FakeDB:
                     ot_desc=ot.description,
                     ok_opt_id=ok.id,
                     ok_opt_text=ok.text,
+                    q_explanation=None,
                 )
             )
         # Ordena por q.text (como tu ORDER BY q.text)
@@ -117,61 +122,78 @@ class FakeDB:
             qid_quiz = params.get("qid")
             return self._Result(self._select_questions_join_ok(qid_quiz))
 
-        # --- DELETE question_response
-        if st.startswith("delete from public.question_response"):
+        # --- DELETE question_response de las preguntas respondidas
+        if st.startswith("delete from public.question_response") and "any(" in st:
             aid = params["aid"]
-            qid = params["qid"]
+            qids = set(params["qids"])
             self.qresponses = [
                 r
                 for r in self.qresponses
-                if not (r["attempt_quiz_id"] == aid and r["question_id"] == qid)
+                if not (r["attempt_quiz_id"] == aid and r["question_id"] in qids)
             ]
             return self._Result([])
 
-        # --- INSERT question_response
-        if st.startswith("insert into public.question_response"):
-            self.qresponses.append(
-                {
-                    "attempt_quiz_id": params["aid"],
-                    "question_id": params["qid"],
-                    "is_correct": params["ok"],
-                    "score": params["score"],
-                    "option_id": params["oid"],
-                    "time_seconds": params["tsec"],
-                }
-            )
+        # --- INSERT question_response en bloque (unnest); no ve filas previas
+        if "insert into public.question_response" in st and "unnest(" in st:
+            if "delete" in st:
+                raise AssertionError("DELETE en un CTE no es visible para el INSERT")
+            aid = params["aid"]
+            if any(r["attempt_quiz_id"] == aid and r["question_id"] in params["qids"] for r in self.qresponses):
+                raise AssertionError("duplicate key (attempt_quiz_id, question_id)")
+            for qid, ok, score, oid, tsec in zip(
+                params["qids"], params["oks"], params["scores"], params["oids"], params["tsecs"]
+            ):
+                self.qresponses.append(
+                    {
+                        "attempt_quiz_id": aid,
+                        "question_id": qid,
+                        "is_correct": ok,
+                        "score": score,
+                        "option_id": oid,
+                        "time_seconds": tsec,
+                    }
+                )
             return self._Result([])
 
-        # --- SELECT option text
-        if "from public.option where id = :oid" in st:
-            row = self._select_option_text(params["oid"])
-            return self._Result([row] if row else [])
+        # --- SELECT textos de opciones marcadas
+        if "from public.option where id = any(" in st:
+            rows = []
+            for oid in params["oids"]:
+                row = self._select_option_text(oid)
+                if row:
+                    rows.append(Row(id=oid, text=row.text))
+            return self._Result(rows)
 
-        # --- SELECT resources by topic objective
-        if "from public.resource r" in st and "where r.topic_objective_id = :ot" in st:
-            rows = self._select_resources_by_ot(params["ot"])
+        # --- SELECT recursos de varios objetivos (ordenados por objetivo)
+        if "from public.resource r" in st and "r.topic_objective_id = any(" in st:
+            rows = []
+            for ot_id in sorted(params["ots"]):
+                rows.extend(self._select_resources_by_ot(ot_id))
             return self._Result(rows)
 
-        # --- INSERT question_recommendation (ON CONFLICT DO NOTHING)
+        # --- INSERT question_recommendation multi-fila (ON CONFLICT DO NOTHING)
         if st.startswith("insert into public.question_recommendation"):
-            row = {
-                "attempt_quiz_id": params["aid"],
-                "question_id": params["qid"],
-                "resource_id": params["rid"],
-                "rank_position": params["rank"],
-                "why_text": params["why"],
-                "source": params["src"],
-            }
-            # Simular UNIQUE (question_id, attempt_quiz_id, resource_id)
-            if not any(
-                (
-                    r["question_id"] == row["question_id"]
-                    and r["attempt_quiz_id"] == row["attempt_quiz_id"]
-                    and r["resource_id"] == row["resource_id"]
-                )
-                for r in self.qrecs
+            for qid, rid, rank, why in zip(
+                params["qids"], params["rids"], params["ranks"], params["whys"]
             ):
-                self.qrecs.append(row)
+                row = {
+                    "attempt_quiz_id": params["aid"],
+                    "question_id": qid,
+                    "resource_id": rid,
+                    "rank_position": rank,
+                    "why_text": why,
+                    "source": params["src"],
+                }
+                # Simular UNIQUE (question_id, attempt_quiz_id, resource_id)
+                if not any(
+                    (
+                        r["question_id"] == row["question_id"]
+                        and r["attempt_quiz_id"] == row["attempt_quiz_id"]
+                        and r["resource_id"] == row["resource_id"]
+                    )
+                    for r in self.qrecs
+                ):
+                    self.qrecs.append(row)
             return self._Result([])
 
         # No-op default
@@ -503,3 +525,68 @@ def test_12_recomendacion_al_finalizar_RF9(fake_env):
 
 
 
+
+
+def test_13_sentencias_sql_no_dependen_de_la_cantidad_de_preguntas(fake_env):
+    # Calificación por conjuntos: mismas sentencias con 1 o 3 preguntas falladas
+    e = fake_env
+    answers = [
+        A(e.ids.q1, "bad", 2),
+        A(e.ids.q2, e.ids.ok2, 2),
+        A(e.ids.q3, e.ids.ok3, 2),
+    ]
+    e.svc.finish_attempt_with_answers(e.ids.attempt_id, e.ids.user_owner, answers)
+    una_fallada = len(e.db.executed)
+
+    e.db.executed.clear()
+    e.attempts[e.ids.attempt_id]["state"] = e.AttemptState.EN_PROGRESO
+    e.svc.finish_attempt_with_answers(
+        e.ids.attempt_id, e.ids.user_owner, [A(q, "bad", 2) for q in (e.ids.q1, e.ids.q2, e.ids.q3)]
+    )
+
+    assert len(e.db.executed) == una_fallada
+    assert len(e.db.qrecs) == 5
+
+
+def test_14_fallo_al_recalcular_areas_debiles_no_pierde_la_calificacion(fake_env):
+    """El recálculo corre en un savepoint: si falla se revierte solo él y el intento queda calificado"""
+    e = fake_env
+    savepoint = types.SimpleNamespace(rolled_back=False)
+
+    @contextlib.contextmanager
+    def begin_nested():
+        try:
+            yield
+        except Exception:
+            savepoint.rolled_back = True
+            raise
+
+    def boom(attempt_id):
+        raise RuntimeError("deadlock detected")
+
+    e.db.begin_nested = begin_nested
+    e.svc.weak_area_repo.refresh_for_attempt = boom
+
+    out = e.svc.finish_attempt_with_answers(
+        e.ids.attempt_id, e.ids.user_owner, [A(e.ids.q1, "wrong", 10)]
+    )
+
+    assert savepoint.rolled_back is True
+    assert out.attempt.attempt_id == e.ids.attempt_id
+    assert e.attempts[e.ids.attempt_id]["state"] == e.AttemptState.CALIFICADO
+
+
+def test_15_reenvio_reemplaza_respuestas_sin_duplicar(fake_env):
+    """DELETE e INSERT van en sentencias separadas: el INSERT ya no ve las respuestas anteriores"""
+    e = fake_env
+    answers = [A(e.ids.q1, "bad", 2), A(e.ids.q2, e.ids.ok2, 2), A(e.ids.q3, e.ids.ok3, 2)]
+    e.svc.finish_attempt_with_answers(e.ids.attempt_id, e.ids.user_owner, answers)
+
+    e.attempts[e.ids.attempt_id]["state"] = e.AttemptState.EN_PROGRESO
+    e.svc.finish_attempt_with_answers(
+        e.ids.attempt_id, e.ids.user_owner, [A(e.ids.q1, e.ids.ok1, 3), *answers[1:]]
+    )
+
+    assert len(e.db.qresponses) == 3
+    assert next(r for r in e.db.qresponses if r["question_id"] == e.ids.q1)["is_correct"] is True
+
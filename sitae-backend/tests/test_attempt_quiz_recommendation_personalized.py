@@ -1,3 +1,4 @@
+import contextlib
 import types
 import uuid
 import pytest
@@ -35,10 +36,10 @@ class FakeDB:
     DB fake compatible con finish_attempt_with_personalization:
     - SELECT preguntas + opción correcta + OT
     - DELETE/INSERT question_response
-    - UPDATE/SELECT comment en question_response
     - SELECT option text
-    - SELECT recursos por OT
-    - INSERT question_recommendation (upsert simplificado)
+    - UPDATE comment en bloque
+    - SELECT recursos de fallback por OT
+    - INSERT question_recommendation multi-fila (upsert simplificado)
     """
     def __init__(self):
         self.questions = {}       # qid -> Row(id, text, score, topic_objective_id, quiz_id, correct_explanation?)
@@ -50,6 +51,7 @@ class FakeDB:
         self.executed = []
 
     def commit(self): pass
+    def begin_nested(self): return contextlib.nullcontext()
 
     # -- utilidades internas --
     def _select_questions_join_ok(self, quiz_id):
@@ -115,51 +117,50 @@ class FakeDB:
             })
             return self._Result([])
 
-        # UPDATE comment en question_response
-        if sql.startswith("update public.question_response") and "set comment = :exp" in sql:
+        # UPDATE comment en question_response (en bloque)
+        if sql.startswith("update public.question_response") and "unnest(" in sql:
+            comments = dict(zip(params["qids"], params["comments"]))
             for r in self.qresponses:
-                if r["attempt_quiz_id"] == params["aid"] and r["question_id"] == params["qid"]:
-                    r["comment"] = params["exp"]
-            return self._Result([])
-
-        # SELECT comment en question_response
-        if "select comment from public.question_response" in sql:
-            for r in self.qresponses:
-                if r["attempt_quiz_id"] == params["aid"] and r["question_id"] == params["qid"]:
-                    return self._Result([Row(comment=r["comment"])])
+                if r["attempt_quiz_id"] == params["aid"] and r["question_id"] in comments:
+                    r["comment"] = comments[r["question_id"]]
             return self._Result([])
 
         # SELECT option text
         if "from public.option where id = :oid" in sql:
             return self._Result([self._select_option_text(params["oid"])])
 
-        # SELECT recursos por OT
-        if "from public.resource r" in sql and "where r.topic_objective_id = :ot" in sql:
-            return self._Result(self._select_resources_by_ot(params["ot"]))
+        # SELECT recursos de fallback (top 3 por OT, varios OT)
+        if "from public.resource r" in sql and "r.topic_objective_id = any(" in sql:
+            rows = []
+            for ot_id in sorted(params["ots"]):
+                rows.extend(self._select_resources_by_ot(ot_id)[:3])
+            return self._Result(rows)
 
-        # INSERT/UPSERT question_recommendation
+        # INSERT/UPSERT question_recommendation multi-fila
         if sql.startswith("insert into public.question_recommendation"):
-            row = {
-                "attempt_quiz_id": params["aid"],
-                "question_id": params["qid"],
-                "resource_id": params["rid"],     # puede ser None si is_external=True
-                "rank_position": params["rank"],
-                "why_text": params["why"],
-                "source": params["src"],
-            }
-            # upsert simplificado por clave (aid, qid, rid)
-            found = next((i for i, r in enumerate(self.qrecs)
-                          if r["attempt_quiz_id"] == row["attempt_quiz_id"]
-                          and r["question_id"] == row["question_id"]
-                          and r["resource_id"] == row["resource_id"]), None)
-            if found is None:
-                self.qrecs.append(row)
-            else:
-                self.qrecs[found].update({
-                    "rank_position": row["rank_position"],
-                    "why_text": row["why_text"],
-                    "source": row["source"]
-                })
+            update_existing = "do update" in sql
+            for qid, rid, rank, why in zip(params["qids"], params["rids"], params["ranks"], params["whys"]):
+                row = {
+                    "attempt_quiz_id": params["aid"],
+                    "question_id": qid,
+                    "resource_id": rid,     # puede ser None si is_external=True
+                    "rank_position": rank,
+                    "why_text": why,
+                    "source": params["src"],
+                }
+                # upsert simplificado por clave (aid, qid, rid)
+                found = next((i for i, r in enumerate(self.qrecs)
+                              if r["attempt_quiz_id"] == row["attempt_quiz_id"]
+                              and r["question_id"] == row["question_id"]
+                              and r["resource_id"] == row["resource_id"]), None)
+                if found is None:
+                    self.qrecs.append(row)
+                elif update_existing:
+                    self.qrecs[found].update({
+                        "rank_position": row["rank_position"],
+                        "why_text": row["why_text"],
+                        "source": row["source"]
+                    })
             return self._Result([])
 
         return self._Result([])
@@ -196,6 +197,15 @@ class FakePersonalizedRecommendationService:
         self.raise_on_analysis = raise_on_analysis
         self.mixed_external = mixed_external
 
+    def preload_error_analyses(self, questions, course_profile):
+        return {}
+
+    def preload_why_texts(self, questions, user_profile, course_profile, max_recommendations=3):
+        pass
+
+    def save_generated_texts(self):
+        pass
+
     async def generate_error_analysis(self, **kwargs):
         if self.raise_on_analysis:
             raise RuntimeError("LLM down")
@@ -288,6 +298,8 @@ def fake_env_pers(monkeypatch):
 
     # Evita navegar repos: fuerza course_id fijo
     monkeypatch.setattr(svc, "_get_course_id_from_quiz", lambda _quiz_id: "course-1")
+    # Los fakes de personalización cubren el modo por pregunta (el batch tiene su propio test)
+    monkeypatch.setattr("app.services.attempt_quiz_service.settings.PERSONALIZATION_BATCH_MODE", False)
 
     # Inyecta fakes de perfil/personalización por defecto (OK)
     monkeypatch.setattr("app.services.attempt_quiz_service.ProfileService", FakeProfileService)
@@ -402,3 +414,395 @@ async def test_p5_seguridad_intento_ajeno(fake_env_pers):
     with pytest.raises(Exception) as ex:
         await e.svc.finish_attempt_with_personalization(e.ids.attempt_id, e.ids.user_owner, [])
     assert "not your attempt" in str(ex.value).lower() or "403" in str(ex.value)
+
+
+@pytest.mark.asyncio
+async def test_p6_personaliza_incorrectas_en_paralelo_y_persiste_en_bloque(fake_env_pers, monkeypatch):
+    """
+    - Las llamadas LLM de todas las preguntas incorrectas se solapan.
+    - Los comentarios y recomendaciones se escriben al final, en bloque.
+    """
+    import asyncio
+
+    class SlowRecService(FakePersonalizedRecommendationService):
+        in_flight = max_in_flight = 0
+
+        async def generate_error_analysis(self, **kwargs):
+            cls = SlowRecService
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+            await asyncio.sleep(0.01)
+            cls.in_flight -= 1
+            return await super().generate_error_analysis(**kwargs)
+
+    monkeypatch.setattr(
+        "app.services.attempt_quiz_service.PersonalizedRecommendationService",
+        lambda db: SlowRecService(db)
+    )
+    e = fake_env_pers
+    answers = [A(e.ids.q1, "bad", 2), A(e.ids.q2, "bad", 2), A(e.ids.q3, "bad", 2)]
+
+    out = await e.svc.finish_attempt_with_personalization(e.ids.attempt_id, e.ids.user_owner, answers)
+
+    assert SlowRecService.max_in_flight == 3
+    assert all(q.comment and "Tu error fue" in q.comment for q in out.questions)
+    assert all(r["comment"] for r in e.db.qresponses)
+    assert sum(1 for sql in e.db.executed if sql.startswith("insert into public.question_recommendation")) == 1
+    assert len(e.db.qrecs) == 3
+
+
+@pytest.mark.asyncio
+async def test_p7_modo_batch_un_request_y_fallback_por_item(monkeypatch):
+    """
+    - Análisis + why_text de todas las preguntas en un request JSON.
+    - Lo que no viene bien en el JSON se completa con la llamada individual.
+    """
+    import json
+    from app.services.personalized_recommendation_service import PersonalizedRecommendationService
+
+    class FakeGateway:
+        def __init__(self):
+            self.calls = []
+
+        async def chat(self, **kwargs):
+            self.calls.append(kwargs)
+            if "response_format" in kwargs:
+                content = json.dumps({
+                    "preguntas": [
+                        {"id": "P1", "analisis": "Análisis batch P1."},
+                        {"id": "P2", "analisis": 42},  # inválido -> individual
+                    ],
+                    "recursos": [{"id": "R1", "por_que": "Por qué batch."}],
+                })
+            else:
+                content = "Individual."
+            return types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=content))])
+
+    class ResourceDB:
+        def execute(self, sql, params=None):
+            rows = [] if "resource_why_text" in str(sql) or "question_error_analysis" in str(sql) else [
+                Row(id="r1", title="Video OT1", type="video", url="u1", duration_minutes=7,
+                    is_mandatory=True, difficulty="intermedio")
+            ]
+            return types.SimpleNamespace(fetchall=lambda: rows)
+
+    svc = PersonalizedRecommendationService(ResourceDB())
+    svc.gateway = FakeGateway()
+    questions = [
+        {"question_id": qid, "question_text": f"Pregunta {qid}", "topic_objective_id": "ot-1",
+         "topic_objective": "Intro", "selected_option": "X", "correct_option": "Y"}
+        for qid in ("q-1", "q-2")
+    ]
+
+    out = await svc.personalize_batch(questions, user_profile={}, course_profile={})
+
+    (a1, recs1), (a2, recs2) = out
+    assert a1 == "Análisis batch P1." and recs1[0]["why_text"] == "Por qué batch."
+    # El why_text es por recurso: q-2 reutiliza el del batch
+    assert a2 == "Individual." and recs2[0]["why_text"] == "Por qué batch."
+    # 1 batch + análisis individual de q-2
+    assert len(svc.gateway.calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_p8_why_text_cacheado_por_bucket_de_perfil():
+    """
+    - El why_text generado se guarda por (recurso, versión, bucket, modelo).
+    - Otro estudiante del mismo bucket lo reutiliza sin llamar al LLM.
+    - Si cambia el recurso (nueva versión) se vuelve a generar.
+    """
+    from app.services.personalized_recommendation_service import PersonalizedRecommendationService
+
+    class FakeGateway:
+        def __init__(self):
+            self.calls = 0
+
+        async def chat(self, **kwargs):
+            self.calls += 1
+            return types.SimpleNamespace(choices=[types.SimpleNamespace(
+                message=types.SimpleNamespace(content=f"Por qué {self.calls}.")
+            )])
+
+    class CacheDB:
+        def __init__(self):
+            self.title = "Video OT1"
+            self.stored = {}  # (rid, version, bucket, model) -> why
+
+        def begin_nested(self):
+            return contextlib.nullcontext()
+
+        def execute(self, sql, params=None):
+            sql = str(sql)
+            rows = []
+            if "INSERT INTO public.resource_why_text" in sql:
+                for rid, version, bucket, why in zip(params["rids"], params["versions"], params["buckets"], params["whys"]):
+                    self.stored.setdefault((rid, version, bucket, params["model"]), why)
+            elif "FROM public.resource_why_text" in sql:
+                rows = [
+                    Row(resource_id=rid, resource_version=version, why_text=why)
+                    for (rid, version, bucket, model), why in self.stored.items()
+                    if (rid, version) in zip(params["rids"], params["versions"])
+                    and bucket == params["bucket"] and model == params["model"]
+                ]
+            else:
+                rows = [Row(id="r1", title=self.title, type="video", url="u1", duration_minutes=7,
+                            is_mandatory=True, difficulty="intermedio")]
+            return types.SimpleNamespace(fetchall=lambda: rows)
+
+    db, gateway = CacheDB(), FakeGateway()
+
+    async def recommend(modalities, level="medio"):
+        svc = PersonalizedRecommendationService(db)
+        svc.gateway = gateway
+        recs = await svc.get_personalized_recommendations(
+            topic_objective_id="ot-1", topic_objective_description="Intro", question_text="P",
+            user_profile={"preferred_modalities": modalities}, course_profile={"prereq_level": level}
+        )
+        return recs[0]["why_text"]
+
+    first = await recommend(["video", "lectura"])
+    assert gateway.calls == 1 and len(db.stored) == 1
+    # Mismo bucket (el orden de modalidades no importa): sin LLM
+    assert await recommend(["Lectura", "video"]) == first
+    assert gateway.calls == 1
+    # Otro bucket -> se genera
+    await recommend(["video"], level="avanzado")
+    assert gateway.calls == 2
+    # Recurso editado -> nueva versión
+    db.title = "Video OT1 (v2)"
+    await recommend(["video", "lectura"])
+    assert gateway.calls == 3
+
+
+@pytest.mark.asyncio
+async def test_p9_analisis_de_error_cacheado_por_pregunta_opcion_y_nivel():
+    """
+    - Otro estudiante que marca la misma opción (mismo nivel) reutiliza el
+      análisis y el why_text: en modo batch no hay request al LLM.
+    - Otra opción marcada o una pregunta editada (nueva versión) sí lo piden.
+    """
+    import json
+    from app.services.personalized_recommendation_service import PersonalizedRecommendationService
+
+    class FakeGateway:
+        def __init__(self):
+            self.prompts = []
+
+        async def chat(self, **kwargs):
+            self.prompts.append(kwargs["messages"][-1]["content"])
+            return types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(
+                content=json.dumps({"preguntas": [{"id": "P1", "analisis": "Análisis."}],
+                                    "recursos": [{"id": "R1", "por_que": "Por qué."}]})
+            ))])
+
+    class CacheDB:
+        def __init__(self):
+            self.analyses = {}  # (qid, opt, level, version, model) -> análisis
+            self.whys = {}      # (rid, version, bucket, model) -> why
+
+        def begin_nested(self):
+            return contextlib.nullcontext()
+
+        def execute(self, sql, params=None):
+            sql = str(sql)
+            rows = []
+            if "INSERT INTO public.question_error_analysis" in sql:
+                for key in zip(params["qids"], params["opts"], params["levels"], params["versions"], params["analyses"]):
+                    self.analyses[(*key[:4], params["model"])] = key[4]
+            elif "FROM public.question_error_analysis" in sql:
+                wanted = set(zip(params["qids"], params["opts"], params["versions"]))
+                rows = [Row(question_id=q, selected_option_id=o, analysis=a)
+                        for (q, o, level, v, m), a in self.analyses.items()
+                        if (q, o, v) in wanted and level == params["level"] and m == params["model"]]
+            elif "INSERT INTO public.resource_why_text" in sql:
+                for key in zip(params["rids"], params["versions"], params["buckets"], params["whys"]):
+                    self.whys[(*key[:3], params["model"])] = key[3]
+            elif "FROM public.resource_why_text" in sql:
+                wanted = set(zip(params["rids"], params["versions"]))
+                rows = [Row(resource_id=r, resource_version=v, why_text=w)
+                        for (r, v, b, m), w in self.whys.items()
+                        if (r, v) in wanted and b == params["bucket"] and m == params["model"]]
+            else:
+                rows = [Row(id="r1", title="Video OT1", type="video", url="u1", duration_minutes=7,
+                            is_mandatory=True, difficulty="intermedio")]
+            return types.SimpleNamespace(fetchall=lambda: rows)
+
+    db, gateway = CacheDB(), FakeGateway()
+
+    async def finish(selected_option_id, question_text="Pregunta 1"):
+        svc = PersonalizedRecommendationService(db)
+        svc.gateway = gateway
+        question = {"question_id": "q-1", "selected_option_id": selected_option_id, "question_text": question_text,
+                    "topic_objective_id": "ot-1", "topic_objective": "Intro",
+                    "selected_option": f"Opción {selected_option_id}", "correct_option": "Y"}
+        [(analysis, recs)] = await svc.personalize_batch([question], user_profile={},
+                                                         course_profile={"prereq_level": "medio"})
+        return analysis, recs[0]["why_text"]
+
+    assert await finish("o-2") == ("Análisis.", "Por qué.")
+    assert len(gateway.prompts) == 1 and len(db.analyses) == 1
+    # Mismo distractor, mismo nivel: todo desde la caché
+    assert await finish("o-2") == ("Análisis.", "Por qué.")
+    assert len(gateway.prompts) == 1
+    # Otro distractor: solo se pide el análisis (el why_text ya está)
+    await finish("o-3")
+    assert len(gateway.prompts) == 2 and "RECURSOS:\n(ninguno)" in gateway.prompts[-1]
+    # Pregunta editada -> nueva versión
+    await finish("o-2", question_text="Pregunta 1 (corregida)")
+    assert len(gateway.prompts) == 3
+
+
+@pytest.mark.asyncio
+async def test_p10_fallo_de_la_cache_de_why_text_no_rompe_la_recomendacion():
+    """Lectura y escritura de la caché van en savepoints: un error es un fallo de caché, no del intento"""
+    from app.services.personalized_recommendation_service import PersonalizedRecommendationService
+
+    class FakeGateway:
+        async def chat(self, **kwargs):
+            return types.SimpleNamespace(choices=[types.SimpleNamespace(
+                message=types.SimpleNamespace(content="Por qué.")
+            )])
+
+    class BrokenCacheDB:
+        def __init__(self):
+            self.savepoints = []
+
+        @contextlib.contextmanager
+        def begin_nested(self):
+            try:
+                yield
+                self.savepoints.append("release")
+            except Exception:
+                self.savepoints.append("rollback")
+                raise
+
+        def execute(self, sql, params=None):
+            if "resource_why_text" in str(sql):
+                raise RuntimeError('relation "public.resource_why_text" does not exist')
+            rows = [Row(id="r1", title="Video OT1", type="video", url="u1", duration_minutes=7,
+                        is_mandatory=True, difficulty="intermedio")]
+            return types.SimpleNamespace(fetchall=lambda: rows)
+
+    db = BrokenCacheDB()
+    svc = PersonalizedRecommendationService(db)
+    svc.gateway = FakeGateway()
+    recs = await svc.get_personalized_recommendations(
+        topic_objective_id="ot-1", topic_objective_description="Intro", question_text="P",
+        user_profile={}, course_profile={"prereq_level": "medio"}
+    )
+
+    assert recs[0]["why_text"] == "Por qué."
+    assert db.savepoints == ["rollback", "rollback"]  # lectura = miss, escritura omitida
+
+
+@pytest.mark.asyncio
+async def test_p11_fallo_de_la_cache_de_analisis_no_rompe_el_batch():
+    """Sin la tabla question_error_analysis el batch se genera igual y la escritura se omite"""
+    import json
+    from app.services.personalized_recommendation_service import PersonalizedRecommendationService
+
+    class FakeGateway:
+        def __init__(self):
+            self.calls = 0
+
+        async def chat(self, **kwargs):
+            self.calls += 1
+            return types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(
+                content=json.dumps({"preguntas": [{"id": "P1", "analisis": "Análisis."}],
+                                    "recursos": [{"id": "R1", "por_que": "Por qué."}]})
+            ))])
+
+    class BrokenAnalysisDB:
+        def __init__(self):
+            self.rolled_back = []
+
+        @contextlib.contextmanager
+        def begin_nested(self):
+            try:
+                yield
+            except Exception as e:
+                self.rolled_back.append(str(e))
+                raise
+
+        def execute(self, sql, params=None):
+            sql = str(sql)
+            if "question_error_analysis" in sql:
+                raise RuntimeError("canceling statement due to statement timeout")
+            rows = [] if "resource_why_text" in sql else [
+                Row(id="r1", title="Video OT1", type="video", url="u1", duration_minutes=7,
+                    is_mandatory=True, difficulty="intermedio")
+            ]
+            return types.SimpleNamespace(fetchall=lambda: rows)
+
+    db, gateway = BrokenAnalysisDB(), FakeGateway()
+    svc = PersonalizedRecommendationService(db)
+    svc.gateway = gateway
+    question = {"question_id": "q-1", "selected_option_id": "o-2", "question_text": "Pregunta 1",
+                "topic_objective_id": "ot-1", "topic_objective": "Intro",
+                "selected_option": "Opción o-2", "correct_option": "Y"}
+
+    [(analysis, recs)] = await svc.personalize_batch([question], user_profile={},
+                                                     course_profile={"prereq_level": "medio"})
+
+    assert (analysis, recs[0]["why_text"]) == ("Análisis.", "Por qué.")
+    assert gateway.calls == 1
+    assert len(db.rolled_back) == 2  # lectura = miss, escritura omitida
+
+
+@pytest.mark.asyncio
+async def test_p12_modo_por_item_lee_y_escribe_la_cache_de_why_text_una_vez():
+    """Fan-out por pregunta: recursos y why_text precargados antes; una sola escritura después"""
+    import asyncio
+    from app.services.personalized_recommendation_service import PersonalizedRecommendationService
+
+    class FakeGateway:
+        async def chat(self, **kwargs):
+            return types.SimpleNamespace(choices=[types.SimpleNamespace(
+                message=types.SimpleNamespace(content="Por qué.")
+            )])
+
+    class CountingDB:
+        def __init__(self):
+            self.statements = []
+
+        def begin_nested(self):
+            return contextlib.nullcontext()
+
+        def execute(self, sql, params=None):
+            sql = str(sql)
+            if "INSERT INTO public.resource_why_text" in sql:
+                self.statements.append(("why_insert", len(params["rids"])))
+                rows = []
+            elif "FROM public.resource_why_text" in sql:
+                self.statements.append(("why_select", len(params["rids"])))
+                rows = []
+            else:
+                self.statements.append(("resources", params["ot"]))
+                rows = [Row(id=f"r-{params['ot']}", title=f"Video {params['ot']}", type="video", url="u",
+                            duration_minutes=7, is_mandatory=True, difficulty="intermedio")]
+            return types.SimpleNamespace(fetchall=lambda: rows)
+
+    db = CountingDB()
+    svc = PersonalizedRecommendationService(db)
+    svc.gateway = FakeGateway()
+    questions = [{"question_id": f"q-{i}", "topic_objective_id": ot, "topic_objective": f"Tema {ot}"}
+                 for i, ot in enumerate(["ot-1", "ot-1", "ot-2"])]
+    profile = {"prereq_level": "medio"}
+
+    svc.preload_why_texts(questions, {}, profile, max_recommendations=3)
+    recs = await asyncio.gather(*(
+        svc.get_personalized_recommendations(
+            topic_objective_id=q["topic_objective_id"], topic_objective_description=q["topic_objective"],
+            question_text="P", user_profile={}, course_profile=profile, max_recommendations=3
+        )
+        for q in questions
+    ))
+    svc.save_generated_texts()
+
+    assert [r[0]["why_text"] for r in recs] == ["Por qué."] * 3
+    assert db.statements == [
+        ("resources", "ot-1"), ("resources", "ot-2"),  # una consulta por objetivo distinto
+        ("why_select", 2),                              # una lectura antes del fan-out
+        ("why_insert", 2),                              # una escritura después
+    ]
+
@@ -0,0 +1,123 @@
+# tests/test_chat_history.py
+import uuid
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from urllib.parse import quote
+
+import pytest
+from fastapi import HTTPException
+
+import app.routers.chat as chat_router
+
+# =========================
+#  Fakes
+# =========================
+
+T0 = datetime(2026, 10, 17, 12, 0, tzinfo=timezone.utc)
+
+
+def conv(minutes, conversation_id=None, sources=None):
+    return SimpleNamespace(
+        id=conversation_id or str(uuid.uuid4()),
+        message=f"pregunta {minutes}",
+        response=f"respuesta {minutes}",
+        created_at=T0 + timedelta(minutes=minutes),
+        sources=sources,
+    )
+
+
+class FakeChatService:
+    """Emula get_conversation_history: ORDER BY created_at DESC, id DESC con (created_at, id) < before"""
+    rows = []
+    calls = []
+
+    def __init__(self, db):
+        self.db = db
+
+    def get_conversation_history(self, user_id, course_id, limit, before=None, include_sources=True):
+        FakeChatService.calls.append({"limit": limit, "before": before, "include_sources": include_sources})
+        rows = sorted(self.rows, key=lambda c: (c.created_at, c.id), reverse=True)
+        if before is not None:
+            rows = [c for c in rows if (c.created_at, c.id) < before]
+        return rows[:limit]
+
+
+@pytest.fixture
+def history(monkeypatch):
+    FakeChatService.rows = []
+    FakeChatService.calls = []
+    monkeypatch.setattr(chat_router, "ChatService", FakeChatService)
+    monkeypatch.setattr(chat_router, "verify_course_access", lambda course_id, user_id, db: True)
+
+    async def get(limit=20, before=None, include_sources=True):
+        return await chat_router.get_chat_history(
+            course_id="course-1", limit=limit, before=before, include_sources=include_sources,
+            current_user={"id": "user-1"}, db=None,
+        )
+    return get
+
+# =========================
+#  Tests
+# =========================
+
+def test_1_cursor_ida_y_vuelta_es_seguro_en_urls():
+    conversation_id = str(uuid.uuid4())
+    created_at = datetime(2026, 10, 17, 9, 30, 15, 123456, tzinfo=timezone.utc)
+
+    cursor = chat_router._encode_cursor(created_at, conversation_id)
+
+    assert quote(cursor, safe="") == cursor  # viaja en la query sin codificar
+    assert chat_router._decode_cursor(cursor) == (created_at, conversation_id)
+
+
+def test_2_cursor_invalido_400():
+    for cursor in ("no-es-un-cursor", "2026-10-17T09:30:15+00:00,abc", "%%%"):
+        with pytest.raises(HTTPException) as exc:
+            chat_router._decode_cursor(cursor)
+        assert exc.value.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_3_has_more_y_next_cursor(history):
+    FakeChatService.rows = [conv(m) for m in range(5)]
+
+    first = await history(limit=2)
+    second = await history(limit=2, before=first.next_cursor)
+    last = await history(limit=2, before=second.next_cursor)
+
+    assert [c.message for c in first.conversations] == ["pregunta 4", "pregunta 3"]
+    assert [c.message for c in second.conversations] == ["pregunta 2", "pregunta 1"]
+    assert [c.message for c in last.conversations] == ["pregunta 0"]
+    assert first.next_cursor and second.next_cursor and last.next_cursor is None
+    assert FakeChatService.calls[0]["limit"] == 3  # una fila extra para saber si hay más
+
+
+@pytest.mark.asyncio
+async def test_4_empate_en_created_at_no_pierde_ni_repite(history):
+    ids = sorted(str(uuid.uuid4()) for _ in range(3))
+    FakeChatService.rows = [conv(0, i) for i in ids] + [conv(-1)]
+
+    seen, cursor = [], None
+    while True:
+        page = await history(limit=1, before=cursor)
+        seen.extend(c.id for c in page.conversations)
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+
+    assert seen[:3] == list(reversed(ids))
+    assert len(seen) == len(set(seen)) == 4
+
+
+@pytest.mark.asyncio
+async def test_5_include_sources_false_omite_fuentes(history):
+    source = {"document_id": "d1", "document_title": "Guía", "document_type": "pdf",
+              "chunk_text": "Las listas son mutables", "relevance_score": 0.9}
+    FakeChatService.rows = [conv(0, sources=[source])]
+
+    with_sources = await history()
+    without = await history(include_sources=False)
+
+    assert len(with_sources.conversations[0].sources) == 1
+    assert without.conversations[0].sources == []
+    assert FakeChatService.calls[-1]["include_sources"] is False
@@ -54,6 +54,39 @@ class FakeOpenAIClient:
         self._tokens = tokens
         self.chat = FakeOpenAIClient._Chat(self)
 
+class FakeAsyncStream:
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._chunks)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeAsyncClient:
+    """Cliente async para el gateway; delega en el fake sync (los tests parchean su create)"""
+    def __init__(self, fake):
+        async def create(**kwargs):
+            result = fake.chat.completions.create(**kwargs)
+            return FakeAsyncStream(result) if kwargs.get("stream") else result
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=create))
+
+
+def make_fake_gateway(fake):
+    from app.core.llm_gateway import LLMGateway
+    gateway = LLMGateway(api_key="sk-test", backoff_base=0)
+    gateway._new_async_client = lambda: FakeAsyncClient(fake)
+    return gateway
+
 # Fake modelos ORM
 class _Col:
     """Simula una columna SQLAlchemy que soporta .desc()."""
@@ -126,13 +159,15 @@ class FakeDBSession:
         self.did_commit = False
         self.did_refresh = False
         self.did_rollback = False
+        self.last_execute_sql = None
         self.last_execute_params = None
 
     def query(self, model):
         return QueryStub(self, model)
 
     def execute(self, sql_text_obj, params=None):
-        # Guarda params para aserciones
+        # Guarda SQL y params para aserciones
+        self.last_execute_sql = str(sql_text_obj)
         self.last_execute_params = params or {}
         if self._execute_should_raise:
             raise RuntimeError("SQL error simulated")
@@ -173,7 +208,11 @@ def patch_module(monkeypatch):
     monkeypatch.setattr(chat_module, "Conversation", FakeConversation, raising=True)
     monkeypatch.setattr(chat_module, "Course", FakeCourse, raising=True)
     # settings
-    fake_settings = SimpleNamespace(OPENAI_API_KEY="test", CHAT_MODEL="gpt-x")
+    fake_settings = SimpleNamespace(
+        OPENAI_API_KEY="test", CHAT_MODEL="gpt-x",
+        CHAT_SEARCH_TIMEOUT_SECONDS=5, CHAT_DB_STAGE_TIMEOUT_SECONDS=5,
+        CONVERSATION_SUMMARY_ENABLED=False,
+    )
     monkeypatch.setattr(chat_module, "settings", fake_settings, raising=True)
 
 @pytest.fixture
@@ -200,8 +239,9 @@ def base_env(monkeypatch):
     # Instancia ChatService real (pero lo cableamos con fakes)
     svc = chat_module.ChatService(db)
 
-    # OpenAI fake
-    svc.client = FakeOpenAIClient(content="respuesta LLM", tokens=321)
+    # OpenAI fake (a través de un gateway propio)
+    client = FakeOpenAIClient(content="respuesta LLM", tokens=321)
+    svc.gateway = make_fake_gateway(client)
 
     # Embedding fake
     class FakeEmbedding:
@@ -250,7 +290,7 @@ def base_env(monkeypatch):
 
     svc.profile_service = FakeProfile()
 
-    return SimpleNamespace(svc=svc, db=db, FakeEmbedding=FakeEmbedding)
+    return SimpleNamespace(svc=svc, db=db, client=client, FakeEmbedding=FakeEmbedding)
 
 # =========================================
 #  10 CASOS PRIORIZADOS (de la lista top)
@@ -294,7 +334,7 @@ async def test_3_openai_falla_rolls_back(base_env, monkeypatch):
         raise RuntimeError("OpenAI down")
 
     # Forzamos que la llamada al LLM falle
-    monkeypatch.setattr(e.svc.client.chat.completions, "create", boom)
+    monkeypatch.setattr(e.client.chat.completions, "create", boom)
 
     with pytest.raises(RuntimeError):
         await e.svc.process_message("user-1", "course-1", "hola?")
@@ -330,12 +370,12 @@ async def test_6_historial_incluido_en_orden(monkeypatch, base_env):
     captured = {}
 
     # Envuelve la llamada a OpenAI para inspeccionar los mensajes enviados
-    real = e.svc.client.chat.completions.create
+    real = e.client.chat.completions.create
     def spy(**kwargs):
         captured['messages'] = kwargs.get("messages", [])
         return real(**kwargs)
 
-    monkeypatch.setattr(e.svc.client.chat.completions, "create", spy)
+    monkeypatch.setattr(e.client.chat.completions, "create", spy)
     e.db._execute_rows = []
     await e.svc.process_message("user-1", "course-1", "mensaje actual")
     msgs = captured['messages']
@@ -359,6 +399,9 @@ def test_7_get_weak_areas_con_resultados(base_env):
     assert "- Comprensiones (2 fallos)" in txt
     # Parámetros pasados correctamente
     assert e.db.last_execute_params == {"user_id": "user-1", "course_id": "course-1"}
+    # Lee la proyección por la PK, no recorre el historial de respuestas
+    assert "FROM public.user_topic_objective_stats s" in e.db.last_execute_sql
+    assert "question_response" not in e.db.last_execute_sql
 
 def test_8_get_weak_areas_error_sql_hace_rollback(base_env):
     e = base_env
@@ -398,3 +441,187 @@ def test_10_build_system_prompt_con_fuentes(base_env):
         "pensamiento crítico", "tono amigable", "conceptos erróneos",
     ]:
         assert s in prompt
+
+
+def _stream_chunks(parts, total_tokens=42):
+    """Chunks como los de chat.completions con stream=True (el último solo trae usage)"""
+    for p in parts:
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=p))], usage=None)
+    yield SimpleNamespace(choices=[], usage=SimpleNamespace(total_tokens=total_tokens))
+
+
+@pytest.mark.asyncio
+async def test_11_stream_fuentes_tokens_y_guarda_al_final(base_env, monkeypatch):
+    e = base_env
+    monkeypatch.setattr(e.client.chat.completions, "create",
+                        lambda **kw: _stream_chunks(["Hola", ", ", "mundo"]))
+
+    events = [ev async for ev in e.svc.stream_message("user-1", "course-1", "¿qué es?", include_history=False)]
+
+    assert [ev["event"] for ev in events] == ["sources", "token", "token", "token", "done"]
+    assert len(events[0]["data"]) == 3
+    assert e.db._added[0].response == "Hola, mundo"
+    assert events[-1]["data"]["conversation_id"] == e.db._added[0].id
+    assert events[-1]["data"]["tokens_used"] == 42
+
+
+@pytest.mark.asyncio
+async def test_12_stream_cancelado_no_guarda_conversacion(base_env, monkeypatch):
+    e = base_env
+    monkeypatch.setattr(e.client.chat.completions, "create",
+                        lambda **kw: _stream_chunks(["a", "b", "c"]))
+
+    events = e.svc.stream_message("user-1", "course-1", "hola", include_history=False)
+    assert (await events.__anext__())["event"] == "sources"
+    assert (await events.__anext__())["data"] == "a"
+    await events.aclose()  # el cliente se desconecta
+
+    assert e.db._added == []
+    assert e.db.did_commit is False
+
+
+@pytest.mark.asyncio
+async def test_13_busqueda_lenta_se_omite_por_timeout(base_env, monkeypatch):
+    import time
+    e = base_env
+    monkeypatch.setattr(chat_module.settings, "CHAT_SEARCH_TIMEOUT_SECONDS", 0.05)
+
+    class SlowEmbedding(e.FakeEmbedding):
+        def search_similar_content(self, course_id, query, n_results):
+            time.sleep(0.5)
+            return super().search_similar_content(course_id, query, n_results)
+
+    e.svc.embedding_service = SlowEmbedding()
+
+    t0 = time.perf_counter()
+    resp = await e.svc.process_message("user-1", "course-1", "hola", include_history=True)
+
+    assert time.perf_counter() - t0 < 0.4
+    assert resp.response == "respuesta LLM"
+    assert resp.sources == []
+    assert e.db.did_commit is True
+
+
+@pytest.mark.asyncio
+async def test_14_cache_semantica_evita_llamar_al_llm(base_env, monkeypatch):
+    from app.core.answer_cache import SemanticAnswerCache
+    e = base_env
+    e.svc.answer_cache = SemanticAnswerCache(threshold=0.9)
+
+    class EmbeddingConQuery(e.FakeEmbedding):
+        def _embed_query(self, query):
+            return [1.0, 0.0] if "lista" in query else [0.0, 1.0]
+
+    e.svc.embedding_service = EmbeddingConQuery()
+    first = await e.svc.process_message("user-1", "course-1", "¿qué es una lista?", include_history=False)
+    assert first.cached is False
+
+    def boom(**kwargs):
+        raise AssertionError("no debería llamar al LLM")
+    monkeypatch.setattr(e.client.chat.completions, "create", boom)
+
+    second = await e.svc.process_message("user-2", "course-1", "qué es una lista", include_history=False)
+    assert second.cached is True
+    assert second.response == first.response
+    assert [s.document_id for s in second.sources] == [s.document_id for s in first.sources]
+    assert len(e.db._added) == 2  # ambas conversaciones quedan en el historial
+
+
+@pytest.mark.asyncio
+async def test_15_etapa_bd_lenta_se_cancela_en_el_servidor(base_env):
+    """La etapa corre con statement_timeout en un savepoint; si la consulta se cancela se revierte solo el savepoint"""
+    e = base_env
+    log = []
+
+    class Savepoint:
+        def commit(self):
+            log.append("release")
+
+        def rollback(self):
+            log.append("rollback_to_savepoint")
+
+    e.db.bind = SimpleNamespace(dialect=SimpleNamespace(name="postgresql"))
+    e.db.begin_nested = lambda: Savepoint()
+    real_execute = e.db.execute
+
+    def execute(sql, params=None):
+        log.append(str(sql).split("(")[0].strip())
+        return real_execute(sql, params)
+    e.db.execute = execute
+
+    def slow_query(user_id, course_id):
+        raise RuntimeError("canceling statement due to statement timeout")
+
+    out = await e.svc._run_stage("áreas débiles", slow_query, "user-1", "course-1",
+                                 timeout=0.25, fallback="sin áreas")
+
+    assert out == "sin áreas"
+    assert log == ["SELECT set_config", "rollback_to_savepoint"]
+    assert e.db.last_execute_params == {"ms": "250"}
+    assert not e.svc._db_lock.locked()
+
+    log.clear()
+    assert await e.svc._run_stage("perfil", lambda u, c: "ok", "user-1", "course-1",
+                                  timeout=0.25, fallback=None) == "ok"
+    assert log == ["SELECT set_config", "SET LOCAL statement_timeout TO DEFAULT", "release"]
+
+
+@pytest.mark.asyncio
+async def test_16_cache_semantica_no_responde_seguimientos_con_historial(base_env, monkeypatch):
+    """Con historial en el prompt la pregunta puede depender de la conversación: no se sirve de la caché"""
+    from app.core.answer_cache import SemanticAnswerCache
+    e = base_env
+    e.svc.answer_cache = SemanticAnswerCache(threshold=0.9)
+
+    class EmbeddingFija(e.FakeEmbedding):
+        def _embed_query(self, query):
+            return [1.0, 0.0]
+
+    e.svc.embedding_service = EmbeddingFija()
+    first = await e.svc.process_message("user-2", "course-1", "¿y el segundo ejemplo?", include_history=False)
+    assert first.cached is False
+
+    calls = []
+    real = e.client.chat.completions.create
+    monkeypatch.setattr(e.client.chat.completions, "create", lambda **kw: calls.append(kw) or real(**kw))
+    real_execute = e.db.execute
+
+    def execute(sql, params=None):
+        if "FROM public.conversation" in str(sql):
+            return SimpleNamespace(fetchone=lambda: (1,))  # user-1 ya conversó en el curso
+        return real_execute(sql, params)
+    e.db.execute = execute
+
+    second = await e.svc.process_message("user-1", "course-1", "¿y el segundo ejemplo?", include_history=True)
+
+    assert second.cached is False
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_17_etapa_bd_cuenta_el_timeout_desde_que_obtiene_el_lock(base_env):
+    """La espera detrás de otra etapa no consume el timeout; una etapa abandonada en la cola no toca la sesión"""
+    import asyncio
+    e = base_env
+    calls = []
+
+    def query(user_id, course_id):
+        calls.append(user_id)
+        return f"ok {user_id}"
+
+    e.svc._db_lock.acquire()
+    try:
+        queued = asyncio.create_task(e.svc._run_stage("perfil", query, "user-1", "course-1",
+                                                      timeout=0.1, fallback=None))
+        abandoned = asyncio.create_task(e.svc._run_stage("historial", query, "user-2", "course-1",
+                                                         timeout=0.1, fallback=None))
+        await asyncio.sleep(0.3)  # más que el timeout, esperando el lock
+        abandoned.cancel()        # p.ej. el request terminó o se canceló
+        await asyncio.sleep(0.05)
+    finally:
+        e.svc._db_lock.release()
+
+    assert await queued == "ok user-1"
+    await asyncio.sleep(0.05)
+    assert calls == ["user-1"]
+    assert not e.svc._db_lock.locked()
@@ -0,0 +1,30 @@
+# tests/test_conversation_summary.py
+from types import SimpleNamespace
+
+from app.services.conversation_summary_service import extractive_summary
+
+
+def turn(message: str, response: str):
+    return SimpleNamespace(message=message, response=response)
+
+
+def test_1_resumen_extractivo_agrega_primera_oracion_de_cada_turno():
+    summary = extractive_summary(
+        "- Preguntó: ¿Qué es una lista? | Se explicó: Una colección ordenada.",
+        [turn("¿Y una tupla? Tengo dudas.", "Es inmutable. Se define con paréntesis.")],
+        max_chars=1000
+    )
+
+    lines = summary.split("\n")
+    assert len(lines) == 2
+    assert lines[1] == "- Preguntó: ¿Y una tupla? | Se explicó: Es inmutable."
+
+
+def test_2_resumen_extractivo_descarta_lo_mas_antiguo_si_no_cabe():
+    turns = [turn(f"pregunta {i}.", f"respuesta {i}.") for i in range(10)]
+
+    summary = extractive_summary("", turns, max_chars=120)
+
+    assert len(summary) <= 120
+    assert "pregunta 9" in summary
+    assert "pregunta 0" not in summary
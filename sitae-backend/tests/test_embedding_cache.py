@@ -0,0 +1,78 @@
+# tests/test_embedding_cache.py
+import pytest
+
+import app.services.embedding_service as emb_module
+from app.core.embedding_cache import EmbeddingCache
+
+
+class FakeExecutor:
+    def __init__(self):
+        self.calls = []
+
+    def embed(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(t)), 0.5] for t in texts]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    c = EmbeddingCache(str(tmp_path / "emb.sqlite3"), max_bytes=10_000_000)
+    yield c
+    c.close()
+
+
+def test_1_solo_los_misses_van_al_proveedor(cache):
+    service = emb_module.EmbeddingService.__new__(emb_module.EmbeddingService)
+    service.provider = FakeExecutor()
+    service.cache = cache
+    service.embedding_model = "fake-model"
+
+    first = service._generate_embeddings(["hola", "mundo"])
+    # Re-subida corregida: un chunk igual (con espacios distintos) y uno nuevo
+    second = service._generate_embeddings(["hola  \r\n", "mundo cruel"])
+
+    assert service.provider.calls == [["hola", "mundo"], ["mundo cruel"]]
+    assert second[0] == first[0]
+    assert second[1] == [11.0, 0.5]
+    assert (cache.hits, cache.misses) == (1, 3)
+    # Otro modelo no comparte entradas
+    assert cache.get_many("otro-modelo", ["hola"]) == [None]
+
+
+def test_2_desalojo_lru_por_tamano(tmp_path):
+    vector = [0.0] * 100                     # 400 bytes en float32
+    cache = EmbeddingCache(str(tmp_path / "emb.sqlite3"), max_bytes=2_000)
+    cache.put_many("m", [(f"t{i}", vector) for i in range(4)])
+    cache.get_many("m", ["t0"])              # t0 pasa a ser el más reciente
+    cache.put_many("m", [("t4", vector), ("t5", vector)])
+
+    present = [v is not None for v in cache.get_many("m", [f"t{i}" for i in range(6)])]
+    assert cache.stats()["bytes"] <= 2_000
+    assert present[0] and present[5]         # el usado y el recién escrito sobreviven
+    assert not present[1]                    # el menos usado se desaloja
+    assert cache.stats()["evictions"] >= 1
+    cache.close()
+
+
+def test_3_queries_repetidas_no_salen_a_la_red():
+    from app.core.cache import TTLCache
+
+    service = emb_module.EmbeddingService.__new__(emb_module.EmbeddingService)
+    class ChunkCacheIntocable:
+        def __getattr__(self, name):
+            raise AssertionError("las queries no van a la caché persistente de chunks")
+
+    service.provider = FakeExecutor()
+    service.cache = ChunkCacheIntocable()
+    service.embedding_model = "fake-model"
+    service.query_cache = TTLCache(maxsize=10, ttl=60)
+
+    first = service._embed_query("¿Qué es una  lista?")
+    again = service._embed_query("qué es una lista")
+    other = service._embed_query("qué es un diccionario")
+
+    assert first == again != other
+    # Se embebe la query original; la normalizada solo es la clave
+    assert service.provider.calls == [["¿Qué es una  lista?"], ["qué es un diccionario"]]
+    stats = service.query_cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 2, 0.3333)
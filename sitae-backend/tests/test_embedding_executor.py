@@ -0,0 +1,114 @@
+# tests/test_embedding_executor.py
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from openai import OpenAI
+
+from app.services.embedding_executor import EmbeddingExecutor, TokenBucket
+
+# =========================
+#  Endpoint de embeddings falso (local)
+# =========================
+
+class FakeEmbeddingsHandler(BaseHTTPRequestHandler):
+    """POST /v1/embeddings: vector = [largo del texto]; el primer request responde 429"""
+    requests = []
+    fail_first = True
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with self.lock:
+            cls = type(self)
+            cls.requests.append(body["input"])
+            fail = cls.fail_first
+            cls.fail_first = False
+
+        if fail:
+            payload = {"error": {"message": "rate limited", "type": "requests"}}
+            self._reply(429, payload, {"Retry-After": "0"})
+            return
+
+        # Se devuelven desordenados: el ejecutor debe ordenar por `index`
+        data = [
+            {"object": "embedding", "index": i, "embedding": [float(len(t))]}
+            for i, t in enumerate(body["input"])
+        ][::-1]
+        self._reply(200, {
+            "object": "list", "data": data, "model": body["model"],
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        })
+
+    def _reply(self, status, payload, headers=None):
+        raw = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def fake_endpoint():
+    FakeEmbeddingsHandler.requests = []
+    FakeEmbeddingsHandler.fail_first = True
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeEmbeddingsHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/v1"
+    server.shutdown()
+    server.server_close()
+
+
+# =========================
+#  Tests
+# =========================
+
+def test_1_lotes_concurrentes_con_reintento_conservan_orden(fake_endpoint):
+    client = OpenAI(api_key="test", base_url=fake_endpoint, max_retries=0)
+    executor = EmbeddingExecutor(
+        client=client,
+        model="fake-model",
+        count_tokens=len,
+        max_batch_tokens=50,
+        max_batch_inputs=4,
+        max_concurrency=3,
+        backoff_base=0.01,
+    )
+    texts = ["x" * (i % 17 + 1) for i in range(30)]
+
+    vectors = executor.embed(texts)
+
+    assert vectors == [[float(len(t))] for t in texts]
+    sent = FakeEmbeddingsHandler.requests
+    # Hubo un 429 reintentado: un request más que lotes
+    assert len(sent) == len(executor._make_batches(texts)) + 1
+    # Ningún lote excede los límites de inputs y tokens
+    assert all(len(b) <= 4 and sum(map(len, b)) <= 50 for b in sent)
+
+
+def test_2_token_bucket_bloquea_al_agotarse(monkeypatch):
+    import app.services.embedding_executor as ex_module
+
+    sleeps = []
+    clock = [0.0]
+    monkeypatch.setattr(ex_module.time, "monotonic", lambda: clock[0])
+
+    def fake_sleep(secs):
+        sleeps.append(secs)
+        clock[0] += secs
+
+    monkeypatch.setattr(ex_module.time, "sleep", fake_sleep)
+
+    bucket = TokenBucket(rate_per_minute=60)  # 1 unidad por segundo
+    bucket.acquire(60)
+    assert sleeps == []
+    bucket.acquire(3)
+    assert sleeps == [pytest.approx(3.0)]
@@ -0,0 +1,21 @@
+# tests/test_embedding_providers.py
+import numpy as np
+
+from app.services.embedding_providers import HashingEmbeddingProvider
+
+
+def test_1_proveedor_local_determinista_y_normalizado():
+    provider = HashingEmbeddingProvider(dimensions=64)
+    texts = ["qué es una lista en python", "qué es un diccionario en python", "", "qué es una lista en python"]
+
+    vectors = np.array(provider.embed(texts))
+
+    assert vectors.shape == (4, 64)
+    assert np.allclose(np.linalg.norm(vectors[[0, 1, 3]], axis=1), 1.0, atol=1e-6)
+    assert not vectors[2].any()                      # texto vacío -> vector cero
+    # Determinista dentro del lote y entre instancias/procesos (crc32)
+    assert vectors[0].tolist() == vectors[3].tolist()
+    assert HashingEmbeddingProvider(dimensions=64).embed(texts[:1])[0] == vectors[0].tolist()
+    # Textos parecidos quedan más cerca que textos sin relación
+    far = np.array(provider.embed(["bucle while con break"])[0])
+    assert vectors[0] @ vectors[1] > vectors[0] @ far
@@ -0,0 +1,216 @@
+# tests/test_embedding_service.py
+import types
+import pytest
+
+import app.services.embedding_service as emb_module
+
+# =========================
+#  Dummies / Fakes comunes
+# =========================
+
+class DummyEncoding:
+    """1 token por carácter: suficiente para probar límites de chunking."""
+    def encode(self, s: str):
+        return list(s.encode("utf-8"))
+
+    def decode(self, tokens):
+        return bytes(tokens).decode("utf-8", errors="ignore")
+
+    def decode_single_token_bytes(self, token):
+        return bytes([token])
+
+
+class FakeCollection:
+    def __init__(self):
+        self.rows = {}        # id -> dict(embedding, document, metadata)
+        self.calls = []       # tamaño de cada lote escrito
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        self.calls.append(len(ids))
+        for i, e, d, m in zip(ids, embeddings, documents, metadatas):
+            self.rows[i] = {"embedding": e, "document": d, "metadata": m}
+
+    def get(self, where, include=None):
+        ids = [
+            i for i, r in self.rows.items()
+            if all(r["metadata"].get(k) == v for k, v in where.items())
+        ]
+        return {"ids": ids, "metadatas": [self.rows[i]["metadata"] for i in ids]}
+
+    def update(self, ids, metadatas):
+        for i, m in zip(ids, metadatas):
+            self.rows[i]["metadata"] = m
+
+    def delete(self, ids):
+        for i in ids:
+            del self.rows[i]
+
+
+class FakeVectorStore:
+    def __init__(self):
+        self.collection = FakeCollection()
+
+    def get_or_create_collection(self, name):
+        return self.collection
+
+
+@pytest.fixture
+def svc(monkeypatch):
+    """EmbeddingService sin red: encoding y vector store falsos."""
+    service = emb_module.EmbeddingService.__new__(emb_module.EmbeddingService)
+    service.encoding = DummyEncoding()
+    service.vector_store = FakeVectorStore()
+    service.embedding_model = "fake-model"
+    service.embedded_batches = []
+
+    def fake_embeddings(texts):
+        service.embedded_batches.append(list(texts))
+        return [[float(len(t))] for t in texts]
+
+    service._generate_embeddings = fake_embeddings
+    monkeypatch.setattr(emb_module.settings, "EMBEDDING_BATCH_SIZE", 2, raising=False)
+    return service
+
+
+# =========================
+#  Tests
+# =========================
+
+def test_1_chunk_text_respeta_max_tokens_y_overlap(svc):
+    text = " ".join(f"palabra{i}" for i in range(200))
+    chunks = svc._chunk_text(text, max_tokens=60, overlap=2)
+    assert len(chunks) > 1
+    assert all(len(c.replace(" ", "")) <= 60 for c in chunks)
+    # Overlap de 2 palabras entre chunks consecutivos
+    for prev, nxt in zip(chunks, chunks[1:]):
+        assert prev.split()[-2:] == nxt.split()[:2]
+    # No se pierde ninguna palabra
+    seen = {w for c in chunks for w in c.split()}
+    assert seen == set(text.split())
+
+
+@pytest.mark.parametrize("strategy", ["words", "tokens", "lines"])
+def test_1b_chunking_incremental_equivale_a_un_solo_texto(strategy):
+    from app.services.text_chunker import ChunkingConfig, get_chunker
+
+    pages = [" ".join(f"p{p}w{i}" for i in range(37)) + "\n" for p in range(9)]
+    chunker = get_chunker(DummyEncoding(), ChunkingConfig(strategy=strategy, max_tokens=80, overlap=8))
+    assert list(chunker.iter_chunks(pages)) == chunker.split("".join(pages))
+
+
+def test_2_process_document_escribe_por_lotes(svc, tmp_path):
+    path = tmp_path / "script.py"
+    path.write_text("\n".join(f"linea_{i} = {i}" for i in range(120)), encoding="utf-8")
+
+    total = svc.process_document("course-1", "doc-1", str(path), "code", "script.py")
+
+    col = svc.vector_store.collection
+    assert total == len(col.rows) > 2
+    # Nunca se embebe ni se escribe más de un lote a la vez
+    assert all(len(b) <= 2 for b in svc.embedded_batches)
+    assert all(n <= 2 for n in col.calls)
+    # Índices de chunk continuos entre lotes
+    indexes = sorted(r["metadata"]["chunk_index"] for r in col.rows.values())
+    assert indexes == list(range(total))
+
+
+def test_3_tipo_no_soportado_retorna_cero(svc, tmp_path):
+    path = tmp_path / "video.mp4"
+    path.write_bytes(b"")
+    assert svc.process_document("course-1", "doc-1", str(path), "video", "video") == 0
+    assert svc.embedded_batches == []
+
+
+@pytest.fixture
+def chroma_svc(tmp_path):
+    """EmbeddingService con un ChromaDB real en disco temporal"""
+    from chromadb import PersistentClient
+
+    service = emb_module.EmbeddingService.__new__(emb_module.EmbeddingService)
+    service.vector_store = PersistentClient(path=str(tmp_path / "chroma"))
+    collection = service.vector_store.get_or_create_collection(
+        name=emb_module.get_course_collection_name("c-1")
+    )
+    for doc in ("d1", "d2", "d3"):
+        collection.add(
+            ids=[f"{doc}_chunk_{i}" for i in range(3)],
+            embeddings=[[float(i), 1.0] for i in range(3)],
+            documents=[f"{doc} texto {i}" for i in range(3)],
+            metadatas=[{"document_id": doc, "chunk_index": i} for i in range(3)],
+        )
+    return service, collection
+
+
+def test_4_borrar_documento_elimina_todos_sus_chunks(chroma_svc):
+    service, collection = chroma_svc
+    assert service.delete_document_chunks("c-1", "d2") == 3
+    remaining = {m["document_id"] for m in collection.get(include=["metadatas"])["metadatas"]}
+    assert remaining == {"d1", "d3"}
+    # Curso sin colección: no falla
+    assert service.delete_document_chunks("otro-curso", "d1") == 0
+
+
+def test_5_compactacion_purga_chunks_huerfanos(chroma_svc):
+    from app.workers import vector_compaction
+
+    service, collection = chroma_svc
+
+    class FakeDB:
+        def execute(self, sql, params):
+            assert params == {"cid": "c-1"}
+            return types.SimpleNamespace(fetchall=lambda: [types.SimpleNamespace(id="d1")])
+
+    dry = vector_compaction.compact(FakeDB(), service, ["c-1"], dry_run=True)
+    assert dry == {"c-1": {"d2": 3, "d3": 3}}
+    assert collection.count() == 9
+
+    vector_compaction.compact(FakeDB(), service, ["c-1"])
+    assert collection.count() == 3
+    assert service.find_orphan_chunks("c-1", {"d1"}) == {}
+
+
+def test_6_reemplazo_solo_embebe_chunks_nuevos_y_conserva_ids(svc, tmp_path):
+    path = tmp_path / "script.py"
+    lines = [f"linea_{i} = {i}" for i in range(120)]
+    path.write_text("\n".join(lines), encoding="utf-8")
+    config = emb_module.ChunkingConfig("tokens", max_tokens=60, overlap=0)
+
+    first = svc.sync_document("course-1", "doc-1", str(path), "code", "script.py", chunking=config)
+    col = svc.vector_store.collection
+    ids_before = set(col.rows)
+    embedded_before = sum(map(len, svc.embedded_batches))
+
+    # Nueva versión: un typo corregido al final del archivo
+    lines[-1] = "linea_119 = 1190"
+    path.write_text("\n".join(lines), encoding="utf-8")
+    second = svc.sync_document("course-1", "doc-1", str(path), "code", "script.py", chunking=config)
+
+    assert embedded_before == first["added"] == first["total"]
+    assert second["total"] == first["total"]
+    assert second["added"] == second["removed"] == 1
+    assert second["unchanged"] == first["total"] - 1
+    assert sum(map(len, svc.embedded_batches)) - embedded_before == 1
+    # Los IDs de los chunks sin cambios se conservan
+    assert len(ids_before & set(col.rows)) == first["total"] - 1
+    assert len(col.rows) == first["total"]
+
+
+def test_7_edicion_en_medio_del_codigo_solo_reembebe_chunks_vecinos(svc, tmp_path):
+    """Con cortes por contenido, insertar un carácter arriba no corre el resto del archivo"""
+    path = tmp_path / "script.py"
+    lines = []
+    for f in range(60):
+        lines.append(f"def funcion_{f}(a, b):")
+        lines.extend(f"    x_{i} = a * {f * 7 + i} + b  # paso {i}" for i in range(f % 9 + 3))
+        lines.extend(["    return x_0", ""])
+    path.write_text("\n".join(lines), encoding="utf-8")
+
+    first = svc.sync_document("course-1", "doc-1", str(path), "code", "script.py")
+    assert first["total"] > 10
+
+    lines[len(lines) // 3] += "1"
+    path.write_text("\n".join(lines), encoding="utf-8")
+    second = svc.sync_document("course-1", "doc-1", str(path), "code", "script.py")
+
+    assert second["added"] <= 2
+    assert second["unchanged"] >= first["total"] - 2
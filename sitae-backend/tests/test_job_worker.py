@@ -0,0 +1,222 @@
+# tests/test_job_worker.py
+import pytest
+
+import app.db.session as session_module
+import app.repositories.background_job_repository as repo_module
+import app.workers.handlers as handlers_module
+from app.workers import job_worker
+from app.workers.handlers import JobHandler
+
+# =========================
+#  Fakes
+# =========================
+
+class FakeSession:
+    def __init__(self):
+        self.commits = 0
+        self.rollbacks = 0
+        self.closed = False
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+class FakeRepo:
+    calls = []
+    owned = True  # el trabajo sigue siendo del worker
+
+    def __init__(self, db):
+        self.db = db
+
+    def heartbeat(self, job_ids, worker_id):
+        FakeRepo.calls.append(("heartbeat", list(job_ids), worker_id))
+        return len(job_ids) if FakeRepo.owned else 0
+
+    def complete(self, job_id, worker_id):
+        FakeRepo.calls.append(("complete", job_id))
+        return FakeRepo.owned
+
+    def fail(self, job_id, worker_id, error, retry_in_seconds):
+        FakeRepo.calls.append(("fail", job_id, error, retry_in_seconds))
+        return FakeRepo.owned
+
+
+@pytest.fixture
+def env(monkeypatch):
+    FakeRepo.calls = []
+    FakeRepo.owned = True
+    session = FakeSession()
+    failures = []
+
+    def boom(payload, db):
+        raise RuntimeError("proveedor caído")
+
+    def long_running(payload, db, heartbeat):
+        for _ in range(2):
+            heartbeat()  # como on_progress de ingest_document
+
+    handlers = {
+        "ok": JobHandler(run=lambda payload, db: None),
+        "long": JobHandler(
+            run=long_running,
+            on_failure=lambda payload, db, error, final: failures.append((payload, final)),
+            heartbeat=True,
+        ),
+        "boom": JobHandler(
+            run=boom,
+            on_failure=lambda payload, db, error, final: failures.append((payload, final)),
+        ),
+    }
+    monkeypatch.setattr(session_module, "SessionLocal", lambda: session)
+    monkeypatch.setattr(repo_module, "BackgroundJobRepository", FakeRepo)
+    monkeypatch.setattr(handlers_module, "HANDLERS", handlers)
+    monkeypatch.setattr(job_worker.settings, "JOB_RETRY_BACKOFF_SECONDS", 10.0)
+    return session, failures
+
+
+# =========================
+#  Tests
+# =========================
+
+def test_1_trabajo_exitoso_se_marca_completado(env):
+    session, _ = env
+    assert job_worker.execute_job("j1", "ok", {}, attempts=1, max_attempts=3, worker_id="w1") is True
+    assert FakeRepo.calls == [("complete", "j1")]
+    assert session.closed
+
+
+def test_2_fallo_se_reencola_con_backoff_y_luego_falla(env):
+    _, failures = env
+    payload = {"document_id": "d1"}
+
+    assert job_worker.execute_job("j1", "boom", payload, attempts=2, max_attempts=3, worker_id="w1") is False
+    kind, job_id, error, delay = FakeRepo.calls[-1]
+    assert (kind, job_id) == ("fail", "j1")
+    assert "proveedor caído" in error
+    assert 20.0 <= delay <= 25.0              # 10 * 2^(2-1) + jitter
+    assert failures[-1] == (payload, False)
+
+    job_worker.execute_job("j1", "boom", payload, attempts=3, max_attempts=3, worker_id="w1")
+    assert FakeRepo.calls[-1][3] is None      # sin más reintentos -> 'failed'
+    assert failures[-1] == (payload, True)
+
+
+def test_3_trabajo_con_proceso_caido_en_ultimo_intento_pasa_a_failed(env, monkeypatch):
+    """Un 'running' abandonado sin intentos restantes no se reintenta: 'failed' + on_failure"""
+    session, failures = env
+    payload = {"document_id": "d1"}
+
+    def fail_stale_exhausted(self, stale_after_seconds, error):
+        FakeRepo.calls.append(("fail_stale_exhausted", stale_after_seconds))
+        return [type("Job", (), {"id": "j1", "kind": "boom", "payload": payload, "attempts": 3, "max_attempts": 3})]
+
+    def claim(self, worker_id, limit, stale_after_seconds):
+        FakeRepo.calls.append(("claim", limit))
+        return []
+
+    monkeypatch.setattr(FakeRepo, "fail_stale_exhausted", fail_stale_exhausted, raising=False)
+    monkeypatch.setattr(FakeRepo, "claim", claim, raising=False)
+
+    worker = job_worker.JobWorker(processes=2, poll_interval=0.1)
+    assert worker._claim(2) == []
+    assert [c[0] for c in FakeRepo.calls] == ["fail_stale_exhausted", "claim"]
+    assert failures == [(payload, True)]
+    assert session.closed
+
+
+def test_4_heartbeat_renueva_el_lock_del_trabajo_en_curso(env):
+    _, failures = env
+
+    assert job_worker.execute_job("j1", "long", {}, attempts=1, max_attempts=3, worker_id="w1") is True
+    assert FakeRepo.calls == [("heartbeat", ["j1"], "w1"), ("heartbeat", ["j1"], "w1"), ("complete", "j1")]
+    assert failures == []
+
+
+def test_5_copia_que_perdio_el_lock_no_pisa_el_resultado(env):
+    """Otro worker retomó el trabajo: el heartbeat corta esta copia y su fallo no toca el estado"""
+    _, failures = env
+    FakeRepo.owned = False
+    payload = {"document_id": "d1"}
+
+    assert job_worker.execute_job("j1", "long", payload, attempts=3, max_attempts=3, worker_id="w1") is False
+    kind, job_id, error, _ = FakeRepo.calls[-1]
+    assert (kind, job_id) == ("fail", "j1")
+    assert "JobLockLost" in error
+    assert failures == []  # el documento queda a cargo de la copia vigente
+
+
+
+class FakeDocDB:
+    """Session mínima para ingest_document: un CourseDocument cuyo file_path cambia al 'reemplazarlo'"""
+
+    def __init__(self, doc):
+        self.doc = doc
+        self.current_path = doc.file_path  # lo que hay en la BD
+        self.commits = 0
+        self.rollbacks = 0
+
+    def get_bind(self):
+        return type("Bind", (), {"dialect": type("Dialect", (), {"name": "sqlite"})})
+
+    def query(self, model):
+        db = self
+
+        class Query:
+            def filter(self, *args):
+                return self
+
+            def first(self):
+                return db.doc
+
+        return Query()
+
+    def refresh(self, obj, attrs=None):
+        obj.file_path = self.current_path
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+def test_6_ingesta_de_version_reemplazada_no_pisa_la_nueva(monkeypatch):
+    """Si el documento se reemplaza a mitad de la ingesta, el trabajo viejo se detiene sin tocar estado"""
+    from types import SimpleNamespace
+    from app.services import embedding_service
+
+    doc = SimpleNamespace(id="d1", course_id="c1", title="Guía", document_type="pdf",
+                          file_path="/docs/d1_v1.pdf", status="queued", progress=0,
+                          error=None, chunk_count=0, processed_at=None)
+    db = FakeDocDB(doc)
+    batches = []
+
+    class FakeEmbeddingService:
+        def process_document(self, on_progress, **kwargs):
+            batches.append(kwargs["file_path"])
+            on_progress(10, 0.5)
+            db.current_path = "/docs/d1_v2.pdf"  # PUT /documents/d1 llega en medio
+            on_progress(20, 1.0)
+            return 20
+
+    monkeypatch.setattr(embedding_service, "EmbeddingService", FakeEmbeddingService)
+
+    handlers_module.ingest_document({"document_id": "d1", "file_path": "/docs/d1_v1.pdf"}, db, lambda: None)
+
+    assert batches == ["/docs/d1_v1.pdf"]
+    assert doc.status == "running" and doc.chunk_count == 10  # nunca 'completed' con la versión vieja
+    assert db.rollbacks == 1
+
+    # Su fallo (p.ej. el archivo viejo se borró) tampoco cambia el estado de la versión nueva
+    handlers_module.mark_document_failed({"document_id": "d1", "file_path": "/docs/d1_v1.pdf"}, db, "boom", True)
+    assert doc.status == "running" and doc.error is None
+
+    # Trabajo encolado antes de reemplazar: se omite sin procesar
+    handlers_module.ingest_document({"document_id": "d1", "file_path": "/docs/d1_v1.pdf"}, db, lambda: None)
+    assert batches == ["/docs/d1_v1.pdf"]
@@ -0,0 +1,78 @@
+# tests/test_llm_gateway.py
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from app.core.llm_gateway import LLMGateway, LLMUnavailableError
+
+
+class FlakyClient:
+    """Cliente fake (async): falla `failures` veces con `error` y luego responde"""
+
+    def __init__(self, failures: int, error=None):
+        self.failures = failures
+        self.error = error or (lambda: openai.APIConnectionError(
+            request=httpx.Request("POST", "http://fake/v1/chat/completions")
+        ))
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error()
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))])
+
+
+def make_gateway(client, **kw):
+    params = dict(api_key="sk-test", max_retries=2, failure_threshold=3, reset_seconds=60, backoff_base=0)
+    params.update(kw)
+    gateway = LLMGateway(**params)
+    gateway._new_async_client = lambda: client
+    return gateway
+
+
+@pytest.mark.asyncio
+async def test_1_reintenta_errores_transitorios():
+    client = FlakyClient(failures=2)
+    gw = make_gateway(client)
+
+    resp = await gw.chat(model="m", messages=[])
+
+    assert resp.choices[0].message.content == "ok"
+    assert client.calls == 3
+    assert gw.breaker.state == "closed"
+
+
+@pytest.mark.asyncio
+async def test_2_circuito_abierto_falla_sin_llamar_al_proveedor():
+    client = FlakyClient(failures=99)
+    gw = make_gateway(client, max_retries=0)
+
+    for _ in range(3):
+        with pytest.raises(openai.APIConnectionError):
+            await gw.chat(model="m", messages=[])
+    assert gw.breaker.state == "open"
+
+    with pytest.raises(LLMUnavailableError):
+        await gw.chat(model="m", messages=[])
+    assert client.calls == 3
+
+
+@pytest.mark.asyncio
+async def test_3_error_no_reintentable_en_half_open_no_bloquea_el_circuito():
+    """Un error que no es del proveedor durante la llamada de prueba no deja el circuito trabado"""
+    client = FlakyClient(failures=4, error=lambda: ValueError("payload inválido"))
+    gw = make_gateway(client, max_retries=0, failure_threshold=1, reset_seconds=0)
+    gw.breaker.record_failure()                 # abierto; con reset 0 pasa a half-open
+    assert gw.breaker.state == "half_open"
+
+    with pytest.raises(ValueError):
+        await gw.chat(model="m", messages=[])   # la llamada de prueba falla sin ser del proveedor
+    client.failures = 0
+    resp = await gw.chat(model="m", messages=[])
+
+    assert resp.choices[0].message.content == "ok"
+    assert gw.breaker.state == "closed"
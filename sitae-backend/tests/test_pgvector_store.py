@@ -0,0 +1,125 @@
+# tests/test_pgvector_store.py
+import json
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+from app.core.pgvector_store import PgVectorCollection, PgVectorStore, where_to_sql
+from app.workers.migrate_vector_store import migrate
+
+
+def test_1_filtros_estilo_chroma_se_traducen_a_sql():
+    params = {}
+    sql = where_to_sql({"document_id": {"$in": ["d1", "d2"]}, "document_type": "pdf"}, params)
+    assert sql == "c.document_id::text::text IN (:p0, :p1) AND (c.metadata ->> :k2)::text = :p3"
+    assert params == {"p0": "d1", "p1": "d2", "k2": "document_type", "p3": "pdf"}
+
+    params = {}
+    assert where_to_sql({"$or": [{"chunk_index": 0}, {"document_id": {"$in": []}}]}, params) \
+        == "(c.chunk_index::text = :p0 OR FALSE)"
+    assert where_to_sql(None, {}) == "TRUE"
+
+
+class FakeCollection:
+    def __init__(self, name, rows=None):
+        self.name = name
+        self.rows = rows or []     # (id, embedding, document, metadata)
+
+    def count(self):
+        return len(self.rows)
+
+    def get(self, include, limit, offset):
+        page = self.rows[offset:offset + limit]
+        return {
+            "ids": [r[0] for r in page],
+            "embeddings": [r[1] for r in page],
+            "documents": [r[2] for r in page],
+            "metadatas": [r[3] for r in page],
+        }
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        self.rows.extend(zip(ids, embeddings, documents, metadatas))
+
+
+class FakeStore:
+    def __init__(self, collections=()):
+        self.collections = {c.name: c for c in collections}
+
+    def list_collections(self):
+        return list(self.collections.values())
+
+    def get_collection(self, name):
+        return self.collections[name]
+
+    def get_or_create_collection(self, name):
+        return self.collections.setdefault(name, FakeCollection(name))
+
+
+def test_2_migracion_copia_por_paginas_y_omite_huerfanos():
+    rows = [(f"{d}_{i}", [float(i)], f"texto {i}", {"document_id": d}) for d in ("d1", "borrado") for i in range(5)]
+    source = FakeStore([FakeCollection("course_c1", rows)])
+    target = FakeStore()
+
+    report = migrate(source, target, valid_document_ids={"d1"}, batch_size=3)
+
+    assert report == {"course_c1": {"copied": 5, "skipped": 5}}
+    copied = target.get_collection("course_c1").rows
+    assert [r[0] for r in copied] == [f"d1_{i}" for i in range(5)]
+
+
+class FakeHnswEngine:
+    """
+    Emula un índice HNSW compartido por todas las colecciones: el escaneo
+    entrega ef_search candidatos globales y el filtro por colección va después.
+    Con iterative_scan sigue escaneando hasta juntar k o llegar a max_scan_tuples.
+    """
+
+    def __init__(self, rows, extversion):
+        self.rows = rows          # (id, collection, embedding 1-D)
+        self.extversion = extversion
+        self.settings = {}
+
+    @contextmanager
+    def begin(self):
+        self.settings = {}
+        yield self
+
+    def execute(self, sql, params=None):
+        sql = str(sql)
+        if "extversion" in sql:
+            return SimpleNamespace(scalar=lambda: self.extversion)
+        if sql.startswith("SET LOCAL"):
+            name, value = sql[len("SET LOCAL "):].split(" = ")
+            self.settings[name] = value
+            return None
+        q = json.loads(params["q"])[0]
+        ranked = sorted(self.rows, key=lambda r: abs(r[2] - q))
+        ef = int(self.settings["hnsw.ef_search"])
+        iterative = self.settings.get("hnsw.iterative_scan") == "relaxed_order"
+        limit = int(self.settings.get("hnsw.max_scan_tuples", ef)) if iterative else ef
+        found, scanned = [], 0
+        while scanned < min(limit, len(ranked)) and len(found) < params["k"]:
+            batch = ranked[scanned:scanned + ef]
+            scanned += len(batch)
+            found += [r for r in batch if r[1] == params["col"]]
+        return SimpleNamespace(fetchall=lambda: [
+            SimpleNamespace(id=r[0], content=r[0], metadata={}, distance=abs(r[2] - q))
+            for r in found[:params["k"]]
+        ])
+
+
+def test_3_coleccion_chica_en_tabla_grande_recibe_k_vecinos():
+    """Un curso con pocos chunks lejos de la consulta no queda vacío por el filtro posterior al índice"""
+    rows = [(f"grande_{i}", "course_grande", i * 0.001) for i in range(1000)]
+    rows += [(f"chico_{i}", "course_chico", 5.0 + i) for i in range(3)]
+
+    viejo = PgVectorStore(FakeHnswEngine(rows, "0.7.4"), dimensions=1)
+    sin_iterativo = PgVectorCollection(viejo, "course_chico").query([[0.0]], n_results=3)
+    assert sin_iterativo["ids"] == [[]]
+    assert "hnsw.iterative_scan" not in viejo.engine.settings  # en < 0.8 el SET fallaría
+
+    store = PgVectorStore(FakeHnswEngine(rows, "0.8.0"), dimensions=1)
+    result = PgVectorCollection(store, "course_chico").query([[0.0]], n_results=3)
+    assert result["ids"] == [["chico_0", "chico_1", "chico_2"]]
+    assert store.engine.settings["hnsw.iterative_scan"] == "relaxed_order"
+    assert int(store.engine.settings["hnsw.max_scan_tuples"]) >= 1000
+
@@ -0,0 +1,77 @@
+# tests/test_profile_snapshot_cache.py
+from types import SimpleNamespace
+
+from app.schemas import CompleteProfileRequest
+from app.services.profile_service import ProfileService, _snapshot_key, get_profile_snapshot_cache
+
+
+class CountingRepo:
+    def __init__(self, value):
+        self.value = value
+        self.calls = 0
+
+    def get_by_user_id(self, user_id):
+        self.calls += 1
+        return self.value
+
+    def get_by_user_and_course(self, user_id, course_id):
+        self.calls += 1
+        return self.value
+
+
+def make_service():
+    svc = ProfileService.__new__(ProfileService)
+    svc.db = SimpleNamespace(commit=lambda: None, rollback=lambda: None)
+    svc.learning_repo = CountingRepo(SimpleNamespace(
+        career="Ingeniería", job_role=None, preferred_modalities=["video"],
+        interests=None, interest_other=None, devices=None,
+    ))
+    svc.course_profile_repo = CountingRepo(SimpleNamespace(goals=["aprobar"], prereq_level="medio", weekly_time="h1_3"))
+    return svc
+
+
+def test_1_snapshot_evita_consultas_y_trae_contexto_renderizado():
+    get_profile_snapshot_cache().clear()
+    svc = make_service()
+
+    first = svc.get_complete_profile_for_agent("u1", "c1")
+    second = svc.get_complete_profile_for_agent("u1", "c1")
+
+    assert svc.learning_repo.calls == 1 and svc.course_profile_repo.calls == 1
+    assert second == first
+    assert "- Carrera: Ingeniería" in first["student_context"]
+    assert "- Nivel en el curso: intermedio" in first["student_context"]
+
+
+def test_2_invalidar_snapshot_vuelve_a_consultar():
+    get_profile_snapshot_cache().clear()
+    svc = make_service()
+    svc.get_complete_profile_for_agent("u1", "c1")
+
+    get_profile_snapshot_cache().delete(_snapshot_key("u1", "c1"))  # lo que hace save_complete_profile
+    svc.course_profile_repo.value.prereq_level = "avanzado"
+    again = svc.get_complete_profile_for_agent("u1", "c1")
+
+    assert svc.learning_repo.calls == 2
+    assert again["course_profile"]["prereq_level"] == "avanzado"
+
+
+def test_3_cambiar_perfil_de_aprendizaje_invalida_todos_los_cursos():
+    get_profile_snapshot_cache().clear()
+    svc = make_service()
+    svc.db.refresh = lambda obj: None
+    svc.course_profile_repo.user_is_enrolled = lambda user_id, course_id: True
+    svc.learning_repo.exists = lambda user_id: True
+    svc.learning_repo.update = lambda user_id, data: None
+    svc.get_complete_profile_for_agent("u1", "c1")
+    svc.get_complete_profile_for_agent("u1", "c2")
+    svc.get_complete_profile_for_agent("u2", "c1")
+
+    svc.save_complete_profile("u1", "c1", CompleteProfileRequest(career="Derecho"))
+    svc.learning_repo.value.career = "Derecho"
+    calls = svc.learning_repo.calls
+    other = svc.get_complete_profile_for_agent("u1", "c2")
+    svc.get_complete_profile_for_agent("u2", "c1")
+
+    assert "- Carrera: Derecho" in other["student_context"]
+    assert svc.learning_repo.calls == calls + 1  # u2 sigue en caché
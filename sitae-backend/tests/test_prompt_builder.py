@@ -0,0 +1,59 @@
+# tests/test_prompt_builder.py
+from app.services.prompt_builder import PromptBudget, PromptBuilder
+
+
+def count_words(text: str) -> int:
+    return len(text.split())
+
+
+def make_builder(**budget):
+    return PromptBuilder(count_words, PromptBudget(**budget))
+
+
+def test_1_descarta_chunks_menos_relevantes_y_trunca_el_borde():
+    b = make_builder(context=150)
+    chunks = [" ".join(["a"] * 80), " ".join(["b"] * 100), " ".join(["c"] * 10)]
+
+    kept = b.fit_chunks(chunks, 150)
+
+    assert len(kept) == 2
+    assert kept[0] == chunks[0]
+    assert kept[1].startswith("b") and kept[1].endswith("[...]")
+    assert sum(count_words(c) for c in kept) <= 150
+
+
+def test_2_historial_conserva_turnos_recientes_completos():
+    b = make_builder()
+    history = []
+    for i in range(3):
+        history += [
+            {"role": "user", "content": f"pregunta {i} " + "x " * 20},
+            {"role": "assistant", "content": f"respuesta {i} " + "y " * 20},
+        ]
+
+    kept = b.fit_history(history, 100)
+
+    assert [m["role"] for m in kept] == ["user", "assistant", "user", "assistant"]
+    assert kept[0]["content"].startswith("pregunta 1")
+
+
+def test_3_breakdown_respeta_presupuestos():
+    b = make_builder(profile=5, weak_areas=6, context=1000, history=1000)
+    weak = "Dificultades:\n- [OT1] listas (4 fallos)\n- [OT2] tuplas (2 fallos)"
+
+    sections = b.build("Perfil: " + "z " * 50, weak, ["chunk uno"], [])
+
+    assert sections.breakdown["profile"] <= 5
+    assert sections.weak_areas == "Dificultades:\n- [OT1] listas (4 fallos)"
+    assert sections.breakdown["context"] == 2
+    assert sections.dropped == {"chunks": 0, "history_messages": 0}
+
+
+def test_4_nombre_del_curso_se_trunca_al_presupuesto():
+    b = make_builder(course_name=5)
+
+    sections = b.build("", "", [], [], course_name="Curso " + "muy " * 40 + "largo")
+
+    assert count_words(sections.course_name) <= 5
+    assert sections.course_name.startswith("Curso muy")
+    assert b.build("", "", [], [], course_name="Python").course_name == "Python"
@@ -0,0 +1,43 @@
+# tests/test_weak_area_repository.py
+from types import SimpleNamespace
+
+from app.repositories.weak_area_repository import WeakAreaRepository
+
+
+class RecordingDB:
+    """Registra (sql, params) y responde la consulta del dueño del intento"""
+
+    def __init__(self, owner=None):
+        self.owner = owner
+        self.statements = []
+
+    def execute(self, sql_text_obj, params=None):
+        sql = " ".join(str(sql_text_obj).split())
+        self.statements.append((sql, params or {}))
+        rows = [self.owner] if self.owner and "WHERE aq.id = :attempt_id" in sql else []
+        return SimpleNamespace(fetchone=lambda: rows[0] if rows else None, rowcount=len(rows))
+
+
+def test_1_refresh_for_attempt_solo_recalcula_estudiante_y_curso_del_intento():
+    db = RecordingDB(owner=SimpleNamespace(user_id="u-1", course_id="c-1"))
+
+    WeakAreaRepository(db).refresh_for_attempt("att-1", window=5)
+
+    owner_sql, lock, delete, insert = db.statements
+    assert owner_sql[1] == {"attempt_id": "att-1"}
+    assert "pg_advisory_xact_lock" in lock[0]
+    assert lock[1] == {"lock_key": "weak_areas:u-1:c-1"}
+    assert "WHERE s.user_id = :user_id AND s.course_id = :course_id" in delete[0]
+    assert "ranked.user_id = :user_id AND ranked.course_id = :course_id" in insert[0]
+    assert delete[1] == insert[1] == {"user_id": "u-1", "course_id": "c-1", "window": 5}
+    # Un recálculo concurrente del mismo par no rompe por la PK
+    assert "ON CONFLICT (user_id, course_id, topic_objective_id) DO UPDATE" in insert[0]
+
+
+def test_2_refresh_for_attempt_inexistente_no_toca_la_proyeccion():
+    db = RecordingDB(owner=None)
+
+    WeakAreaRepository(db).refresh_for_attempt("att-x")
+
+    assert len(db.statements) == 1
+    assert not any("user_topic_objective_stats" in sql for sql, _ in db.statements)